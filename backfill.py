@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Массовая загрузка истории свечей в кэш
+
+Загружает много тикеров за длинный период пулом воркеров через MoexClient и путь записи
+DataService (страницы ISS сразу пишутся в кэш, покрытые периоды не загружаются повторно).
+Загруженные тикеры отмечаются в таблице backfill_progress, поэтому прерванный запуск
+с тем же именем задачи продолжается с необработанных тикеров.
+
+Примеры:
+    python backfill.py --board TQBR --start 2010-01-01 --workers 8
+    python backfill.py --tickers SBER,GAZP --start 2014-01-01 --end 2024-12-31 --interval 1h
+    python backfill.py --tickers SBER --start 2020-01-01 --iss-url http://127.0.0.1:8081/iss
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from datetime import date, timedelta
+from typing import List, Optional, Set
+
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения до импорта модулей, читающих настройки
+load_dotenv()
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from database.database import AsyncSessionLocal, engine
+from database_manager import DatabaseManager
+from engine.data_service import DataService
+from engine.locks import FETCH_LOCKS, AdvisoryLocks
+from engine.moex_client import MoexClient
+from engine.rate_limit import TokenBucket, default_rate_limiter
+from models.backfill_progress import BackfillProgress
+from models.candle import CandleInterval
+
+# Как часто печатать прогресс, секунды
+REPORT_EVERY_SECONDS = 5.0
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Массовая загрузка истории свечей MOEX в кэш")
+    parser.add_argument("--tickers", default="", help="Тикеры через запятую")
+    parser.add_argument("--board", default="", help="Загрузить все бумаги режима торгов (например, TQBR)")
+    parser.add_argument("--start", required=True, type=date.fromisoformat, help="Дата начала (YYYY-MM-DD)")
+    parser.add_argument(
+        "--end", type=date.fromisoformat, default=date.today() - timedelta(days=1),
+        help="Дата окончания (YYYY-MM-DD), по умолчанию вчера"
+    )
+    parser.add_argument(
+        "--interval", type=CandleInterval, default=CandleInterval.DAY_1,
+        choices=list(CandleInterval), help="Интервал свечей"
+    )
+    parser.add_argument("--workers", type=int, default=8, help="Число тикеров, загружаемых одновременно")
+    parser.add_argument("--job", default="", help="Имя задачи для контрольных точек (по умолчанию из интервала и периода)")
+    parser.add_argument("--restart", action="store_true", help="Забыть контрольные точки задачи и начать заново")
+    parser.add_argument("--iss-url", default=None, help="Адрес ISS API (например, локальной заглушки)")
+    parser.add_argument(
+        "--rate-limit", type=float, default=None,
+        help="Запросов к ISS в секунду (по умолчанию MOEX_RATE_LIMIT, 0 - без ограничения)"
+    )
+    args = parser.parse_args(argv)
+    
+    if not args.tickers and not args.board:
+        parser.error("нужно указать --tickers и/или --board")
+    if args.end < args.start:
+        parser.error("дата окончания раньше даты начала")
+    args.job = args.job or f"{args.interval.value}:{args.start}:{args.end}"
+    return args
+
+class Progress:
+    """Счетчики прогресса и оценка оставшегося времени"""
+    
+    def __init__(self, data_service: DataService, total: int, skipped: int):
+        self.data_service = data_service
+        self.total = total
+        self.done = skipped
+        self.skipped = skipped
+        self.errors = 0
+        self.started_at = time.monotonic()
+        self.rows_at_start = data_service.cache_stats['rows_written']
+    
+    @property
+    def rows(self) -> int:
+        return self.data_service.cache_stats['rows_written'] - self.rows_at_start
+    
+    def report(self) -> str:
+        elapsed = time.monotonic() - self.started_at
+        processed = self.done - self.skipped
+        remaining = self.total - self.done
+        eta = elapsed / processed * remaining if processed else None
+        eta_text = time.strftime('%H:%M:%S', time.gmtime(eta)) if eta is not None else '--:--:--'
+        return (
+            f"[{self.done}/{self.total} тикеров] {self.rows} строк, "
+            f"{self.rows / elapsed if elapsed else 0:.0f} строк/с, ошибок {self.errors}, ETA {eta_text}"
+        )
+
+async def resolve_tickers(moex_client: MoexClient, tickers: str, board: str) -> List[str]:
+    result = {ticker.strip().upper() for ticker in tickers.split(',') if ticker.strip()}
+    if board:
+        result.update(await moex_client.get_board_securities(board))
+    return sorted(result)
+
+async def load_completed(job: str) -> Set[str]:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(BackfillProgress.ticker).where(BackfillProgress.job == job))
+        return set(result.scalars())
+
+async def mark_completed(job: str, ticker: str) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(BackfillProgress).values(job=job, ticker=ticker).on_conflict_do_nothing())
+        await db.commit()
+
+async def reset_job(job: str) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(BackfillProgress.__table__.delete().where(BackfillProgress.job == job))
+        await db.commit()
+
+async def worker(
+    queue: "asyncio.Queue[str]", data_service: DataService, args: argparse.Namespace, progress: Progress
+) -> None:
+    while True:
+        ticker = await queue.get()
+        try:
+            await data_service.fill_cache(ticker, args.start, args.end, args.interval)
+            await mark_completed(args.job, ticker)
+        except Exception as e:
+            # Тикер не отмечен загруженным и будет загружен при следующем запуске
+            progress.errors += 1
+            print(f"Ошибка загрузки {ticker}: {e}", file=sys.stderr)
+        finally:
+            progress.done += 1
+            queue.task_done()
+
+async def reporter(progress: Progress) -> None:
+    while True:
+        await asyncio.sleep(REPORT_EVERY_SECONDS)
+        print(progress.report())
+
+async def backfill(args: argparse.Namespace) -> int:
+    """Выполняет загрузку и возвращает код завершения (1, если были ошибки)"""
+    await DatabaseManager().create_tables()
+    if args.restart:
+        await reset_job(args.job)
+    
+    if args.rate_limit is None:
+        rate_limiter = default_rate_limiter()
+    else:
+        rate_limiter = TokenBucket(args.rate_limit) if args.rate_limit > 0 else None
+    
+    # Блокировки не дают параллельным запускам и приложению загружать одни и те же тикеры
+    locks = AdvisoryLocks(engine) if FETCH_LOCKS else None
+    try:
+        async with MoexClient(args.iss_url, rate_limiter=rate_limiter) as moex_client:
+            data_service = DataService(AsyncSessionLocal, moex_client=moex_client, locks=locks)
+            tickers = await resolve_tickers(moex_client, args.tickers, args.board)
+            completed = await load_completed(args.job)
+            pending = [ticker for ticker in tickers if ticker not in completed]
+            
+            print(
+                f"Задача '{args.job}': {len(tickers)} тикеров, {len(tickers) - len(pending)} уже загружено, "
+                f"период {args.start} - {args.end}, интервал {args.interval.value}, воркеров {args.workers}"
+            )
+            progress = Progress(data_service, total=len(tickers), skipped=len(tickers) - len(pending))
+            
+            queue: "asyncio.Queue[str]" = asyncio.Queue()
+            for ticker in pending:
+                queue.put_nowait(ticker)
+            
+            tasks = [asyncio.create_task(worker(queue, data_service, args, progress)) for _ in range(args.workers)]
+            report_task = asyncio.create_task(reporter(progress))
+            try:
+                await queue.join()
+            finally:
+                for task in (*tasks, report_task):
+                    task.cancel()
+                await asyncio.gather(*tasks, report_task, return_exceptions=True)
+            
+            print(f"Готово. {progress.report()}")
+            return 1 if progress.errors else 0
+    finally:
+        if locks is not None:
+            await locks.close()
+
+def main() -> None:
+    args = parse_args()
+    
+    async def run() -> int:
+        try:
+            return await backfill(args)
+        finally:
+            await engine.dispose()
+    
+    try:
+        sys.exit(asyncio.run(run()))
+    except KeyboardInterrupt:
+        print("Прервано, загруженные тикеры сохранены - повторный запуск продолжит задачу")
+        sys.exit(130)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк чтения кэша по многим тикерам: запрос на каждый тикер против одного запроса на все
+
+Для 10, 100 и 1000 тикеров с дневными свечами в кэше (PostgreSQL из DATABASE_URL) сравнивает
+прежнее чтение (get_cached_data и get_covered_intervals в отдельной сессии на каждый тикер,
+не более MAX_CONCURRENT_TICKERS одновременно) с get_cached_data_many и get_covered_intervals_many,
+а также полный запрос DataService.get_stock_series при пустом кэше в памяти.
+Период полностью покрыт, поэтому запросов к MOEX нет. Тестовые тикеры удаляются после прогона.
+
+Запуск: python -m benchmarks.bench_batch_read [--years 1] [--repeat 5]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import date, timedelta
+from typing import Dict, List
+
+from sqlalchemy import delete
+
+from database.database import AsyncSessionLocal
+from database_manager import DatabaseManager
+from engine.data_service import DataService
+from engine.moex_client import MoexClient
+from engine.series import CandleSeries
+from models.candle import Candle, CandleInterval
+from models.stock_coverage import StockCoverage
+
+TICKER_PREFIX = "BATCH"
+TICKER_COUNTS = (10, 100, 1000)
+END_DATE = date(2024, 12, 31)
+
+
+def bench_tickers(count: int) -> List[str]:
+    return [f"{TICKER_PREFIX}{index:04d}" for index in range(count)]
+
+
+async def clear_cache() -> None:
+    async with AsyncSessionLocal() as db:
+        for model in (Candle, StockCoverage):
+            await db.execute(delete(model).where(model.ticker.like(f"{TICKER_PREFIX}%")))
+        await db.commit()
+
+
+async def fill_cache(service: DataService, tickers: List[str], start_date: date) -> None:
+    """Дневные свечи по будним дням и покрытие всего периода для каждого тикера"""
+    days = [
+        start_date + timedelta(days=offset)
+        for offset in range((END_DATE - start_date).days + 1)
+        if (start_date + timedelta(days=offset)).weekday() < 5
+    ]
+    for offset in range(0, len(tickers), 50):
+        chunk = tickers[offset:offset + 50]
+        data = {
+            ticker: CandleSeries.from_closes((day, 100.0 + index + position * 0.01) for position, day in enumerate(days))
+            for index, ticker in enumerate(chunk)
+        }
+        async with AsyncSessionLocal() as db:
+            await service.save_batch_to_cache(db, data)
+            db.add_all(
+                StockCoverage(
+                    ticker=ticker, interval=CandleInterval.DAY_1.iss_code, start_date=start_date, end_date=END_DATE
+                )
+                for ticker in chunk
+            )
+            await db.commit()
+
+
+async def per_ticker_read(service: DataService, tickers: List[str], start_date: date) -> Dict[str, CandleSeries]:
+    """Прежнее чтение: два запроса в отдельной сессии на каждый тикер"""
+    semaphore = asyncio.Semaphore(service.max_concurrency)
+
+    async def read(ticker: str) -> CandleSeries:
+        async with semaphore:
+            async with AsyncSessionLocal() as db:
+                data = await service.get_cached_data(db, ticker, start_date, END_DATE)
+                await service.get_covered_intervals(db, ticker, start_date, END_DATE)
+                return data
+
+    return dict(zip(tickers, await asyncio.gather(*(read(ticker) for ticker in tickers))))
+
+
+async def batched_read(service: DataService, tickers: List[str], start_date: date) -> Dict[str, CandleSeries]:
+    """Чтение всех тикеров двумя запросами в одной сессии"""
+    async with AsyncSessionLocal() as db:
+        data = await service.get_cached_data_many(db, tickers, start_date, END_DATE)
+        await service.get_covered_intervals_many(db, tickers, start_date, END_DATE)
+        return data
+
+
+async def measure(repeat: int, run) -> float:
+    samples = []
+    result = None
+    for index in range(repeat + 1):
+        started = time.perf_counter()
+        result = await run()
+        if index:
+            samples.append(time.perf_counter() - started)
+    return statistics.median(samples), result
+
+
+async def main(args: argparse.Namespace) -> None:
+    await DatabaseManager().create_tables()
+    start_date = END_DATE - timedelta(days=args.years * 365 - 1)
+    moex_client = MoexClient()
+    service = DataService(AsyncSessionLocal, moex_client=moex_client)
+    try:
+        await clear_cache()
+        await fill_cache(service, bench_tickers(max(TICKER_COUNTS)), start_date)
+
+        for count in TICKER_COUNTS:
+            tickers = bench_tickers(count)
+            per_ticker, expected = await measure(args.repeat, lambda: per_ticker_read(service, tickers, start_date))
+            batched, result = await measure(args.repeat, lambda: batched_read(service, tickers, start_date))
+            assert result == expected, "Пакетное чтение вернуло другие данные"
+
+            async def full_request():
+                # Новый сервис - пустой кэш в памяти, данные читаются из PostgreSQL
+                fresh = DataService(AsyncSessionLocal, moex_client=moex_client)
+                series = await fresh.get_stock_series(tickers, start_date, END_DATE)
+                assert fresh.cache_stats['upstream_calls'] == 0, "Запрос обратился к MOEX"
+                return series
+
+            full, _ = await measure(args.repeat, full_request)
+            rows = sum(len(series) for series in result.values())
+            print(
+                f"{count:>5} тикеров ({rows:>7} свечей): по тикеру {per_ticker * 1000:8.1f} мс "
+                f"({2 * count} запросов), одним запросом {batched * 1000:8.1f} мс (2 запроса, "
+                f"x{per_ticker / batched:.1f}), get_stock_series {full * 1000:8.1f} мс"
+            )
+    finally:
+        await clear_cache()
+        await moex_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Чтение кэша по многим тикерам")
+    parser.add_argument("--years", type=int, default=1, help="Длина периода в годах")
+    parser.add_argument("--repeat", type=int, default=5, help="Замеров на каждый способ")
+    asyncio.run(main(parser.parse_args()))
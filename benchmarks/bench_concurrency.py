@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк параллельной обработки тикеров в DataService.get_stock_data
+
+Запросы идут в локальную заглушку ISS с разной задержкой для каждого тикера,
+кэш в PostgreSQL (DATABASE_URL) очищается перед каждым прогоном.
+Время выполнения должно определяться самым медленным тикером, а не суммой задержек.
+
+Запуск: python -m benchmarks.bench_concurrency
+"""
+
+import asyncio
+import time
+from datetime import date
+
+from sqlalchemy import delete
+
+from benchmarks.fake_iss import FakeIssServer
+from database.database import AsyncSessionLocal
+from database_manager import DatabaseManager
+from engine.data_service import DataService
+from engine.moex_client import MoexClient
+from models.candle import Candle
+from models.stock_coverage import StockCoverage
+
+TICKERS = [f"BENCH{i:02d}" for i in range(10)]
+LATENCIES = {ticker: 0.05 * (i + 1) for i, ticker in enumerate(TICKERS)}
+START_DATE = date(2024, 1, 1)
+END_DATE = date(2024, 3, 31)
+
+
+async def clear_cache() -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(Candle).where(Candle.ticker.in_(TICKERS)))
+        await db.execute(delete(StockCoverage).where(StockCoverage.ticker.in_(TICKERS)))
+        await db.commit()
+
+
+async def run_once(moex_client: MoexClient, max_concurrency: int) -> float:
+    await clear_cache()
+    service = DataService(AsyncSessionLocal, moex_client=moex_client, max_concurrency=max_concurrency)
+
+    started = time.perf_counter()
+    result = await service.get_stock_data(TICKERS, START_DATE, END_DATE)
+    elapsed = time.perf_counter() - started
+
+    assert all(result[ticker] for ticker in TICKERS), "Не все тикеры получили данные"
+    return elapsed
+
+
+async def main() -> None:
+    await DatabaseManager().create_tables()
+    server = FakeIssServer(ticker_latency=LATENCIES)
+    base_url = await server.start()
+    moex_client = MoexClient(base_url=base_url)
+    try:
+        print(f"Тикеров: {len(TICKERS)}")
+        print(f"Сумма задержек ISS: {sum(LATENCIES.values()):.2f} с")
+        print(f"Максимальная задержка ISS: {max(LATENCIES.values()):.2f} с")
+        for max_concurrency in (1, 5, len(TICKERS)):
+            elapsed = await run_once(moex_client, max_concurrency)
+            print(f"max_concurrency={max_concurrency:>2}: {elapsed:.2f} с")
+    finally:
+        await moex_client.close()
+        await server.stop()
+        await clear_cache()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
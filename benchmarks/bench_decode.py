@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк разбора ответа ISS: json + strptime на каждую строку против колоночного декодирования
+
+Для ответов в несколько тысяч свечей (дневные за 20 лет, минутные за две недели) сравнивает
+прежний путь (json.loads, datetime.strptime и CandleSeries.from_rows по строкам) с
+engine.iss_decode.decode_candles для каждого установленного JSON парсера (json, orjson, msgspec).
+Проверяет, что все пути строят одинаковый ряд.
+
+Запуск: python -m benchmarks.bench_decode
+"""
+
+import importlib
+import json
+import time
+from datetime import date, datetime
+
+from benchmarks.fake_iss import CANDLE_COLUMNS, make_candles
+from engine.iss_decode import decode_candles
+from engine.series import CandleSeries
+
+PAYLOADS = {
+    'дневные, 20 лет': ('SBER', date(2005, 1, 1), date(2024, 12, 31), 24),
+    'минутные, 2 недели': ('SBER', date(2024, 3, 4), date(2024, 3, 15), 1),
+}
+REPEAT = 5
+
+
+def json_backends():
+    backends = {'json': json.loads}
+    try:
+        backends['orjson'] = importlib.import_module('orjson').loads
+    except ImportError:
+        pass
+    try:
+        backends['msgspec'] = importlib.import_module('msgspec').json.decode
+    except ImportError:
+        pass
+    return backends
+
+
+def make_body(ticker: str, start_date: date, end_date: date, interval: int) -> bytes:
+    rows = make_candles(ticker, start_date, end_date, interval)
+    return json.dumps({'candles': {'columns': CANDLE_COLUMNS, 'data': rows}}).encode()
+
+
+def rows_path(body: bytes) -> CandleSeries:
+    # Разбор до колоночного декодирования: позиции колонок зашиты, время через strptime
+    candles = json.loads(body)['candles']['data']
+    return CandleSeries.from_rows(
+        (
+            datetime.strptime(candle[6], '%Y-%m-%d %H:%M:%S'),
+            candle[0], candle[2], candle[3], candle[1], candle[5], candle[4]
+        )
+        for candle in candles
+    )
+
+
+def columnar_path(loads):
+    def decode(body: bytes) -> CandleSeries:
+        block = loads(body)['candles']
+        return decode_candles(block['columns'], block['data'])
+    return decode
+
+
+def measure(decode, body: bytes):
+    best = float('inf')
+    result = None
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        result = decode(body)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main() -> None:
+    backends = json_backends()
+    for title, params in PAYLOADS.items():
+        body = make_body(*params)
+        baseline_time, expected = measure(rows_path, body)
+        print(f"{title}: {len(expected)} свечей, {len(body) / 1024:.0f} КБ")
+        print(f"  json + strptime (по строкам): {baseline_time * 1000:8.2f} мс")
+        for name, loads in backends.items():
+            elapsed, series = measure(columnar_path(loads), body)
+            assert series == expected, f"{name}: ряд отличается от построчного разбора"
+            print(
+                f"  {name + ' + decode_candles:':29} {elapsed * 1000:8.2f} мс "
+                f"(x{baseline_time / elapsed:.1f}, {len(series) / elapsed:,.0f} свечей/с)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк форматов ответа: JSON против Arrow IPC и Parquet
+
+Для нескольких тикеров за многолетний период сравнивает размер ответа, время кодирования
+на сервере и время разбора клиентом до колонок (даты и цены по тикеру).
+JSON кодируется так же, как в /fetch-stock-data: словарь {ticker: {date: price}} в ApiResponse.
+
+Требует pyarrow. Запуск: python -m benchmarks.bench_formats
+"""
+
+import io
+import json
+import time
+from datetime import date, timedelta
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from engine.columnar import to_arrow_ipc, to_parquet
+from engine.series import CandleSeries
+from models.pydantic_models import ApiResponse
+
+TICKERS = 10
+DAYS = 365 * 10
+START_DATE = date(2014, 1, 1)
+
+
+def make_data(ohlcv: bool):
+    data = {}
+    for t in range(TICKERS):
+        rows = [
+            (
+                START_DATE + timedelta(days=i),
+                100.0 + t + i * 0.01
+            )
+            for i in range(DAYS)
+            if (START_DATE + timedelta(days=i)).weekday() < 5
+        ]
+        series = CandleSeries.from_closes(rows)
+        if ohlcv:
+            for column in (series.open, series.high, series.low, series.volume, series.value):
+                column[:] = series.close
+        data[f"T{t:03d}"] = series
+    return data
+
+
+def encode_json(data, ohlcv: bool) -> bytes:
+    payload = {
+        ticker: series.to_ohlcv_dict() if ohlcv else series.to_dict()
+        for ticker, series in data.items()
+    }
+    return ApiResponse(success=True, data=payload).model_dump_json().encode()
+
+
+def decode_json(body: bytes, ohlcv: bool):
+    columns = {}
+    for ticker, points in json.loads(body)['data'].items():
+        dates = [date.fromisoformat(key) for key in points]
+        if ohlcv:
+            closes = [point['close'] for point in points.values()]
+        else:
+            closes = list(points.values())
+        columns[ticker] = (dates, closes)
+    return columns
+
+
+def decode_arrow(body: bytes, ohlcv: bool):
+    return pa.ipc.open_stream(body).read_all()
+
+
+def decode_parquet(body: bytes, ohlcv: bool):
+    return pq.read_table(io.BytesIO(body))
+
+
+def measure(func, *args, repeat: int = 3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def main() -> None:
+    formats = [
+        ("JSON", encode_json, decode_json),
+        ("Arrow IPC", to_arrow_ipc, decode_arrow),
+        ("Parquet", to_parquet, decode_parquet),
+    ]
+    for ohlcv in (False, True):
+        data = make_data(ohlcv)
+        points = sum(len(series) for series in data.values())
+        print(f"{'OHLCV' if ohlcv else 'Цены закрытия'}: {points} точек ({TICKERS} тикеров)")
+        for name, encode, decode in formats:
+            body, encode_time = measure(lambda: encode(data, ohlcv=ohlcv))
+            _, decode_time = measure(decode, body, ohlcv)
+            print(
+                f"  {name:<10} {len(body) / 1024:>9.1f} КБ, "
+                f"кодирование {encode_time * 1000:>7.1f} мс, разбор {decode_time * 1000:>7.1f} мс"
+            )
+
+
+if __name__ == "__main__":
+    main()
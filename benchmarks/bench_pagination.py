@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк постраничной и параллельной загрузки длинных периодов в MoexClient
+
+Загружает многолетний период из локальной заглушки ISS с задержкой ответа,
+проверяет, что получены все торговые дни без пропусков и повторов,
+и сравнивает время загрузки при разном размере частей.
+
+Запуск: python -m benchmarks.bench_pagination
+"""
+
+import asyncio
+import time
+from datetime import date, timedelta
+
+from benchmarks.fake_iss import FakeIssServer
+from engine import moex_client
+from engine.moex_client import MoexClient
+
+TICKER = "PAGED"
+START_DATE = date(2010, 1, 1)
+END_DATE = date(2024, 12, 31)
+LATENCY = 0.05
+
+
+def expected_dates():
+    current_date = START_DATE
+    while current_date <= END_DATE:
+        if current_date.weekday() < 5:
+            yield current_date
+        current_date += timedelta(days=1)
+
+
+async def main() -> None:
+    server = FakeIssServer(latency=LATENCY)
+    base_url = await server.start()
+    expected = list(expected_dates())
+    print(f"Период {START_DATE} - {END_DATE}: {len(expected)} торговых дней")
+    try:
+        # Большой размер части - одна часть на весь период, только постраничная загрузка
+        for chunk_days in (100000, 365, 90):
+            moex_client.MOEX_CHUNK_DAYS = chunk_days
+            server.request_count = 0
+            async with MoexClient(base_url=base_url) as client:
+                started = time.perf_counter()
+                data = await client.get_stock_data(TICKER, START_DATE, END_DATE)
+                elapsed = time.perf_counter() - started
+
+            assert data.dates() == expected, "Данные неполные или не упорядочены"
+            print(
+                f"chunk_days={chunk_days:>6}: {server.request_count:>3} запросов, {elapsed:.2f} с, "
+                f"{len(data) / elapsed:.0f} свечей/с"
+            )
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
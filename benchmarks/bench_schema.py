@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк схемы кэша: задержка чтения периода тикера на таблице в десятки миллионов строк
+
+Сравнивает раскладки хранения на одинаковых данных (дневные свечи, строки разных тикеров
+перемешаны по дням, как при ежедневной дозагрузке):
+- legacy: прежняя stock_data - суррогатный id, три индекса, created_at/updated_at, чтение строк целиком;
+- candles_key: candles с первичным ключом (ticker, interval, ts) без INCLUDE - index scan и чтение кучи;
+- candles_covering: первичный ключ с INCLUDE (open, high, low, close, volume, value) - index-only scan;
+- candles_partitioned: то же с разделами по годам.
+
+Для каждой раскладки печатает размер таблицы с индексами, медиану и p95 времени чтения
+периодов 1 и 10 лет по случайным тикерам и число блоков, прочитанных одним запросом (EXPLAIN BUFFERS).
+Таблицы создаются в схеме bench_schema и удаляются после прогона (кроме --keep).
+
+Запуск: python -m benchmarks.bench_schema [--rows 20000000] [--queries 200] [--keep]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+from database.database import engine
+
+SCHEMA = "bench_schema"
+START_DATE = date(2005, 1, 3)
+YEARS = 20
+# Торговых дней в году (свечи только по будним дням)
+DAYS_PER_YEAR = 261
+PAYLOAD = "open, high, low, close, volume, value"
+
+CANDLE_COLUMNS = """
+    ticker VARCHAR(20) NOT NULL,
+    interval SMALLINT NOT NULL,
+    ts TIMESTAMP NOT NULL,
+    open FLOAT,
+    high FLOAT,
+    low FLOAT,
+    close FLOAT NOT NULL,
+    volume BIGINT,
+    value FLOAT
+"""
+
+LAYOUTS = {
+    'legacy': [
+        f"""CREATE TABLE {SCHEMA}.legacy (
+            id SERIAL PRIMARY KEY,
+            ticker VARCHAR(20) NOT NULL,
+            date DATE NOT NULL,
+            price FLOAT NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            updated_at TIMESTAMP WITH TIME ZONE
+        )""",
+        f"CREATE INDEX ON {SCHEMA}.legacy (id)",
+        f"CREATE INDEX ON {SCHEMA}.legacy (ticker)",
+        f"CREATE UNIQUE INDEX ON {SCHEMA}.legacy (ticker, date)",
+    ],
+    'candles_key': [
+        f"CREATE TABLE {SCHEMA}.candles_key ({CANDLE_COLUMNS}, PRIMARY KEY (ticker, interval, ts))",
+    ],
+    'candles_covering': [
+        f"CREATE TABLE {SCHEMA}.candles_covering ({CANDLE_COLUMNS}, "
+        f"PRIMARY KEY (ticker, interval, ts) INCLUDE ({PAYLOAD}))",
+    ],
+    'candles_partitioned': [
+        f"CREATE TABLE {SCHEMA}.candles_partitioned ({CANDLE_COLUMNS}, "
+        f"PRIMARY KEY (ticker, interval, ts) INCLUDE ({PAYLOAD})) PARTITION BY RANGE (ts)",
+        *(
+            f"CREATE TABLE {SCHEMA}.candles_partitioned_y{year} PARTITION OF {SCHEMA}.candles_partitioned "
+            f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+            for year in range(START_DATE.year, START_DATE.year + YEARS + 1)
+        ),
+    ],
+}
+
+# Чтение периода тикера так, как его читает приложение
+READ_QUERIES = {
+    'legacy': f"SELECT * FROM {SCHEMA}.legacy WHERE ticker = :ticker AND date >= :start AND date < :end ORDER BY date",
+    **{
+        layout: f"SELECT ts, {PAYLOAD} FROM {SCHEMA}.{layout} "
+                f"WHERE ticker = :ticker AND interval = 24 AND ts >= :start AND ts < :end ORDER BY ts"
+        for layout in ('candles_key', 'candles_covering', 'candles_partitioned')
+    },
+}
+
+FILL_QUERIES = {
+    'legacy': f"""
+        INSERT INTO {SCHEMA}.legacy (ticker, date, price)
+        SELECT 'T' || lpad(k::text, 5, '0'), d::date, 100 + k % 500 + (d::date - DATE '2005-01-01') * 0.01
+        FROM generate_series(:start, :end, interval '1 day') d CROSS JOIN generate_series(1, :tickers) k
+        WHERE extract(isodow FROM d) < 6 ORDER BY d, k
+    """,
+    **{
+        layout: f"""
+            INSERT INTO {SCHEMA}.{layout} (ticker, interval, ts, {PAYLOAD})
+            SELECT 'T' || lpad(k::text, 5, '0'), 24, d, p - 1, p + 2, p - 2, p, 1000 + k, p * 1000
+            FROM generate_series(:start, :end, interval '1 day') d CROSS JOIN generate_series(1, :tickers) k
+            CROSS JOIN LATERAL (SELECT 100 + k % 500 + (d::date - DATE '2005-01-01') * 0.01 AS p) price
+            WHERE extract(isodow FROM d) < 6 ORDER BY d, k
+        """
+        for layout in ('candles_key', 'candles_covering', 'candles_partitioned')
+    },
+}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def autocommit():
+    connection = await engine.connect()
+    return await connection.execution_options(isolation_level="AUTOCOMMIT")
+
+
+async def build(conn, layout: str, tickers: int) -> float:
+    """Создает и заполняет таблицу раскладки, возвращает время загрузки"""
+    for statement in LAYOUTS[layout]:
+        await conn.execute(text(statement))
+    started = time.perf_counter()
+    end_date = START_DATE + timedelta(days=YEARS * 365)
+    await conn.execute(text(FILL_QUERIES[layout]), {
+        'start': datetime.combine(START_DATE, datetime.min.time()),
+        'end': datetime.combine(end_date, datetime.min.time()),
+        'tickers': tickers,
+    })
+    # Карта видимости нужна для index-only scan
+    await conn.execute(text(f"VACUUM ANALYZE {SCHEMA}.{layout}"))
+    return time.perf_counter() - started
+
+
+async def table_size(conn, layout: str) -> int:
+    # Для секционированной таблицы суммируются разделы
+    result = await conn.execute(text(
+        "SELECT coalesce(sum(pg_total_relation_size(relid)), pg_total_relation_size(:name)) "
+        "FROM pg_partition_tree(:name) WHERE isleaf"
+    ), {'name': f"{SCHEMA}.{layout}"})
+    return int(result.scalar())
+
+
+def random_params(tickers: int, years: int):
+    start = START_DATE + timedelta(days=random.randrange(0, (YEARS - years) * 365 + 1))
+    return {
+        'ticker': f"T{random.randint(1, tickers):05d}",
+        'start': datetime.combine(start, datetime.min.time()),
+        'end': datetime.combine(start + timedelta(days=years * 365), datetime.min.time()),
+    }
+
+
+async def measure(conn, layout: str, tickers: int, years: int, queries: int):
+    query = text(READ_QUERIES[layout])
+    timings = []
+    rows = 0
+    for _ in range(queries):
+        params = random_params(tickers, years)
+        if layout == 'legacy':
+            params = {**params, 'start': params['start'].date(), 'end': params['end'].date()}
+        started = time.perf_counter()
+        result = await conn.execute(query, params)
+        rows += len(result.all())
+        timings.append(time.perf_counter() - started)
+
+    params = random_params(tickers, years)
+    if layout == 'legacy':
+        params = {**params, 'start': params['start'].date(), 'end': params['end'].date()}
+    result = await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {READ_QUERIES[layout]}"), params)
+    plan = result.scalar()
+    plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]['Plan']
+    blocks = plan.get('Shared Hit Blocks', 0) + plan.get('Shared Read Blocks', 0)
+    return statistics.median(timings), percentile(timings, 0.95), rows / queries, blocks, plan['Node Type']
+
+
+async def main(args: argparse.Namespace) -> None:
+    tickers = max(1, args.rows // (YEARS * DAYS_PER_YEAR))
+    conn = await autocommit()
+    try:
+        exists = (await conn.execute(text("SELECT to_regclass(:name)"), {'name': f"{SCHEMA}.legacy"})).scalar()
+        if not (args.keep and exists):
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+            for layout in LAYOUTS:
+                elapsed = await build(conn, layout, tickers)
+                print(f"{layout:<20} загружено за {elapsed:6.1f} с")
+
+        print(f"\n{tickers} тикеров x {YEARS} лет дневных свечей, ~{tickers * YEARS * DAYS_PER_YEAR:,} строк")
+        for layout in LAYOUTS:
+            size = await table_size(conn, layout)
+            print(f"\n{layout}: {size / 1024 / 1024:,.0f} МБ с индексами")
+            for years in (1, 10):
+                median, p95, rows, blocks, node = await measure(conn, layout, tickers, years, args.queries)
+                print(
+                    f"  {years:>2} лет ({rows:5.0f} строк): медиана {median * 1000:7.2f} мс, "
+                    f"p95 {p95 * 1000:7.2f} мс, блоков на запрос {blocks:5}, {node}"
+                )
+    finally:
+        if not args.keep:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.close()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Задержка чтения кэша для разных раскладок хранения")
+    parser.add_argument("--rows", type=int, default=20_000_000, help="Строк в каждой таблице")
+    parser.add_argument("--queries", type=int, default=200, help="Запросов на каждый замер")
+    parser.add_argument("--keep", action="store_true", help="Не удалять таблицы и использовать уже созданные")
+    asyncio.run(main(parser.parse_args()))
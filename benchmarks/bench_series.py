@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк представления цен: список словарей против CandleSeries
+
+Для многолетнего периода по нескольким тикерам сравнивает память,
+занимаемую данными, и время типичного пути запроса: объединение кэшированных
+и новых данных, выборка периода и построение ответа {YYYY-MM-DD: цена}.
+
+Запуск: python -m benchmarks.bench_series
+"""
+
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from engine.series import CandleSeries
+
+TICKERS = 10
+DAYS = 365 * 20
+START_DATE = date(2005, 1, 1)
+SLICE_START = date(2010, 1, 1)
+SLICE_END = date(2020, 12, 31)
+
+
+def make_pairs(offset: int):
+    return [(START_DATE + timedelta(days=i), 100.0 + offset + i * 0.01) for i in range(DAYS)]
+
+
+def build_dicts(pairs):
+    return [{'date': item_date, 'price': price} for item_date, price in pairs]
+
+
+def measure_memory(build, pairs_by_ticker):
+    tracemalloc.start()
+    data = [build(pairs) for pairs in pairs_by_ticker]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return data, size
+
+
+def dicts_request(cached, new):
+    all_data = cached + new
+    selected = [item for item in all_data if SLICE_START <= item['date'] <= SLICE_END]
+    return {item['date'].strftime('%Y-%m-%d'): item['price'] for item in selected}
+
+
+def series_request(cached, new):
+    return cached.merge(new).slice(SLICE_START, SLICE_END).to_dict()
+
+
+def measure_time(request, cached_list, new_list, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for cached, new in zip(cached_list, new_list):
+            request(cached, new)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    pairs_by_ticker = [make_pairs(t) for t in range(TICKERS)]
+    # Половина периода в кэше, вторая половина пришла с MOEX
+    half = DAYS // 2
+    cached_pairs = [pairs[:half] for pairs in pairs_by_ticker]
+    new_pairs = [pairs[half:] for pairs in pairs_by_ticker]
+
+    dicts, dicts_size = measure_memory(build_dicts, pairs_by_ticker)
+    series, series_size = measure_memory(CandleSeries.from_closes, pairs_by_ticker)
+    points = TICKERS * DAYS
+    print(f"Точек: {points} ({TICKERS} тикеров x {DAYS} дней)")
+    print(f"Память, список словарей: {dicts_size / 1024 / 1024:8.1f} МБ ({dicts_size / points:.0f} байт/точку)")
+    print(f"Память, CandleSeries:    {series_size / 1024 / 1024:8.1f} МБ ({series_size / points:.0f} байт/точку)")
+    del dicts, series
+
+    dicts_time = measure_time(
+        dicts_request,
+        [build_dicts(pairs) for pairs in cached_pairs],
+        [build_dicts(pairs) for pairs in new_pairs]
+    )
+    series_time = measure_time(
+        series_request,
+        [CandleSeries.from_closes(pairs) for pairs in cached_pairs],
+        [CandleSeries.from_closes(pairs) for pairs in new_pairs]
+    )
+    print(f"Путь запроса, список словарей: {dicts_time * 1000:8.1f} мс")
+    print(f"Путь запроса, CandleSeries:    {series_time * 1000:8.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
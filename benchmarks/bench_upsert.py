@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк записи в кэш: построчный цикл SELECT + ORM против пакетного upsert
+
+Сравнивает скорость (строк/с) прежнего способа сохранения с
+DataService.save_batch_to_cache (INSERT ... ON CONFLICT и COPY во временную таблицу).
+Использует PostgreSQL из DATABASE_URL, тестовые тикеры удаляются после прогона.
+
+Запуск: python -m benchmarks.bench_upsert
+"""
+
+import asyncio
+import time
+from datetime import date, timedelta
+from typing import Dict
+
+from sqlalchemy import and_, delete, select
+
+from database.database import AsyncSessionLocal
+from database_manager import DatabaseManager
+from engine.data_service import DataService
+from engine.series import CandleSeries
+from models.candle import Candle, CandleInterval
+
+TICKER_PREFIX = "UPSRT"
+
+
+def make_data(ticker_count: int, rows_per_ticker: int) -> Dict[str, CandleSeries]:
+    start_date = date(2000, 1, 1)
+    return {
+        f"{TICKER_PREFIX}{t:03d}": CandleSeries.from_closes(
+            (start_date + timedelta(days=i), 100.0 + i * 0.01)
+            for i in range(rows_per_ticker)
+        )
+        for t in range(ticker_count)
+    }
+
+
+async def clear_cache() -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(Candle).where(Candle.ticker.like(f"{TICKER_PREFIX}%")))
+        await db.commit()
+
+
+async def legacy_save(data_by_ticker: Dict[str, CandleSeries]) -> None:
+    """Прежний способ: SELECT на каждую свечу и ORM add/update"""
+    async with AsyncSessionLocal() as db:
+        for ticker, data in data_by_ticker.items():
+            for moment, *_, close, _volume, _value in data:
+                result = await db.execute(select(Candle).where(and_(
+                    Candle.ticker == ticker,
+                    Candle.interval == CandleInterval.DAY_1.iss_code,
+                    Candle.ts == moment
+                )))
+                existing_record = result.scalar_one_or_none()
+                if existing_record:
+                    existing_record.close = close
+                else:
+                    db.add(Candle(
+                        ticker=ticker, interval=CandleInterval.DAY_1.iss_code, ts=moment, close=close
+                    ))
+            await db.commit()
+
+
+async def batch_save(data_by_ticker: Dict[str, CandleSeries]) -> None:
+    service = DataService(AsyncSessionLocal)
+    async with AsyncSessionLocal() as db:
+        await service.save_batch_to_cache(db, data_by_ticker)
+
+
+async def measure(name: str, save, data_by_ticker: Dict[str, CandleSeries]) -> None:
+    rows = sum(len(data) for data in data_by_ticker.values())
+    await clear_cache()
+    started = time.perf_counter()
+    await save(data_by_ticker)
+    insert_elapsed = time.perf_counter() - started
+    # Повторная запись тех же строк - путь обновления
+    started = time.perf_counter()
+    await save(data_by_ticker)
+    update_elapsed = time.perf_counter() - started
+    print(
+        f"{name:<8} {rows:>7} строк: вставка {rows / insert_elapsed:>10.0f} строк/с, "
+        f"повтор {rows / update_elapsed:>10.0f} строк/с"
+    )
+
+
+async def main() -> None:
+    await DatabaseManager().create_tables()
+    try:
+        # 5 лет дневных свечей одного тикера
+        await measure("legacy", legacy_save, make_data(1, 1250))
+        await measure("batch", batch_save, make_data(1, 1250))
+        # Несколько тикеров, путь через COPY
+        await measure("legacy", legacy_save, make_data(4, 1250))
+        await measure("batch", batch_save, make_data(4, 1250))
+        await measure("batch", batch_save, make_data(40, 2500))
+    finally:
+        await clear_cache()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,222 @@
+"""
+Локальная заглушка ISS API Московской биржи для бенчмарков
+
+Отдает детерминированные свечи всех интервалов ISS по эндпоинту candles.json
+с настраиваемой задержкой ответа для каждого тикера и постраничной выдачей
+(параметр start, как в ISS; блок candles.cursor - по флагу cursor). Для проверки устойчивости клиента часть ответов
+может завершаться ошибкой (error_rate, error_status).
+
+Для справочника бумаг отдает список бумаг режима торгов и режимы торгов бумаги
+(securities/{ticker}.json): любой тикер торгуется в TQBR, кроме unknown_securities,
+которых ISS не знает, и тикеров с заданными датами торгов (listings).
+
+Может работать как отдельный процесс, например для проверки backfill.py:
+    python -m benchmarks.fake_iss --port 8081 --board-securities SBER,GAZP,LKOH
+"""
+
+import argparse
+import asyncio
+import random
+import zlib
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+CANDLE_COLUMNS = ["open", "close", "high", "low", "value", "volume", "begin", "end"]
+
+BOARD_COLUMNS = [
+    "secid", "boardid", "market", "engine", "is_traded", "history_from", "history_till",
+    "listed_from", "listed_till", "is_primary"
+]
+
+# Первый день торгов бумаг без заданных дат
+DEFAULT_LISTED_FROM = date(1997, 1, 1)
+
+
+# Внутридневные свечи генерируются для торговой сессии 10:00-18:50
+SESSION_START = time(10, 0)
+SESSION_MINUTES = 530
+
+
+def make_candle(ticker: str, day: date, begin: Optional[datetime] = None, minutes: int = 24 * 60) -> list:
+    """Детерминированная свеча для тикера, даты и (для внутридневных свечей) времени начала"""
+    base = 100 + zlib.crc32(ticker.encode()) % 900
+    begin = begin or datetime.combine(day, datetime.min.time())
+    minute_of_day = begin.hour * 60 + begin.minute
+    close = round(base + (day.toordinal() % 50) * 0.5 + (minute_of_day % 60) * 0.01, 2)
+    return [
+        close - 1, close, close + 2, close - 2,
+        close * 1000, 1000,
+        begin.strftime('%Y-%m-%d %H:%M:%S'),
+        (begin + timedelta(minutes=minutes, seconds=-1)).strftime('%Y-%m-%d %H:%M:%S'),
+    ]
+
+
+def make_candles(ticker: str, start_date: date, end_date: date, interval: int = 24) -> list:
+    """Свечи за период для кода интервала ISS (1, 10, 60, 24, 7), выходные не торгуются"""
+    rows = []
+    current_date = start_date
+    while current_date <= end_date:
+        if interval == 7:
+            # Недельная свеча начинается в понедельник
+            if current_date.weekday() == 0:
+                rows.append(make_candle(ticker, current_date, minutes=7 * 24 * 60))
+        elif current_date.weekday() < 5:
+            if interval == 24:
+                rows.append(make_candle(ticker, current_date))
+            else:
+                session_start = datetime.combine(current_date, SESSION_START)
+                for minute in range(0, SESSION_MINUTES, interval):
+                    rows.append(make_candle(
+                        ticker, current_date, session_start + timedelta(minutes=minute), interval
+                    ))
+        current_date += timedelta(days=1)
+    return rows
+
+
+class FakeIssServer:
+    """
+    Заглушка ISS, запускаемая в том же event loop
+
+    Args:
+        latency: Задержка ответа по умолчанию, секунды
+        ticker_latency: Задержка для отдельных тикеров, секунды
+        page_size: Максимальное число свечей в одном ответе
+        board_securities: Тикеры, которые возвращает список бумаг любого режима торгов
+        error_rate: Доля запросов свечей, на которые отдается ошибка
+        error_status: Код ответа с ошибкой (например, 429 или 503)
+        seed: Начальное значение генератора ошибок (одинаковые прогоны дают одинаковые ошибки)
+        unknown_securities: Тикеры, которых ISS не знает
+        listings: Первый и последний (None - торгуется) дни торгов тикеров
+        cursor: Отдавать вместе со свечами блок candles.cursor (INDEX, TOTAL, PAGESIZE)
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        ticker_latency: Optional[Dict[str, float]] = None,
+        page_size: int = 500,
+        board_securities: Optional[List[str]] = None,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        seed: Optional[int] = None,
+        unknown_securities: Optional[List[str]] = None,
+        listings: Optional[Dict[str, Tuple[date, Optional[date]]]] = None,
+        cursor: bool = False
+    ):
+        self.latency = latency
+        self.ticker_latency = ticker_latency or {}
+        self.page_size = page_size
+        self.board_securities = board_securities or []
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self.unknown_securities = set(unknown_securities or [])
+        self.listings = listings or {}
+        self.cursor = cursor
+        self.request_count = 0
+        self.error_count = 0
+        self.candle_requests: List[Tuple[str, date, date, int]] = []
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+    async def handle_candles(self, request: web.Request) -> web.Response:
+        self.request_count += 1
+        ticker = request.match_info['ticker']
+        await asyncio.sleep(self.ticker_latency.get(ticker, self.latency))
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.error_count += 1
+            return web.json_response({'error': 'fake error'}, status=self.error_status)
+
+        start_date = date.fromisoformat(request.query['from'])
+        end_date = date.fromisoformat(request.query['till'])
+        interval = int(request.query.get('interval', 24))
+        self.candle_requests.append((ticker, start_date, end_date, interval))
+        rows = make_candles(ticker, start_date, end_date, interval)
+
+        offset = int(request.query.get('start', 0))
+        page = rows[offset:offset + self.page_size]
+        body = {'candles': {'columns': CANDLE_COLUMNS, 'data': page}}
+        if self.cursor:
+            body['candles.cursor'] = {
+                'columns': ['INDEX', 'TOTAL', 'PAGESIZE'],
+                'data': [[offset, len(rows), self.page_size]]
+            }
+        return web.json_response(body)
+
+    async def handle_securities(self, request: web.Request) -> web.Response:
+        self.request_count += 1
+        data = [[ticker, ticker.title(), 10, 'A'] for ticker in self.board_securities]
+        columns = ['SECID', 'SHORTNAME', 'LOTSIZE', 'STATUS']
+        return web.json_response({'securities': {'columns': columns, 'data': data}})
+
+    async def handle_security(self, request: web.Request) -> web.Response:
+        self.request_count += 1
+        ticker = request.match_info['ticker']
+        data = []
+        if ticker not in self.unknown_securities:
+            listed_from, listed_till = self.listings.get(ticker, (DEFAULT_LISTED_FROM, None))
+            last_day = (listed_till or date.today()).isoformat()
+            data.append([
+                ticker, 'TQBR', 'shares', 'stock', 0 if listed_till else 1,
+                listed_from.isoformat(), last_day, listed_from.isoformat(), last_day, 1
+            ])
+        return web.json_response({'boards': {'columns': BOARD_COLUMNS, 'data': data}})
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Запускает сервер и возвращает базовый URL ISS"""
+        app = web.Application()
+        app.router.add_get(
+            '/iss/engines/{engine}/markets/{market}/securities/{ticker}/candles.json',
+            self.handle_candles
+        )
+        app.router.add_get(
+            '/iss/engines/{engine}/markets/{market}/boards/{board}/securities.json',
+            self.handle_securities
+        )
+        app.router.add_get('/iss/securities/{ticker}.json', self.handle_security)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = self._runner.addresses[0][1]
+        self.base_url = f"http://{host}:{bound_port}/iss"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def serve(args: argparse.Namespace) -> None:
+    server = FakeIssServer(
+        latency=args.latency,
+        page_size=args.page_size,
+        board_securities=[ticker for ticker in args.board_securities.split(',') if ticker],
+        error_rate=args.error_rate,
+        error_status=args.error_status
+    )
+    base_url = await server.start(args.host, args.port)
+    print(f"Заглушка ISS: {base_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Локальная заглушка ISS API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа, секунды")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--board-securities", default="", help="Тикеры режима торгов через запятую")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля запросов свечей с ошибкой")
+    parser.add_argument("--error-status", type=int, default=503, help="Код ответа с ошибкой")
+    asyncio.run(serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
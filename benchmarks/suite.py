@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+Воспроизводимый набор бенчмарков с машиночитаемыми результатами
+
+Все сценарии используют локальную заглушку ISS (benchmarks/fake_iss.py) с фиксированной
+задержкой, постраничной выдачей и детерминированными ошибками, и PostgreSQL из DATABASE_URL.
+Каждый сценарий выполняется --repeat раз после прогревочного прогона; в JSON записываются
+все замеры, медиана, p95, минимум и максимум, а также версия кода и окружение.
+
+Сценарии:
+    cold_request_1y        - запрос одного тикера за год при пустом кэше
+    cold_request_10y       - то же за 10 лет (части периода и постраничная загрузка)
+    cold_request_1h_90d    - часовые свечи за 90 дней при пустом кэше
+    cold_request_errors    - запрос при 10% ответов ISS с ошибкой 503 (повторы с backoff)
+    warm_request_db        - повторный запрос: данные в PostgreSQL, кэш в памяти пуст
+    warm_request_hot       - повторный запрос из кэша в памяти
+    concurrency_20         - 20 тикеров при пустом кэше, задержка ISS 50 мс
+    upsert_small           - запись 100 свечей (INSERT ... ON CONFLICT), строк/с
+    upsert_large           - запись 100 000 свечей (COPY), строк/с
+    serialize_json         - сериализация 10 тикеров за 10 лет в JSON ответ
+    serialize_arrow        - то же в Arrow IPC (если установлен pyarrow)
+
+Запуск:
+    python -m benchmarks.suite run --output before.json
+    python -m benchmarks.suite run --output after.json --only cold_request_1y,warm_request_hot
+    python -m benchmarks.suite compare before.json after.json --threshold 0.1
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import delete
+
+from benchmarks.fake_iss import FakeIssServer
+from database.database import AsyncSessionLocal
+from database_manager import DatabaseManager
+from engine.columnar import ARROW_AVAILABLE, to_arrow_ipc
+from engine.data_service import DataService
+from engine.moex_client import MoexClient
+from engine.resilience import CircuitBreaker
+from engine.series import CandleSeries
+from models.candle import Candle, CandleInterval
+from models.pydantic_models import ApiResponse
+from models.stock_coverage import StockCoverage
+
+TICKER_PREFIX = "SUITE"
+RESULTS_FORMAT_VERSION = 1
+
+# Задержка заглушки ISS по умолчанию, секунды
+ISS_LATENCY = 0.02
+
+# Последний день периодов: фиксирован, чтобы запросы не зависели от даты запуска
+END_DATE = date(2024, 12, 31)
+
+
+@dataclass
+class Scenario:
+    name: str
+    unit: str
+    lower_is_better: bool
+    run: Callable[["Bench", int], Awaitable[List[float]]]
+
+
+SCENARIOS: Dict[str, Scenario] = {}
+
+
+def scenario(name: str, unit: str = "s", lower_is_better: bool = True):
+    def register(func):
+        SCENARIOS[name] = Scenario(name, unit, lower_is_better, func)
+        return func
+    return register
+
+
+class Bench:
+    """Общее окружение сценариев: заглушка ISS и клиент MOEX без ограничения частоты"""
+
+    def __init__(self, server: FakeIssServer, moex_client: MoexClient):
+        self.server = server
+        self.moex_client = moex_client
+
+    def service(self, moex_client: Optional[MoexClient] = None, **kwargs) -> DataService:
+        """Новый сервис с пустым кэшем в памяти"""
+        return DataService(AsyncSessionLocal, moex_client=moex_client or self.moex_client, **kwargs)
+
+    async def measure(
+        self,
+        repeat: int,
+        run: Callable[[], Awaitable[None]],
+        setup: Optional[Callable[[], Awaitable[None]]] = None
+    ) -> List[float]:
+        """Время run() в секундах для repeat прогонов после прогревочного; setup не входит в замер"""
+        samples = []
+        for index in range(repeat + 1):
+            if setup is not None:
+                await setup()
+            # Сборка мусора от предыдущих прогонов не должна попадать в замер
+            gc.collect()
+            started = time.perf_counter()
+            await run()
+            elapsed = time.perf_counter() - started
+            if index:
+                samples.append(elapsed)
+        return samples
+
+
+def suite_tickers(name: str, count: int = 1) -> List[str]:
+    return [f"{TICKER_PREFIX}{name}{index:02d}" for index in range(count)]
+
+
+async def clear_cache(tickers: Optional[List[str]] = None) -> None:
+    """Удаляет свечи и покрытие тикеров набора (по умолчанию всех)"""
+    async with AsyncSessionLocal() as db:
+        for model in (Candle, StockCoverage):
+            if tickers is None:
+                await db.execute(delete(model).where(model.ticker.like(f"{TICKER_PREFIX}%")))
+            else:
+                await db.execute(delete(model).where(model.ticker.in_(tickers)))
+        await db.commit()
+
+
+async def cold_request(
+    bench: Bench, repeat: int, tickers: List[str], days: int, interval: CandleInterval = CandleInterval.DAY_1,
+    moex_client_factory: Optional[Callable[[], MoexClient]] = None
+) -> List[float]:
+    start_date = END_DATE - timedelta(days=days - 1)
+    clients: List[MoexClient] = []
+
+    async def run() -> None:
+        moex_client = bench.moex_client
+        if moex_client_factory is not None:
+            moex_client = moex_client_factory()
+            clients.append(moex_client)
+        result = await bench.service(moex_client).get_stock_series(tickers, start_date, END_DATE, interval)
+        assert all(len(result[ticker]) for ticker in tickers), "Не все тикеры получили данные"
+
+    try:
+        return await bench.measure(repeat, run, setup=lambda: clear_cache(tickers))
+    finally:
+        for client in clients:
+            await client.close()
+
+
+@scenario("cold_request_1y")
+async def cold_request_1y(bench: Bench, repeat: int) -> List[float]:
+    return await cold_request(bench, repeat, suite_tickers("C1Y"), 365)
+
+
+@scenario("cold_request_10y")
+async def cold_request_10y(bench: Bench, repeat: int) -> List[float]:
+    return await cold_request(bench, repeat, suite_tickers("C10Y"), 3650)
+
+
+@scenario("cold_request_1h_90d")
+async def cold_request_1h_90d(bench: Bench, repeat: int) -> List[float]:
+    return await cold_request(bench, repeat, suite_tickers("C1H"), 90, CandleInterval.HOUR_1)
+
+
+@scenario("cold_request_errors")
+async def cold_request_errors(bench: Bench, repeat: int) -> List[float]:
+    # Отдельный клиент на прогон, чтобы circuit breaker не переносил состояние между прогонами
+    bench.server.error_rate = 0.1
+    try:
+        return await cold_request(
+            bench, repeat, suite_tickers("CERR"), 3 * 365,
+            moex_client_factory=lambda: MoexClient(bench.server.base_url, breaker=CircuitBreaker(1000))
+        )
+    finally:
+        bench.server.error_rate = 0.0
+
+
+async def warm_tickers(bench: Bench, tickers: List[str], days: int) -> date:
+    start_date = END_DATE - timedelta(days=days - 1)
+    await clear_cache(tickers)
+    await bench.service().get_stock_series(tickers, start_date, END_DATE)
+    return start_date
+
+
+@scenario("warm_request_db")
+async def warm_request_db(bench: Bench, repeat: int) -> List[float]:
+    tickers = suite_tickers("WDB")
+    start_date = await warm_tickers(bench, tickers, 3650)
+    requests_before = bench.server.request_count
+
+    async def run() -> None:
+        await bench.service().get_stock_series(tickers, start_date, END_DATE)
+
+    samples = await bench.measure(repeat, run)
+    assert bench.server.request_count == requests_before, "Повторный запрос обратился к ISS"
+    return samples
+
+
+@scenario("warm_request_hot")
+async def warm_request_hot(bench: Bench, repeat: int) -> List[float]:
+    tickers = suite_tickers("WHOT")
+    start_date = await warm_tickers(bench, tickers, 3650)
+    service = bench.service()
+    await service.get_stock_series(tickers, start_date, END_DATE)
+
+    async def run() -> None:
+        await service.get_stock_series(tickers, start_date, END_DATE)
+
+    return await bench.measure(repeat, run)
+
+
+@scenario("concurrency_20")
+async def concurrency_20(bench: Bench, repeat: int) -> List[float]:
+    latency = bench.server.latency
+    bench.server.latency = 0.05
+    try:
+        return await cold_request(bench, repeat, suite_tickers("CONC", 20), 365)
+    finally:
+        bench.server.latency = latency
+
+
+def make_series(ticker_count: int, rows_per_ticker: int, prefix: str) -> Dict[str, CandleSeries]:
+    start_date = date(1990, 1, 1)
+    data = {}
+    for ticker in suite_tickers(prefix, ticker_count):
+        series = CandleSeries.from_closes(
+            (start_date + timedelta(days=i), 100.0 + i * 0.01) for i in range(rows_per_ticker)
+        )
+        for column in (series.open, series.high, series.low, series.volume, series.value):
+            column[:] = series.close
+        data[ticker] = series
+    return data
+
+
+async def upsert_throughput(bench: Bench, repeat: int, ticker_count: int, rows_per_ticker: int, prefix: str) -> List[float]:
+    data = make_series(ticker_count, rows_per_ticker, prefix)
+    rows = ticker_count * rows_per_ticker
+    service = bench.service()
+
+    async def run() -> None:
+        async with AsyncSessionLocal() as db:
+            await service.save_batch_to_cache(db, data)
+
+    samples = await bench.measure(repeat, run, setup=lambda: clear_cache(list(data)))
+    await clear_cache(list(data))
+    return [rows / elapsed for elapsed in samples]
+
+
+@scenario("upsert_small", unit="rows/s", lower_is_better=False)
+async def upsert_small(bench: Bench, repeat: int) -> List[float]:
+    return await upsert_throughput(bench, repeat, 1, 100, "UPS")
+
+
+@scenario("upsert_large", unit="rows/s", lower_is_better=False)
+async def upsert_large(bench: Bench, repeat: int) -> List[float]:
+    return await upsert_throughput(bench, repeat, 40, 2500, "UPL")
+
+
+@scenario("serialize_json")
+async def serialize_json(bench: Bench, repeat: int) -> List[float]:
+    data = make_series(10, 2600, "SER")
+
+    async def run() -> None:
+        payload = {ticker: series.to_dict() for ticker, series in data.items()}
+        ApiResponse(success=True, data=payload).model_dump_json()
+
+    return await bench.measure(repeat, run)
+
+
+@scenario("serialize_arrow")
+async def serialize_arrow(bench: Bench, repeat: int) -> List[float]:
+    data = make_series(10, 2600, "SER")
+
+    async def run() -> None:
+        to_arrow_ipc(data)
+
+    return await bench.measure(repeat, run)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        'median': statistics.median(ordered),
+        'p95': ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)],
+        'min': ordered[0],
+        'max': ordered[-1],
+        'mean': statistics.fmean(ordered),
+        'stdev': statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+    }
+
+
+def git_revision() -> Dict[str, Optional[str]]:
+    def git(*args: str) -> Optional[str]:
+        try:
+            return subprocess.run(
+                ['git', *args], capture_output=True, text=True, check=True,
+                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {'commit': git('rev-parse', 'HEAD'), 'describe': git('describe', '--always', '--dirty')}
+
+
+def format_value(value: float, unit: str) -> str:
+    if unit == "s":
+        return f"{value * 1000:.2f} ms"
+    return f"{value:,.0f} {unit}"
+
+
+async def run_suite(args: argparse.Namespace) -> Dict:
+    names = [name.strip() for name in args.only.split(',') if name.strip()] if args.only else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Неизвестные сценарии: {', '.join(unknown)}")
+    if not ARROW_AVAILABLE and "serialize_arrow" in names:
+        print("pyarrow не установлен, serialize_arrow пропущен")
+        names.remove("serialize_arrow")
+
+    # Задержки повторов ISS случайные - фиксируем их последовательность
+    random.seed(args.seed)
+    await DatabaseManager().create_tables()
+    server = FakeIssServer(latency=ISS_LATENCY, seed=args.seed)
+    base_url = await server.start()
+    moex_client = MoexClient(base_url)
+    bench = Bench(server, moex_client)
+
+    results = {}
+    try:
+        for name in names:
+            spec = SCENARIOS[name]
+            samples = await spec.run(bench, args.repeat)
+            results[name] = {
+                'unit': spec.unit,
+                'lower_is_better': spec.lower_is_better,
+                **summarize(samples),
+                'samples': samples,
+            }
+            print(f"{name:<22} median {format_value(results[name]['median'], spec.unit):>16}   "
+                  f"p95 {format_value(results[name]['p95'], spec.unit):>16}")
+    finally:
+        await moex_client.close()
+        await server.stop()
+        await clear_cache()
+
+    return {
+        'format': RESULTS_FORMAT_VERSION,
+        'meta': {
+            **git_revision(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'iss_latency': ISS_LATENCY,
+        },
+        'results': results,
+    }
+
+
+def compare(base: Dict, new: Dict, threshold: float) -> List[str]:
+    """Печатает сравнение медиан и возвращает сценарии, ухудшившиеся больше чем на threshold"""
+    print(f"База:  {base['meta'].get('describe')} ({base['meta'].get('timestamp')})")
+    print(f"Новая: {new['meta'].get('describe')} ({new['meta'].get('timestamp')})")
+    print(f"{'сценарий':<22} {'база':>16} {'новая':>16} {'изменение':>10}")
+    regressions = []
+    for name, new_result in new['results'].items():
+        base_result = base['results'].get(name)
+        if base_result is None:
+            print(f"{name:<22} {'-':>16} {format_value(new_result['median'], new_result['unit']):>16}")
+            continue
+        change = new_result['median'] / base_result['median'] - 1
+        worse = change > threshold if new_result['lower_is_better'] else change < -threshold
+        better = change < -threshold if new_result['lower_is_better'] else change > threshold
+        mark = "  РЕГРЕССИЯ" if worse else ("  улучшение" if better else "")
+        if worse:
+            regressions.append(name)
+        print(
+            f"{name:<22} {format_value(base_result['median'], base_result['unit']):>16} "
+            f"{format_value(new_result['median'], new_result['unit']):>16} {change:>+9.1%}{mark}"
+        )
+    return regressions
+
+
+def load_results(path: str) -> Dict:
+    with open(path) as file:
+        return json.load(file)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Набор бенчмарков MOEX Data Fetcher")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Выполнить сценарии и записать результаты в JSON")
+    run_parser.add_argument("--output", default=None, help="Файл результатов (по умолчанию только вывод на экран)")
+    run_parser.add_argument("--repeat", type=int, default=5, help="Прогонов каждого сценария")
+    run_parser.add_argument("--only", default="", help="Сценарии через запятую")
+    run_parser.add_argument("--seed", type=int, default=0, help="Начальное значение генераторов случайных чисел")
+
+    compare_parser = commands.add_parser("compare", help="Сравнить два файла результатов")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=0.1, help="Допустимое ухудшение медианы (0.1 - 10%%)"
+    )
+
+    commands.add_parser("list", help="Показать сценарии")
+
+    args = parser.parse_args()
+    if args.command == "list":
+        for spec in SCENARIOS.values():
+            print(f"{spec.name:<22} {spec.unit}")
+    elif args.command == "run":
+        report = asyncio.run(run_suite(args))
+        if args.output:
+            with open(args.output, 'w') as file:
+                json.dump(report, file, indent=2, ensure_ascii=False)
+            print(f"Результаты записаны в {args.output}")
+    else:
+        regressions = compare(load_results(args.base), load_results(args.new), args.threshold)
+        if regressions:
+            print(f"Регрессии: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,47 @@
 #!/usr/bin/env python3
 """
 Менеджер базы данных - создает базу данных при первом запуске
+
+Создание базы и миграция схемы выполняются под advisory lock PostgreSQL, поэтому несколько
+процессов приложения, запущенных одновременно, не выполняют DDL параллельно: первый выполняет
+миграцию и записывает версию схемы, остальные дожидаются его и видят, что схема актуальна.
 """
 
 import asyncio
 import asyncpg
 import os
+from datetime import date
+
+# Ключ advisory lock, под которым создается база данных и выполняется миграция схемы
+MIGRATION_LOCK_KEY = 0x6D6F6578
+
+# Версия схемы; миграция выполняется, если в базе записана более ранняя
+SCHEMA_VERSION = 4
+
+# Разбиение таблицы candles: none или year (разделы по годам времени свечи)
+CANDLES_PARTITIONING = os.environ.get("CANDLES_PARTITIONING", "none").lower()
+
+# Первый год, для которого создается раздел (более ранние свечи попадают в раздел по умолчанию)
+CANDLES_PARTITION_FIRST_YEAR = int(os.environ.get("CANDLES_PARTITION_FIRST_YEAR", "2000"))
+
+# Колонки значений свечи: входят в первичный ключ как INCLUDE, поэтому чтение периода
+# обслуживается index-only scan без обращений к таблице
+CANDLE_PAYLOAD_COLUMNS = "open, high, low, close, volume, value"
+
+CANDLES_DDL = f"""
+    CREATE TABLE IF NOT EXISTS {{table}} (
+        ticker VARCHAR(20) NOT NULL,
+        interval SMALLINT NOT NULL,
+        ts TIMESTAMP NOT NULL,
+        open FLOAT,
+        high FLOAT,
+        low FLOAT,
+        close FLOAT NOT NULL,
+        volume BIGINT,
+        value FLOAT,
+        CONSTRAINT {{table}}_pkey PRIMARY KEY (ticker, interval, ts) INCLUDE ({CANDLE_PAYLOAD_COLUMNS})
+    ){{partitioning}};
+"""
 
 class DatabaseManager:
     def __init__(self, host=None, port=None, user=None, password=None):
@@ -15,7 +51,7 @@ class DatabaseManager:
         self.password = password or os.environ.get("DB_PASSWORD", "password")
         self.db_name = os.environ.get("DB_NAME", "moex_data")
         self.connection = None
-        
+    
     async def create_database(self):
         """Создает базу данных и таблицы"""
         try:
@@ -30,20 +66,30 @@ class DatabaseManager:
                 database="postgres"
             )
             
-            print("Создаем базу данных...")
-            await postgres_conn.execute(f"""
-                CREATE DATABASE {self.db_name} 
-                WITH 
-                TEMPLATE = template0
-                OWNER = {self.user}
-                ENCODING = 'UTF8'
-                LC_COLLATE = 'en_US.utf8'
-                LC_CTYPE = 'en_US.utf8'
-                TABLESPACE = pg_default
-                CONNECTION LIMIT = -1;
-            """)
-            print(f"База данных '{self.db_name}' создана!")
-            await postgres_conn.close()
+            # Базу данных создает только один из одновременно запущенных процессов
+            await postgres_conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_KEY)
+            try:
+                exists = await postgres_conn.fetchval(
+                    "SELECT 1 FROM pg_database WHERE datname = $1", self.db_name
+                )
+                if exists:
+                    print(f"База данных '{self.db_name}' уже существует")
+                else:
+                    print("Создаем базу данных...")
+                    await postgres_conn.execute(f"""
+                        CREATE DATABASE {self.db_name} 
+                        WITH 
+                        TEMPLATE = template0
+                        OWNER = {self.user}
+                        ENCODING = 'UTF8'
+                        LC_COLLATE = 'en_US.utf8'
+                        LC_CTYPE = 'en_US.utf8'
+                        TABLESPACE = pg_default
+                        CONNECTION LIMIT = -1;
+                    """)
+                    print(f"База данных '{self.db_name}' создана!")
+            finally:
+                await postgres_conn.close()
             
             # Создаем таблицы
             await self.create_tables()
@@ -56,55 +102,272 @@ class DatabaseManager:
             raise
     
     async def create_tables(self):
-        """Создает таблицы в базе данных"""
+        """
+        Создает таблицы в базе данных, если версия схемы в базе устарела
+        
+        Миграция выполняется под advisory lock: процессы, запущенные одновременно,
+        дожидаются первого и DDL не повторяют.
+        """
+        # Подключаемся к нашей базе данных
+        self.connection = await asyncpg.connect(
+            user=self.user,
+            password=self.password,
+            host=self.host,
+            port=self.port,
+            database=self.db_name
+        )
+        print("Подключены к базе данных")
+        
         try:
-            print("Создаем таблицы...")
+            # Блокировка сессии освобождается и при закрытии соединения
+            await self.connection.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_KEY)
             
-            # Подключаемся к нашей базе данных
-            self.connection = await asyncpg.connect(
-                user=self.user,
-                password=self.password,
-                host=self.host,
-                port=self.port,
-                database=self.db_name
+            version = await self.get_schema_version()
+            if version >= SCHEMA_VERSION:
+                print(f"Схема базы данных актуальна (версия {version})")
+                # Без изменений только чтение каталога: раскладка candles и разделы на следующий год
+                await self.upgrade_candles()
+                return
+            
+            await self.migrate()
+            await self.connection.execute(
+                "INSERT INTO schema_version (version) VALUES ($1)", SCHEMA_VERSION
             )
+            print(f"Схема базы данных обновлена до версии {SCHEMA_VERSION}")
+        finally:
+            await self.connection.close()
+    
+    async def get_schema_version(self):
+        """Версия схемы, записанная в базе (0 - база пуста или создана до появления версий)"""
+        if await self.connection.fetchval("SELECT to_regclass('schema_version')") is None:
+            return 0
+        return await self.connection.fetchval("SELECT coalesce(max(version), 0) FROM schema_version")
+    
+    async def migrate(self):
+        """Создает таблицы и индексы и переносит данные из прежних таблиц"""
+        try:
+            print("Создаем таблицы...")
+            
+            # Создаем таблицу свечей OHLCV
+            partitioning = " PARTITION BY RANGE (ts)" if CANDLES_PARTITIONING == "year" else ""
+            await self.connection.execute(CANDLES_DDL.format(table="candles", partitioning=partitioning))
+            print("Таблица 'candles' создана!")
+            
+            await self.upgrade_candles()
             
-            print("Подключены к базе данных")
+            await self.connection.execute("""
+                CREATE INDEX IF NOT EXISTS idx_candles_ts_brin 
+                ON candles USING brin (ts);
+            """)
             
-            # Создаем таблицу stock_data
+            # Создаем таблицу интервалов, уже запрошенных у MOEX
             await self.connection.execute("""
-                CREATE TABLE IF NOT EXISTS stock_data (
+                CREATE TABLE IF NOT EXISTS stock_coverage (
                     id SERIAL PRIMARY KEY,
                     ticker VARCHAR(20) NOT NULL,
-                    date DATE NOT NULL,
-                    price FLOAT NOT NULL,
-                    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-                    updated_at TIMESTAMP WITH TIME ZONE
+                    interval SMALLINT NOT NULL DEFAULT 24,
+                    start_date DATE NOT NULL,
+                    end_date DATE NOT NULL,
+                    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
                 );
             """)
-            print("Таблица 'stock_data' создана!")
+            print("Таблица 'stock_coverage' создана!")
+            
+            # Покрытие, созданное до появления интервалов, относится к дневным свечам
+            await self.connection.execute("""
+                ALTER TABLE stock_coverage 
+                ADD COLUMN IF NOT EXISTS interval SMALLINT NOT NULL DEFAULT 24;
+            """)
             
-            # Создаем индексы
             await self.connection.execute("""
-                CREATE INDEX IF NOT EXISTS ix_stock_data_id 
-                ON stock_data (id);
+                DROP INDEX IF EXISTS idx_coverage_ticker_dates;
             """)
             
             await self.connection.execute("""
-                CREATE INDEX IF NOT EXISTS ix_stock_data_ticker 
-                ON stock_data (ticker);
+                CREATE INDEX IF NOT EXISTS idx_coverage_ticker_interval_dates 
+                ON stock_coverage (ticker, interval, start_date, end_date);
             """)
             
+            # Создаем таблицу прогресса фонового прогрева кэша
             await self.connection.execute("""
-                CREATE UNIQUE INDEX IF NOT EXISTS idx_ticker_date 
-                ON stock_data (ticker, date);
+                CREATE TABLE IF NOT EXISTS prefetch_state (
+                    job VARCHAR(32) PRIMARY KEY,
+                    run_date DATE NOT NULL,
+                    cursor INTEGER NOT NULL DEFAULT 0,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    completed BOOLEAN NOT NULL DEFAULT FALSE,
+                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                );
+            """)
+            print("Таблица 'prefetch_state' создана!")
+            
+            # Создаем таблицу контрольных точек массовой загрузки истории
+            await self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS backfill_progress (
+                    job VARCHAR(64) NOT NULL,
+                    ticker VARCHAR(20) NOT NULL,
+                    completed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                    PRIMARY KEY (job, ticker)
+                );
+            """)
+            print("Таблица 'backfill_progress' создана!")
+            
+            # Создаем таблицу справочника бумаг ISS
+            await self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS securities (
+                    ticker VARCHAR(20) PRIMARY KEY,
+                    found BOOLEAN NOT NULL DEFAULT TRUE,
+                    name VARCHAR(64),
+                    board VARCHAR(12),
+                    engine VARCHAR(20),
+                    market VARCHAR(20),
+                    lot_size INTEGER,
+                    is_traded BOOLEAN,
+                    listed_from DATE,
+                    listed_till DATE,
+                    checked_at TIMESTAMP WITH TIME ZONE,
+                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                );
+            """)
+            print("Таблица 'securities' создана!")
+            
+            # Создаем таблицу обновлений справочника бумаг по режимам торгов
+            await self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS securities_refresh (
+                    board VARCHAR(12) PRIMARY KEY,
+                    securities INTEGER NOT NULL DEFAULT 0,
+                    refreshed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+                );
+            """)
+            print("Таблица 'securities_refresh' создана!")
+            
+            # Обновление справочника раньше отмечалось в таблице прогрева кэша
+            await self.connection.execute("""
+                DELETE FROM prefetch_state WHERE job = 'securities';
+            """)
+            
+            # Создаем таблицу примененных версий схемы
+            await self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    applied_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                );
             """)
             
             print("Все индексы созданы!")
             
+            await self.migrate_stock_data()
+            
         except Exception as e:
             print(f"Ошибка при создании таблиц: {e}")
             raise
+    
+    async def upgrade_candles(self):
+        """
+        Приводит существующую таблицу candles к текущей раскладке
+        
+        Первичный ключ без INCLUDE пересоздается покрывающим. При CANDLES_PARTITIONING=year
+        обычная таблица заменяется секционированной по годам с переносом всех свечей.
+        """
+        covering = await self.connection.fetchval("""
+            SELECT i.indnkeyatts < i.indnatts
+            FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = 'candles_pkey';
+        """)
+        if not covering:
+            print("Пересоздаем первичный ключ 'candles' с колонками значений (INCLUDE)...")
+            await self.connection.execute(f"""
+                ALTER TABLE candles 
+                DROP CONSTRAINT candles_pkey, 
+                ADD CONSTRAINT candles_pkey PRIMARY KEY (ticker, interval, ts) INCLUDE ({CANDLE_PAYLOAD_COLUMNS});
+            """)
+        
+        partitioned = await self.connection.fetchval(
+            "SELECT relkind = 'p' FROM pg_class WHERE oid = 'candles'::regclass"
+        )
+        if CANDLES_PARTITIONING == "year" and not partitioned:
+            print("Переносим 'candles' в таблицу с разделами по годам...")
+            async with self.connection.transaction():
+                await self.connection.execute("ALTER TABLE candles RENAME TO candles_unpartitioned;")
+                await self.connection.execute(
+                    "ALTER TABLE candles_unpartitioned RENAME CONSTRAINT candles_pkey TO candles_unpartitioned_pkey;"
+                )
+                await self.connection.execute("DROP INDEX IF EXISTS idx_candles_ts_brin;")
+                await self.connection.execute(
+                    CANDLES_DDL.format(table="candles", partitioning=" PARTITION BY RANGE (ts)")
+                )
+                last_year = await self.connection.fetchval(
+                    "SELECT extract(year FROM max(ts))::int FROM candles_unpartitioned"
+                )
+                await self.ensure_candle_partitions(last_year)
+                moved = await self.connection.execute("INSERT INTO candles SELECT * FROM candles_unpartitioned;")
+                await self.connection.execute("DROP TABLE candles_unpartitioned;")
+                await self.connection.execute("CREATE INDEX idx_candles_ts_brin ON candles USING brin (ts);")
+            print(f"Перенесено {int(moved.split()[-1])} свечей")
+            partitioned = True
+        
+        if partitioned:
+            await self.ensure_candle_partitions()
+    
+    async def ensure_candle_partitions(self, last_year=None):
+        """
+        Создает недостающие разделы candles по годам до следующего года (или last_year) и раздел по умолчанию
+        
+        Для несекционированной таблицы ничего не делает. Запросы к каталогу выполняются всегда,
+        DDL - только если разделов не хватает.
+        """
+        partitioned = await self.connection.fetchval(
+            "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('candles')"
+        )
+        if not partitioned:
+            return
+        last_year = max(last_year or 0, date.today().year + 1)
+        existing = {
+            row['relname'] for row in await self.connection.fetch(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = 'candles'::regclass"
+            )
+        }
+        if "candles_default" not in existing:
+            await self.connection.execute("CREATE TABLE candles_default PARTITION OF candles DEFAULT;")
+        for year in range(CANDLES_PARTITION_FIRST_YEAR, last_year + 1):
+            if f"candles_y{year}" in existing:
+                continue
+            try:
+                await self.connection.execute(f"""
+                    CREATE TABLE candles_y{year} PARTITION OF candles 
+                    FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01');
+                """)
+            except asyncpg.exceptions.CheckViolationError as e:
+                # Свечи года уже лежат в разделе по умолчанию - оставляем их там
+                print(f"Раздел candles_y{year} не создан: {e}")
+    
+    async def migrate_stock_data(self):
+        """
+        Переносит цены закрытия из прежней таблицы stock_data в candles как дневные свечи
+        
+        stock_data (суррогатный id, три индекса, служебные колонки на каждой строке) больше
+        не используется: после переноса в одной транзакции она удаляется. Перенесенные свечи
+        содержат только close, поэтому покрытие дневных свечей этих тикеров удаляется:
+        при следующем запросе свечи загружаются с MOEX целиком.
+        """
+        if await self.connection.fetchval("SELECT to_regclass('stock_data')") is None:
+            return
+        async with self.connection.transaction():
+            moved = await self.connection.execute("""
+                INSERT INTO candles (ticker, interval, ts, close)
+                SELECT ticker, 24, date::timestamp, price FROM stock_data
+                ON CONFLICT DO NOTHING;
+            """)
+            uncovered = await self.connection.execute("""
+                DELETE FROM stock_coverage 
+                WHERE interval = 24 AND ticker IN (SELECT DISTINCT ticker FROM stock_data);
+            """)
+            await self.connection.execute("DROP TABLE stock_data;")
+        
+        moved_count = int(moved.split()[-1])
+        print(f"Перенесено {moved_count} записей из 'stock_data' в 'candles', таблица 'stock_data' удалена")
+        print(f"Удалено {int(uncovered.split()[-1])} интервалов покрытия дневных свечей перенесенных тикеров")
 
 async def setup_database():
     """Настройка базы данных при запуске приложения"""
@@ -0,0 +1,371 @@
+"""
+Агрегаты по рядам свечей: ресемплинг, логарифмические доходности, скользящая волатильность и корреляции
+
+Входные ряды берутся через DataService, поэтому недостающие периоды сначала загружаются в кэш.
+Расчеты идут по колонкам array одним проходом (скользящее окно - на бегущих суммах).
+Ресемплинг внутридневных свечей выполняется в PostgreSQL (date_trunc и агрегаты по группам):
+в Python попадают только готовые недельные, месячные или квартальные свечи, а не сотни минутных за день.
+
+Результаты для исторических периодов (все свечи периода закрыты) неизменны
+и запоминаются в LRU кэше на ANALYTICS_CACHE_SIZE запросов.
+"""
+
+import asyncio
+import logging
+import math
+import os
+from array import array
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from itertools import groupby
+from typing import Dict, Hashable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from models.candle import CandleInterval
+from models.pydantic_models import AnalyticsMetric, ResampleRule
+
+from .coverage import last_closed_date
+from .data_service import DataService
+from .metrics import stage
+from .resilience import MoexUnavailableError
+from .series import EPOCH_ORDINAL, NAN, SECONDS_PER_DAY, CandleSeries
+
+logger = logging.getLogger(__name__)
+
+# Число запомненных результатов для исторических периодов
+ANALYTICS_CACHE_SIZE = int(os.getenv("ANALYTICS_CACHE_SIZE", "256"))
+
+# Свечей в году для годовой волатильности (252 торговых дня, основная сессия 10:00-18:50)
+PERIODS_PER_YEAR = {
+    CandleInterval.MINUTE_1: 252 * 530,
+    CandleInterval.MINUTE_10: 252 * 53,
+    CandleInterval.HOUR_1: 252 * 9,
+    CandleInterval.DAY_1: 252,
+    CandleInterval.WEEK_1: 52,
+    ResampleRule.WEEK: 52,
+    ResampleRule.MONTH: 12,
+    ResampleRule.QUARTER: 4,
+}
+
+# Свечи тикеров, агрегированные по периодам в PostgreSQL (строки как у выборки свечей, плюс тикер)
+RESAMPLE_QUERY = text(
+    "SELECT ticker, date_trunc(:unit, ts) AS period, "
+    "(array_agg(open ORDER BY ts))[1], max(high), min(low), (array_agg(close ORDER BY ts DESC))[1], "
+    "sum(volume)::float8, sum(value) "
+    "FROM candles "
+    "WHERE ticker = ANY(:tickers) AND interval = :interval AND ts >= :start AND ts < :end "
+    "GROUP BY ticker, period "
+    "ORDER BY ticker, period"
+)
+
+Returns = Tuple[array, array]
+
+
+@lru_cache(maxsize=65536)
+def _period_start(day: int, rule: ResampleRule) -> int:
+    """Номер дня (от 1970-01-01) начала недели, месяца или квартала, в который попадает день"""
+    current = date.fromordinal(day + EPOCH_ORDINAL)
+    if rule == ResampleRule.WEEK:
+        start = current - timedelta(days=current.weekday())
+    elif rule == ResampleRule.MONTH:
+        start = current.replace(day=1)
+    else:
+        start = current.replace(month=(current.month - 1) // 3 * 3 + 1, day=1)
+    return start.toordinal() - EPOCH_ORDINAL
+
+
+def _nan_max(values: Sequence[float]) -> float:
+    valid = [value for value in values if value == value]
+    return max(valid) if valid else NAN
+
+
+def _nan_min(values: Sequence[float]) -> float:
+    valid = [value for value in values if value == value]
+    return min(valid) if valid else NAN
+
+
+def _nan_sum(values: Sequence[float]) -> float:
+    valid = [value for value in values if value == value]
+    return math.fsum(valid) if valid else NAN
+
+
+def resample(series: CandleSeries, rule: ResampleRule) -> CandleSeries:
+    """
+    Агрегирует свечи по неделям, месяцам или кварталам
+
+    open - первой свечи периода, close - последней, high/low - экстремумы, volume/value - суммы.
+    Время свечи - начало периода.
+    """
+    size = len(series)
+    if not size:
+        return series
+    keys = [_period_start(ts // SECONDS_PER_DAY, rule) for ts in series.ts]
+    bounds = [index for index in range(1, size) if keys[index] != keys[index - 1]]
+    groups = list(zip([0, *bounds], [*bounds, size]))
+    return CandleSeries(
+        array('q', [keys[lo] * SECONDS_PER_DAY for lo, _ in groups]),
+        array('d', [series.open[lo] for lo, _ in groups]),
+        array('d', [_nan_max(series.high[lo:hi]) for lo, hi in groups]),
+        array('d', [_nan_min(series.low[lo:hi]) for lo, hi in groups]),
+        array('d', [series.close[hi - 1] for _, hi in groups]),
+        array('d', [_nan_sum(series.volume[lo:hi]) for lo, hi in groups]),
+        array('d', [_nan_sum(series.value[lo:hi]) for lo, hi in groups]),
+    )
+
+
+def log_returns(series: CandleSeries) -> Returns:
+    """
+    Логарифмические доходности цен закрытия
+
+    Returns:
+        Время свечей, на которых заканчивается доходность (все, кроме первой), и доходности;
+        NaN, если одна из цен отсутствует или не положительна
+    """
+    close = series.close
+    return series.ts[1:], array('d', [
+        math.log(current / previous) if previous > 0 and current > 0 else NAN
+        for previous, current in zip(close, close[1:])
+    ])
+
+
+def rolling_volatility(returns: array, window: int, periods_per_year: int) -> array:
+    """
+    Годовая волатильность (стандартное отклонение доходностей, умноженное на sqrt(periods_per_year))
+    по скользящему окну window свечей; NaN, пока в окне меньше window доходностей
+    """
+    result = array('d', [NAN]) * len(returns)
+    scale = math.sqrt(periods_per_year)
+    total = squares = 0.0
+    count = 0
+    for index, value in enumerate(returns):
+        if value == value:
+            total += value
+            squares += value * value
+            count += 1
+        if index >= window:
+            dropped = returns[index - window]
+            if dropped == dropped:
+                total -= dropped
+                squares -= dropped * dropped
+                count -= 1
+        if count == window:
+            variance = (squares - total * total / count) / (count - 1)
+            result[index] = math.sqrt(max(variance, 0.0)) * scale
+    return result
+
+
+def _correlation(left: Dict[int, float], right: Dict[int, float]) -> Optional[float]:
+    """Корреляция Пирсона по общим моментам времени (None, если их меньше трех или ряд постоянен)"""
+    common = left.keys() & right.keys()
+    if len(common) < 3:
+        return None
+    xs = [left[ts] for ts in common]
+    ys = [right[ts] for ts in common]
+    mean_x = math.fsum(xs) / len(xs)
+    mean_y = math.fsum(ys) / len(ys)
+    covariance = math.fsum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    variance_x = math.fsum((x - mean_x) ** 2 for x in xs)
+    variance_y = math.fsum((y - mean_y) ** 2 for y in ys)
+    if not variance_x or not variance_y:
+        return None
+    return covariance / math.sqrt(variance_x * variance_y)
+
+
+def correlation_matrix(returns_by_ticker: Dict[str, Returns]) -> Dict[str, Dict[str, Optional[float]]]:
+    """Попарные корреляции доходностей тикеров, выровненных по времени свечей"""
+    by_ts = {
+        ticker: {ts: value for ts, value in zip(timestamps, values) if value == value}
+        for ticker, (timestamps, values) in returns_by_ticker.items()
+    }
+    tickers = list(by_ts)
+    matrix: Dict[str, Dict[str, Optional[float]]] = {ticker: {} for ticker in tickers}
+    for position, left in enumerate(tickers):
+        for right in tickers[position:]:
+            value = _correlation(by_ts[left], by_ts[right])
+            matrix[left][right] = matrix[right][left] = value
+    return matrix
+
+
+class AnalyticsService:
+    """
+    Расчет агрегатов по тикерам поверх кэша DataService
+
+    Args:
+        data_service: Сервис данных, дополняющий кэш перед расчетом
+        session_factory: Фабрика сессий для агрегации в PostgreSQL
+        cache_size: Число запомненных результатов для исторических периодов
+    """
+
+    def __init__(
+        self, data_service: DataService, session_factory: async_sessionmaker, cache_size: Optional[int] = None
+    ):
+        self.data_service = data_service
+        self.session_factory = session_factory
+        self.cache_size = cache_size if cache_size is not None else ANALYTICS_CACHE_SIZE
+        self._results: "OrderedDict[Hashable, Dict]" = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'resampled_in_db': 0}
+
+    async def compute(
+        self,
+        tickers: List[str],
+        start_date: date,
+        end_date: date,
+        interval: CandleInterval = CandleInterval.DAY_1,
+        resample_rule: Optional[ResampleRule] = None,
+        metrics: Sequence[AnalyticsMetric] = (AnalyticsMetric.RETURNS, AnalyticsMetric.VOLATILITY),
+        window: int = 20,
+        ohlcv: bool = False,
+        stale: Optional[Set[str]] = None
+    ) -> Dict:
+        """
+        Рассчитывает показатели по тикерам за период
+
+        Args:
+            tickers: Список тикеров
+            start_date: Дата начала периода
+            end_date: Дата окончания периода
+            interval: Интервал исходных свечей
+            resample_rule: Период агрегации свечей перед расчетом (None - без агрегации)
+            metrics: Рассчитываемые показатели
+            window: Окно скользящей волатильности, свечей
+            ohlcv: Отдавать в prices свечи OHLCV, а не цены закрытия
+            stale: Сюда добавляются тикеры, рассчитанные только по кэшу, потому что MOEX недоступен
+
+        Returns:
+            {"series": {ticker: {prices, returns, volatility}}, "correlation": {ticker: {ticker: значение}}}
+            (только запрошенные показатели; ключи рядов - время начала свечи)
+        """
+        metrics = frozenset(metrics)
+        key = (tuple(tickers), start_date, end_date, interval, resample_rule, metrics, window, ohlcv)
+        cached = self._results.get(key)
+        if cached is not None:
+            self._results.move_to_end(key)
+            self.stats['hits'] += 1
+            return cached
+        self.stats['misses'] += 1
+
+        request_stale: Set[str] = set()
+        series_by_ticker = await self._load(tickers, start_date, end_date, interval, resample_rule, request_stale)
+        if stale is not None:
+            stale.update(request_stale)
+
+        with stage('analytics'):
+            result = self._calculate(
+                series_by_ticker, PERIODS_PER_YEAR[resample_rule or interval],
+                date_only=resample_rule is not None or not interval.is_intraday,
+                metrics=metrics, window=window, ohlcv=ohlcv
+            )
+
+        # Исторический период с полными данными больше не изменится
+        if (
+            end_date <= last_closed_date(interval) and not request_stale
+            and all(len(series) for series in series_by_ticker.values())
+        ):
+            self._results[key] = result
+            if len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+        return result
+
+    def get_stats(self) -> Dict[str, int]:
+        """Попадания в кэш результатов и число запомненных результатов"""
+        return {**self.stats, 'entries': len(self._results)}
+
+    async def _load(
+        self,
+        tickers: List[str],
+        start_date: date,
+        end_date: date,
+        interval: CandleInterval,
+        resample_rule: Optional[ResampleRule],
+        stale: Set[str]
+    ) -> Dict[str, CandleSeries]:
+        """Ряды свечей тикеров за период, агрегированные по resample_rule"""
+        if resample_rule is not None and interval.is_intraday:
+            return await self._load_resampled(tickers, start_date, end_date, interval, resample_rule, stale)
+
+        series_by_ticker = await self.data_service.get_stock_series(tickers, start_date, end_date, interval, stale)
+        if resample_rule is None:
+            return series_by_ticker
+        with stage('analytics'):
+            return {ticker: resample(series, resample_rule) for ticker, series in series_by_ticker.items()}
+
+    async def _load_resampled(
+        self,
+        tickers: List[str],
+        start_date: date,
+        end_date: date,
+        interval: CandleInterval,
+        resample_rule: ResampleRule,
+        stale: Set[str]
+    ) -> Dict[str, CandleSeries]:
+        """Дополняет кэш внутридневных свечей и агрегирует их в PostgreSQL, не читая сами свечи"""
+        semaphore = asyncio.Semaphore(self.data_service.max_concurrency)
+
+        async def fill(ticker: str) -> None:
+            async with semaphore:
+                try:
+                    await self.data_service.fill_cache(ticker, start_date, end_date, interval)
+                except MoexUnavailableError as e:
+                    logger.warning(f"MOEX недоступен, агрегаты {ticker} считаются только по кэшу: {e}")
+                    stale.add(ticker)
+                except Exception as e:
+                    # Ошибка одного тикера не должна влиять на остальные
+                    logger.error(f"Ошибка при дополнении кэша для {ticker}: {e}")
+
+        await asyncio.gather(*(fill(ticker) for ticker in tickers))
+
+        self.stats['resampled_in_db'] += 1
+        with stage('cache_read'):
+            async with self.session_factory() as db:
+                result = await db.execute(RESAMPLE_QUERY, {
+                    'unit': resample_rule.value,
+                    'tickers': list(tickers),
+                    'interval': interval.iss_code,
+                    'start': datetime.combine(start_date, datetime.min.time()),
+                    'end': datetime.combine(end_date + timedelta(days=1), datetime.min.time()),
+                })
+                rows = result.all()
+
+        series_by_ticker = {ticker: CandleSeries() for ticker in tickers}
+        for ticker, group in groupby(rows, key=lambda row: row[0]):
+            series_by_ticker[ticker] = DataService._rows_to_series([row[1:] for row in group])
+        return series_by_ticker
+
+    @staticmethod
+    def _calculate(
+        series_by_ticker: Dict[str, CandleSeries],
+        periods_per_year: int,
+        date_only: bool,
+        metrics: frozenset,
+        window: int,
+        ohlcv: bool
+    ) -> Dict:
+        """Показатели по готовым рядам"""
+        series_result: Dict[str, Dict[str, Dict]] = {}
+        returns_by_ticker: Dict[str, Returns] = {}
+        for ticker, series in series_by_ticker.items():
+            labels = series.labels(date_only)
+            returns = log_returns(series)
+            returns_by_ticker[ticker] = returns
+
+            ticker_result: Dict[str, Dict] = {}
+            if AnalyticsMetric.PRICES in metrics:
+                ticker_result['prices'] = series.to_ohlcv_dict(date_only) if ohlcv else series.to_dict(date_only)
+            if AnalyticsMetric.RETURNS in metrics:
+                ticker_result['returns'] = {
+                    label: value for label, value in zip(labels[1:], returns[1]) if value == value
+                }
+            if AnalyticsMetric.VOLATILITY in metrics:
+                volatility = rolling_volatility(returns[1], window, periods_per_year)
+                ticker_result['volatility'] = {
+                    label: value for label, value in zip(labels[1:], volatility) if value == value
+                }
+            series_result[ticker] = ticker_result
+
+        result: Dict[str, Dict] = {'series': series_result}
+        if AnalyticsMetric.CORRELATION in metrics:
+            result['correlation'] = correlation_matrix(returns_by_ticker)
+        return result
@@ -1,25 +1,154 @@
 import logging
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Dict
+import os
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, Header, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from typing import Dict, List, Optional, Set
 import asyncio
-from database.database import get_db
+from database.database import AsyncSessionLocal, engine
+from engine.analytics import AnalyticsService
 from engine.data_service import DataService
-from models.pydantic_models import StockRequest, ApiResponse
+from engine.locks import FETCH_LOCKS, AdvisoryLocks
+from engine.metrics import (
+    HTTP_REQUEST_DURATION, PROMETHEUS_MEDIA_TYPE, REGISTRY, collect_timings, server_timing_header,
+    service_metrics, stage
+)
+from engine.moex_client import MoexClient
+from engine.rate_limit import default_rate_limiter
+from engine.resilience import deadline_scope
+from engine.scheduler import PrefetchScheduler
+from engine.securities import SECURITIES_DIRECTORY, SecuritiesDirectory
+from engine.columnar import (
+    ARROW_AVAILABLE, ARROW_MEDIA_TYPE, PARQUET_MEDIA_TYPE,
+    encode_arrow, encode_parquet, to_arrow_ipc, to_parquet
+)
+from engine.streaming import ENCODERS, STREAM_MEDIA_TYPES, encode_csv, encode_ndjson, negotiate_media_type
+from models.pydantic_models import (
+    StockRequest, ExportRequest, StreamRequest, StreamFormat, AnalyticsRequest, ApiResponse
+)
 from database_manager import setup_database
 
-# Настройка логирования
+# Настройка логирования (подробные логи обработки запросов выводятся на уровне DEBUG)
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
-app = FastAPI(title="MOEX Data Fetcher", version="1.0.0")
+# Создавать базу данных и мигрировать схему при запуске (false - миграция выполняется отдельно:
+# python database_manager.py)
+DB_MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Жизненный цикл приложения: создаем базу данных если не существует,
+    открываем общий MOEX клиент на время работы, запускаем фоновый прогрев кэша
+    и останавливаем все при остановке
+    """
+    if DB_MIGRATE_ON_STARTUP:
+        await setup_database()
+    
+    moex_client = MoexClient(rate_limiter=default_rate_limiter())
+    await moex_client.start()
+    app.state.moex_client = moex_client
+    locks = AdvisoryLocks(engine) if FETCH_LOCKS else None
+    securities = SecuritiesDirectory(moex_client, AsyncSessionLocal, locks) if SECURITIES_DIRECTORY else None
+    if securities is not None:
+        await securities.start()
+    app.state.securities = securities
+    app.state.data_service = DataService(
+        AsyncSessionLocal, moex_client=moex_client, locks=locks, securities=securities
+    )
+    app.state.analytics = AnalyticsService(app.state.data_service, AsyncSessionLocal)
+    REGISTRY.set_collector('data_service', lambda: service_metrics(app.state.data_service.get_cache_stats()))
+    
+    scheduler = PrefetchScheduler(app.state.data_service, AsyncSessionLocal)
+    await scheduler.start()
+    app.state.scheduler = scheduler
+    
+    try:
+        yield
+    finally:
+        await scheduler.stop()
+        if securities is not None:
+            await securities.stop()
+        await moex_client.close()
+        if locks is not None:
+            await locks.close()
+        await engine.dispose()
+
+# Срок запроса к /fetch-stock-data по умолчанию, секунды (клиент задает свой заголовком X-Request-Timeout)
+API_REQUEST_TIMEOUT = float(os.getenv("API_REQUEST_TIMEOUT", "25"))
+
+# Наибольший срок, который клиент может задать заголовком X-Request-Timeout, секунды
+API_MAX_REQUEST_TIMEOUT = float(os.getenv("API_MAX_REQUEST_TIMEOUT", "300"))
+
+# Добавлять к ответам заголовок Server-Timing со временем этапов обработки запроса
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() in ("1", "true", "yes")
 
-@app.on_event("startup")
-async def startup_event():
-    """Событие запуска приложения - создаем базу данных если не существует"""
-    await setup_database()
+# Колоночные форматы доступны только с установленным pyarrow
+COLUMNAR_MEDIA_TYPES = [ARROW_MEDIA_TYPE, PARQUET_MEDIA_TYPE] if ARROW_AVAILABLE else []
+
+EXPORT_ENCODERS = {
+    ARROW_MEDIA_TYPE: encode_arrow,
+    PARQUET_MEDIA_TYPE: encode_parquet,
+    STREAM_MEDIA_TYPES[StreamFormat.NDJSON]: encode_ndjson,
+    STREAM_MEDIA_TYPES[StreamFormat.CSV]: encode_csv,
+}
+
+app = FastAPI(title="MOEX Data Fetcher", version="1.0.0", lifespan=lifespan)
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    """Время обработки запроса для /metrics и, если включено, заголовок Server-Timing"""
+    started = time.perf_counter()
+    with collect_timings() as timings:
+        response = await call_next(request)
+    elapsed = time.perf_counter() - started
+    
+    endpoint = request.scope.get("endpoint")
+    HTTP_REQUEST_DURATION.observe(
+        elapsed,
+        method=request.method,
+        handler=endpoint.__name__ if endpoint is not None else "unmatched",
+        status=str(response.status_code)
+    )
+    if SERVER_TIMING:
+        # Для потоковых ответов учитывается время до начала отправки тела
+        response.headers["Server-Timing"] = server_timing_header(timings, elapsed)
+    return response
+
+def get_data_service(request: Request) -> DataService:
+    """Возвращает общий сервис данных приложения"""
+    return request.app.state.data_service
+
+def get_analytics_service(request: Request) -> AnalyticsService:
+    """Возвращает общий сервис агрегатов приложения"""
+    return request.app.state.analytics
+
+def get_securities(request: Request) -> Optional[SecuritiesDirectory]:
+    """Возвращает справочник бумаг приложения (None - тикеры не проверяются)"""
+    return request.app.state.securities
+
+async def reject_unknown_tickers(securities: Optional[SecuritiesDirectory], tickers: List[str]) -> None:
+    """Отклоняет запрос с тикерами, которых нет на ISS, до обращения к кэшу и бирже"""
+    if securities is None:
+        return
+    unknown = await securities.find_unknown(tickers)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Неизвестные тикеры: {', '.join(unknown)}")
+
+def request_timeout(x_request_timeout: Optional[float]) -> float:
+    """Срок запроса к API из заголовка X-Request-Timeout; недопустимый срок отклоняется с кодом 400"""
+    if x_request_timeout is None:
+        return API_REQUEST_TIMEOUT
+    if not 0 < x_request_timeout <= API_MAX_REQUEST_TIMEOUT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"X-Request-Timeout должен быть больше 0 и не больше {API_MAX_REQUEST_TIMEOUT:g} секунд"
+        )
+    return x_request_timeout
 
 @app.get("/", response_model=ApiResponse)
 async def root():
@@ -32,21 +161,156 @@ async def root():
 @app.post("/fetch-stock-data", response_model=ApiResponse)
 async def fetch_stock_data(
     request: StockRequest,
-    db: AsyncSession = Depends(get_db)
+    data_service: DataService = Depends(get_data_service),
+    securities: Optional[SecuritiesDirectory] = Depends(get_securities),
+    accept: Optional[str] = Header(None),
+    x_request_timeout: Optional[float] = Header(None)
 ):
     """
     Получает данные по акциям с Московской биржи
+    
+    По заголовку Accept отдает JSON (по умолчанию), Arrow IPC stream или Parquet.
+    Запросы к MOEX укладываются в срок X-Request-Timeout (секунды, по умолчанию API_REQUEST_TIMEOUT,
+    не больше API_MAX_REQUEST_TIMEOUT; иначе запрос отклоняется с кодом 400);
+    если MOEX недоступен или срок истек, тикеры отдаются из кэша и перечисляются в stale
+    (для Arrow и Parquet - в заголовке X-Stale-Tickers). Тикеры, которых нет на ISS, отклоняются с кодом 400.
     """
+    media_type = negotiate_media_type(accept, ["application/json", *COLUMNAR_MEDIA_TYPES])
+    if media_type is None:
+        raise HTTPException(status_code=406, detail="Неподдерживаемый формат ответа")
+    timeout = request_timeout(x_request_timeout)
+    await reject_unknown_tickers(securities, request.tickers)
+    
+    stale: Set[str] = set()
     try:
-        data_service = DataService(db)
-        result = await data_service.get_stock_data(
-            tickers=request.tickers,
-            start_date=request.start_date,
-            end_date=request.end_date
-        )
-        return ApiResponse(success=True, data=result)
+        with deadline_scope(timeout):
+            if media_type != "application/json":
+                series_by_ticker = await data_service.get_stock_series(
+                    tickers=request.tickers,
+                    start_date=request.start_date,
+                    end_date=request.end_date,
+                    interval=request.interval,
+                    stale=stale
+                )
+                encode = to_arrow_ipc if media_type == ARROW_MEDIA_TYPE else to_parquet
+                with stage('serialize'):
+                    body = encode(series_by_ticker, ohlcv=request.ohlcv)
+                headers = {"X-Stale-Tickers": ",".join(sorted(stale))} if stale else None
+                return Response(body, media_type=media_type, headers=headers)
+            
+            result = await data_service.get_stock_data(
+                tickers=request.tickers,
+                start_date=request.start_date,
+                end_date=request.end_date,
+                interval=request.interval,
+                ohlcv=request.ohlcv,
+                stale=stale
+            )
+        return ApiResponse(success=True, data=result, stale=sorted(stale) or None)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logging.error(f"Ошибка при получении данных: {e}")
-        raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
+
+@app.post("/analytics", response_model=ApiResponse)
+async def analytics(
+    request: AnalyticsRequest,
+    analytics_service: AnalyticsService = Depends(get_analytics_service),
+    securities: Optional[SecuritiesDirectory] = Depends(get_securities),
+    x_request_timeout: Optional[float] = Header(None)
+):
+    """
+    Агрегаты по акциям: ресемплинг, логарифмические доходности, скользящая волатильность и корреляции
+    
+    Считаются на сервере по кэшированным (при необходимости дополненным с MOEX) свечам,
+    поэтому клиенту не нужно выгружать сырые цены. Срок, stale и проверка тикеров - как у /fetch-stock-data.
+    """
+    timeout = request_timeout(x_request_timeout)
+    await reject_unknown_tickers(securities, request.tickers)
+    stale: Set[str] = set()
+    try:
+        with deadline_scope(timeout):
+            result = await analytics_service.compute(
+                tickers=request.tickers,
+                start_date=request.start_date,
+                end_date=request.end_date,
+                interval=request.interval,
+                resample_rule=request.resample,
+                metrics=request.metrics,
+                window=request.window,
+                ohlcv=request.ohlcv,
+                stale=stale
+            )
+        return ApiResponse(success=True, data=result, stale=sorted(stale) or None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logging.error(f"Ошибка при расчете агрегатов: {e}")
+        raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
+
+@app.post("/stream-stock-data")
+async def stream_stock_data(
+    request: StreamRequest,
+    data_service: DataService = Depends(get_data_service),
+    securities: Optional[SecuritiesDirectory] = Depends(get_securities)
+):
+    """
+    Потоково отдает данные по акциям в NDJSON или CSV
+    
+    Каждый тикер отправляется, как только его данные готовы; память не зависит от длины периода и числа тикеров.
+    """
+    await reject_unknown_tickers(securities, request.tickers)
+    batches = data_service.stream_stock_data(
+        tickers=request.tickers,
+        start_date=request.start_date,
+        end_date=request.end_date,
+        interval=request.interval
+    )
+    body = ENCODERS[request.format](batches, date_only=not request.interval.is_intraday, ohlcv=request.ohlcv)
+    return StreamingResponse(body, media_type=STREAM_MEDIA_TYPES[request.format])
+
+@app.post("/export-stock-data")
+async def export_stock_data(
+    request: ExportRequest,
+    data_service: DataService = Depends(get_data_service),
+    securities: Optional[SecuritiesDirectory] = Depends(get_securities),
+    accept: Optional[str] = Header(None)
+):
+    """
+    Потоковая выгрузка данных по акциям для аналитики
+    
+    Формат выбирается по заголовку Accept: Arrow IPC stream (по умолчанию), Parquet, NDJSON или CSV.
+    """
+    offered = [*COLUMNAR_MEDIA_TYPES, STREAM_MEDIA_TYPES[StreamFormat.NDJSON], STREAM_MEDIA_TYPES[StreamFormat.CSV]]
+    media_type = negotiate_media_type(accept, offered)
+    if media_type is None:
+        raise HTTPException(status_code=406, detail="Неподдерживаемый формат ответа")
+    await reject_unknown_tickers(securities, request.tickers)
+    
+    batches = data_service.stream_stock_data(
+        tickers=request.tickers,
+        start_date=request.start_date,
+        end_date=request.end_date,
+        interval=request.interval
+    )
+    body = EXPORT_ENCODERS[media_type](batches, date_only=not request.interval.is_intraday, ohlcv=request.ohlcv)
+    return StreamingResponse(body, media_type=media_type)
+
+@app.get("/cache-stats", response_model=ApiResponse)
+async def cache_stats(
+    data_service: DataService = Depends(get_data_service),
+    analytics_service: AnalyticsService = Depends(get_analytics_service)
+):
+    """Статистика попаданий в кэш"""
+    return ApiResponse(success=True, data={**data_service.get_cache_stats(), 'analytics': analytics_service.get_stats()})
+
+@app.get("/metrics")
+async def metrics():
+    """Метрики в формате Prometheus: время этапов и запросов, попадания в кэш, запросы к ISS"""
+    return Response(REGISTRY.render(), media_type=PROMETHEUS_MEDIA_TYPE)
+
+@app.get("/prefetch-status", response_model=ApiResponse)
+async def prefetch_status(request: Request):
+    """Состояние фонового прогрева кэша"""
+    return ApiResponse(success=True, data=request.app.state.scheduler.get_status())
@@ -0,0 +1,161 @@
+"""
+Колоночная выдача данных в Arrow IPC (stream) и Parquet
+
+pyarrow - необязательная зависимость (poetry install -E arrow); без нее ARROW_AVAILABLE = False
+и эти форматы не предлагаются при согласовании содержимого.
+
+Колонки CandleSeries передаются в Arrow без копирования: буферы array('q') и array('d')
+оборачиваются как есть, поэтому отсутствующие значения остаются NaN, а не null.
+"""
+
+import io
+from typing import AsyncIterator, Dict, List, Tuple
+
+from .series import VALUE_COLUMNS, CandleSeries
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    ARROW_AVAILABLE = True
+except ImportError:
+    pa = None
+    pq = None
+    ARROW_AVAILABLE = False
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
+# Строк в одной группе строк Parquet при потоковой записи
+PARQUET_ROW_GROUP_SIZE = 100_000
+
+
+def candle_schema(ohlcv: bool = False) -> "pa.Schema":
+    """Схема выдачи: тикер (словарь), время начала свечи и цена закрытия или все поля свечи"""
+    return pa.schema([
+        ('ticker', pa.dictionary(pa.int32(), pa.string())),
+        ('time', pa.timestamp('s')),
+        *((name, pa.float64()) for name in (VALUE_COLUMNS if ohlcv else ('close',))),
+    ])
+
+
+def series_to_batch(ticker: str, series: CandleSeries, ohlcv: bool = False) -> "pa.RecordBatch":
+    """
+    Пачка Arrow из ряда свечей одного тикера без копирования колонок
+    
+    Args:
+        ticker: Тикер акции
+        series: Ряд свечей
+        ohlcv: Все поля свечи, а не только цена закрытия
+    """
+    size = len(series)
+    schema = candle_schema(ohlcv)
+    columns = series.columns() if ohlcv else (series.close,)
+    tickers = pa.DictionaryArray.from_arrays(
+        pa.repeat(pa.scalar(0, pa.int32()), size), pa.array([ticker], pa.string())
+    )
+    return pa.RecordBatch.from_arrays(
+        [
+            tickers,
+            pa.Array.from_buffers(pa.timestamp('s'), size, [None, pa.py_buffer(series.ts)]),
+            *(pa.Array.from_buffers(pa.float64(), size, [None, pa.py_buffer(column)]) for column in columns),
+        ],
+        schema=schema
+    )
+
+
+def to_arrow_ipc(series_by_ticker: Dict[str, CandleSeries], ohlcv: bool = False) -> bytes:
+    """Arrow IPC stream с пачкой на тикер"""
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, candle_schema(ohlcv)) as writer:
+        for ticker, series in series_by_ticker.items():
+            writer.write_batch(series_to_batch(ticker, series, ohlcv))
+    return sink.getvalue().to_pybytes()
+
+
+def to_parquet(series_by_ticker: Dict[str, CandleSeries], ohlcv: bool = False) -> bytes:
+    """Файл Parquet со всеми тикерами"""
+    table = pa.Table.from_batches(
+        [series_to_batch(ticker, series, ohlcv) for ticker, series in series_by_ticker.items()],
+        schema=candle_schema(ohlcv)
+    )
+    sink = pa.BufferOutputStream()
+    pq.write_table(table, sink)
+    return sink.getvalue().to_pybytes()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Файлоподобный приемник, из которого записанные байты забираются по частям"""
+    
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+    
+    def writable(self) -> bool:
+        return True
+    
+    def write(self, data) -> int:
+        # pyarrow переиспользует свой буфер, поэтому данные копируются
+        chunk = bytes(data)
+        self._chunks.append(chunk)
+        self._position += len(chunk)
+        return len(chunk)
+    
+    def tell(self) -> int:
+        return self._position
+    
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def encode_arrow(
+    batches: AsyncIterator[Tuple[str, CandleSeries]],
+    date_only: bool = True,
+    ohlcv: bool = False
+) -> AsyncIterator[bytes]:
+    """
+    Кодирует пачки свечей в Arrow IPC stream по мере поступления
+    
+    Args:
+        batches: Пары (тикер, пачка свечей)
+        date_only: Не используется: время всегда передается как timestamp[s]
+        ohlcv: Все поля свечи, а не только цена закрытия
+    """
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(sink, candle_schema(ohlcv)) as writer:
+        async for ticker, series in batches:
+            writer.write_batch(series_to_batch(ticker, series, ohlcv))
+            yield sink.drain()
+    yield sink.drain()
+
+
+async def encode_parquet(
+    batches: AsyncIterator[Tuple[str, CandleSeries]],
+    date_only: bool = True,
+    ohlcv: bool = False
+) -> AsyncIterator[bytes]:
+    """
+    Кодирует пачки свечей в Parquet, отдавая каждую группу строк сразу после записи
+    
+    Args:
+        batches: Пары (тикер, пачка свечей)
+        date_only: Не используется: время всегда передается как timestamp[s]
+        ohlcv: Все поля свечи, а не только цена закрытия
+    """
+    schema = candle_schema(ohlcv)
+    sink = _ChunkSink()
+    pending: List["pa.RecordBatch"] = []
+    pending_rows = 0
+    with pq.ParquetWriter(sink, schema) as writer:
+        async for ticker, series in batches:
+            pending.append(series_to_batch(ticker, series, ohlcv))
+            pending_rows += len(series)
+            if pending_rows >= PARQUET_ROW_GROUP_SIZE:
+                writer.write_table(pa.Table.from_batches(pending, schema=schema))
+                pending, pending_rows = [], 0
+                yield sink.drain()
+        if pending:
+            writer.write_table(pa.Table.from_batches(pending, schema=schema))
+    yield sink.drain()
@@ -0,0 +1,121 @@
+"""
+Работа с интервалами покрытия кэша и планирование запросов к MOEX
+
+Интервалы задаются парами дат (start_date, end_date) включительно.
+Функции модуля не обращаются к базе данных.
+"""
+
+from datetime import date, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from models.candle import CandleInterval
+
+Interval = Tuple[date, date]
+
+ONE_DAY = timedelta(days=1)
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """
+    Объединяет пересекающиеся и соседние интервалы
+    
+    Args:
+        intervals: Интервалы в произвольном порядке
+        
+    Returns:
+        Отсортированный список непересекающихся интервалов
+    """
+    merged: List[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + ONE_DAY:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_intervals(start_date: date, end_date: date, covered: Iterable[Interval]) -> List[Interval]:
+    """
+    Вычисляет части периода, не попадающие ни в один из интервалов
+    
+    Args:
+        start_date: Дата начала периода
+        end_date: Дата окончания периода
+        covered: Покрытые интервалы
+        
+    Returns:
+        Отсортированный список непокрытых интервалов
+    """
+    uncovered: List[Interval] = []
+    current = start_date
+    for start, end in merge_intervals(covered):
+        if end < current:
+            continue
+        if start > end_date:
+            break
+        if start > current:
+            uncovered.append((current, start - ONE_DAY))
+        current = end + ONE_DAY
+        if current > end_date:
+            return uncovered
+    if current <= end_date:
+        uncovered.append((current, end_date))
+    return uncovered
+
+
+def last_closed_date(interval: CandleInterval, today: Optional[date] = None) -> date:
+    """
+    Последний день, свечи интервала за который уже не изменятся
+    
+    Свеча меняется до конца своего периода, а ISS отбирает свечи по дате начала: недельная свеча
+    начинается в понедельник и окончательна только после воскресенья, остальные - после конца дня.
+    
+    Args:
+        interval: Интервал свечей
+        today: Текущая дата (по умолчанию - сегодня)
+        
+    Returns:
+        Дата окончания последнего закрытого периода свечей
+    """
+    today = today or date.today()
+    if interval == CandleInterval.WEEK_1:
+        # Воскресенье перед текущей неделей
+        return today - timedelta(days=today.weekday() + 1)
+    return today - ONE_DAY
+
+
+def dates_to_intervals(dates: Iterable[date]) -> List[Interval]:
+    """
+    Сворачивает набор дат в интервалы подряд идущих дней
+    
+    Args:
+        dates: Даты в произвольном порядке
+        
+    Returns:
+        Отсортированный список интервалов
+    """
+    return merge_intervals((day, day) for day in dates)
+
+
+def plan_fetch_ranges(missing_dates: Iterable[date], max_gap_days: int = 0) -> List[Interval]:
+    """
+    Строит минимальный набор периодов для запроса недостающих дат у MOEX
+    
+    Соседние периоды, разделенные не более чем max_gap_days уже известными днями,
+    объединяются: один запрос с небольшим перекрытием дешевле нескольких.
+    
+    Args:
+        missing_dates: Недостающие даты
+        max_gap_days: Максимальный размер объединяемого промежутка в днях
+        
+    Returns:
+        Отсортированный список периодов (start_date, end_date)
+    """
+    ranges: List[Interval] = []
+    for start, end in dates_to_intervals(missing_dates):
+        if ranges and (start - ranges[-1][1]).days - 1 <= max_gap_days:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
@@ -1,123 +1,509 @@
+import asyncio
 import logging
-from typing import List, Dict, Optional, Set
-from datetime import date, timedelta
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import and_, select
-from models.stock_data import StockData
+import os
+from array import array
+from contextlib import nullcontext
+from typing import AsyncIterator, List, Dict, Optional, Set, Tuple
+from datetime import date, datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy import String, and_, any_, cast, select, text
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from models.candle import Candle, CandleInterval
+from models.stock_coverage import StockCoverage
+from .coverage import Interval, last_closed_date, merge_intervals, plan_fetch_ranges, subtract_intervals
+from .hot_cache import HotCache
+from .locks import AdvisoryLocks
+from .metrics import stage
+from .resilience import MoexUnavailableError
+from .securities import SecuritiesDirectory
+from .series import CandleSeries, NAN, to_timestamp
+from .single_flight import SingleFlight
 from .moex_client import MoexClient
 
 logger = logging.getLogger(__name__)
 
+# Максимальное число тикеров, обрабатываемых одновременно
+MAX_CONCURRENT_TICKERS = int(os.getenv("MAX_CONCURRENT_TICKERS", "5"))
+
+# Начиная с этого числа строк запись в кэш идет через COPY во временную таблицу
+CACHE_COPY_THRESHOLD = int(os.getenv("CACHE_COPY_THRESHOLD", "200"))
+
+# Промежутки уже известных дней до этого размера объединяются в один запрос к MOEX
+FETCH_MERGE_GAP_DAYS = int(os.getenv("FETCH_MERGE_GAP_DAYS", "7"))
+
+# Строк, читаемых из серверного курсора за раз при потоковой выдаче
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "5000"))
+
+# Строк в одном INSERT (9 параметров на строку, лимит asyncpg - 32767 параметров)
+UPSERT_CHUNK_SIZE = 3000
+
+# Колонки таблицы candles в порядке записи
+CANDLE_COLUMNS = ['ticker', 'interval', 'ts', 'open', 'high', 'low', 'close', 'volume', 'value']
+
+# Не переписываем свечи, значения в которых не изменились
+CANDLE_CHANGED = (
+    "(candles.open, candles.high, candles.low, candles.close, candles.volume, candles.value) "
+    "IS DISTINCT FROM "
+    "(EXCLUDED.open, EXCLUDED.high, EXCLUDED.low, EXCLUDED.close, EXCLUDED.volume, EXCLUDED.value)"
+)
+
+CandleRecord = Tuple[str, int, datetime, Optional[float], Optional[float], Optional[float], float, Optional[int], Optional[float]]
+
 class DataService:
     """Асинхронный сервис для работы с данными акций"""
     
-    def __init__(self, db: AsyncSession):
-        self.db = db
-        self.moex_client = MoexClient()
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        moex_client: Optional[MoexClient] = None,
+        max_concurrency: Optional[int] = None,
+        hot_cache: Optional[HotCache] = None,
+        locks: Optional[AdvisoryLocks] = None,
+        securities: Optional[SecuritiesDirectory] = None
+    ):
+        """
+        Args:
+            session_factory: Фабрика асинхронных сессий (каждый тикер работает в своей сессии)
+            moex_client: Общий клиент MOEX (если не передан, создается собственный)
+            max_concurrency: Ограничение на число одновременно обрабатываемых тикеров
+            hot_cache: Кэш в памяти перед базой данных (если не передан, создается собственный)
+            locks: Блокировки для согласования загрузок с другими процессами (None - процесс единственный)
+            securities: Справочник бумаг: рынок для запросов свечей и даты торгов (None - рынок акций,
+                период запрашивается целиком)
+        """
+        self.session_factory = session_factory
+        self.moex_client = moex_client or MoexClient()
+        self.hot_cache = hot_cache or HotCache()
+        self.locks = locks
+        self.securities = securities
+        self.single_flight = SingleFlight()
+        self.max_concurrency = max_concurrency or MAX_CONCURRENT_TICKERS
+        
+        # Счетчики попаданий в кэш
+        self.cache_stats = {
+            'ticker_requests': 0,  # Обработано тикеров
+            'cache_hits': 0,       # Тикеров, полностью обслуженных из кэша
+            'upstream_calls': 0,   # Запросов к MOEX
+            'rows_written': 0,     # Свечей записано в кэш
+            'stale_served': 0      # Тикеров, отданных только из кэша, пока MOEX недоступен
+        }
     
-    async def get_cached_data(self, ticker: str, start_date: date, end_date: date) -> List[Dict]:
+    async def get_cached_data(
+        self,
+        db: AsyncSession,
+        ticker: str,
+        start_date: date,
+        end_date: date,
+        interval: CandleInterval = CandleInterval.DAY_1
+    ) -> CandleSeries:
         """
         Асинхронно получает данные из кэша (базы данных)
         
         Args:
+            db: Сессия базы данных
             ticker: Тикер акции
             start_date: Дата начала периода
             end_date: Дата окончания периода
+            interval: Интервал свечей
             
         Returns:
-            Список словарей с данными о ценах
+            Ряд свечей, начинающихся в период
         """
         try:
-            query = select(StockData).where(
-                and_(
-                    StockData.ticker == ticker,
-                    StockData.date >= start_date,
-                    StockData.date <= end_date
-                )
-            ).order_by(StockData.date)
+            # Выполняем через соединение сессии: строки не проходят слой загрузки ORM
+            connection = await db.connection()
+            result = await connection.execute(self._candles_query(ticker, start_date, end_date, interval))
+            cached_data = self._rows_to_series(result.all())
             
-            result = await self.db.execute(query)
-            cached_data = result.scalars().all()
+            logger.debug(f"Найдено {len(cached_data)} записей в кэше для {ticker}")
+            return cached_data
             
-            # Создаем новый список для каждого запроса
-            data_list = [
-                {
-                    'date': record.date,
-                    'price': record.price
-                }
-                for record in cached_data
-            ]
+        except Exception as e:
+            logger.error(f"Ошибка при получении данных из кэша для {ticker}: {e}")
+            return CandleSeries()
+    
+    async def get_cached_data_many(
+        self,
+        db: AsyncSession,
+        tickers: List[str],
+        start_date: date,
+        end_date: date,
+        interval: CandleInterval = CandleInterval.DAY_1
+    ) -> Dict[str, CandleSeries]:
+        """
+        Получает данные из кэша по нескольким тикерам одним запросом
+        
+        Строки всех тикеров выбираются по ticker = ANY(...) и раскладываются по тикерам за один проход,
+        поэтому число обращений к базе данных не зависит от числа тикеров.
+        
+        Args:
+            db: Сессия базы данных
+            tickers: Тикеры акций
+            start_date: Дата начала периода
+            end_date: Дата окончания периода
+            interval: Интервал свечей
             
-            logger.info(f"Найдено {len(data_list)} записей в кэше для {ticker}")
-            return data_list
+        Returns:
+            Словарь {ticker: ряд свечей}; у тикеров без данных в кэше ряд пустой
+        """
+        rows_by_ticker: Dict[str, List] = {ticker: [] for ticker in tickers}
+        try:
+            # Тикер выбирается последней колонкой, чтобы строки подходили для _rows_to_series
+            query = self._candles_query_many(tickers, start_date, end_date, interval)
+            connection = await db.connection()
+            result = await connection.execute(query.add_columns(Candle.ticker))
+            for row in result.all():
+                rows_by_ticker[row[-1]].append(row)
             
         except Exception as e:
-            logger.error(f"Ошибка при получении данных из кэша для {ticker}: {e}")
-            return []
+            logger.error(f"Ошибка при получении данных из кэша для {len(tickers)} тикеров: {e}")
+            return {ticker: CandleSeries() for ticker in tickers}
+        
+        logger.debug(f"Найдено {sum(map(len, rows_by_ticker.values()))} записей в кэше для {len(tickers)} тикеров")
+        return {ticker: self._rows_to_series(rows) for ticker, rows in rows_by_ticker.items()}
     
-    async def save_data_to_cache(self, ticker: str, data: List[Dict]) -> None:
+    async def stream_cached_data(
+        self,
+        db: AsyncSession,
+        ticker: str,
+        start_date: date,
+        end_date: date,
+        interval: CandleInterval = CandleInterval.DAY_1
+    ) -> AsyncIterator[CandleSeries]:
+        """
+        Читает данные из кэша через серверный курсор пачками по STREAM_BATCH_SIZE строк
+        
+        Args:
+            db: Сессия базы данных
+            ticker: Тикер акции
+            start_date: Дата начала периода
+            end_date: Дата окончания периода
+            interval: Интервал свечей
+            
+        Yields:
+            Ряды свечей по возрастанию времени
+        """
+        query = self._candles_query(ticker, start_date, end_date, interval)
+        result = await db.stream(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield self._rows_to_series(rows)
+    
+    def _candles_query(self, ticker: str, start_date: date, end_date: date, interval: CandleInterval):
+        """Выборка свечей тикера за период по возрастанию времени"""
+        return self._select_candles(Candle.ticker == ticker, start_date, end_date, interval).order_by(Candle.ts)
+    
+    def _candles_query_many(self, tickers: List[str], start_date: date, end_date: date, interval: CandleInterval):
+        """Выборка свечей нескольких тикеров за период по тикеру и возрастанию времени"""
+        # Один параметр-массив вместо отдельного параметра на каждый тикер
+        return self._select_candles(
+            Candle.ticker == any_(cast(tickers, ARRAY(String))), start_date, end_date, interval
+        ).order_by(Candle.ticker, Candle.ts)
+    
+    def _select_candles(self, ticker_filter, start_date: date, end_date: date, interval: CandleInterval):
+        """Колонки свечей (ts, open, high, low, close, volume, value) за период"""
+        # Выбираем только нужные колонки, без создания ORM объектов
+        return select(
+            Candle.ts, Candle.open, Candle.high, Candle.low, Candle.close, Candle.volume, Candle.value
+        ).where(
+            and_(
+                ticker_filter,
+                Candle.interval == interval.iss_code,
+                Candle.ts >= datetime.combine(start_date, datetime.min.time()),
+                Candle.ts < datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+            )
+        )
+    
+    @staticmethod
+    def _rows_to_series(rows) -> CandleSeries:
+        """Строит ряд из упорядоченных по времени строк (ts, open, high, low, close, volume, value)"""
+        return CandleSeries(
+            array('q', [to_timestamp(row[0]) for row in rows]),
+            *(
+                array('d', [NAN if row[column] is None else row[column] for row in rows])
+                for column in range(1, 7)
+            )
+        )
+    
+    async def save_data_to_cache(
+        self,
+        db: AsyncSession,
+        ticker: str,
+        data: CandleSeries,
+        interval: CandleInterval = CandleInterval.DAY_1
+    ) -> None:
         """
         Асинхронно сохраняет данные в кэш (базу данных)
         
         Args:
+            db: Сессия базы данных
+            ticker: Тикер акции
+            data: Ряд свечей
+            interval: Интервал свечей
+        """
+        await self.save_batch_to_cache(db, {ticker: data}, interval)
+    
+    async def save_batch_to_cache(
+        self,
+        db: AsyncSession,
+        data_by_ticker: Dict[str, CandleSeries],
+        interval: CandleInterval = CandleInterval.DAY_1
+    ) -> None:
+        """
+        Сохраняет данные нескольких тикеров в кэш одной операцией upsert
+        
+        Небольшие пачки записываются одним INSERT ... ON CONFLICT (ticker, interval, ts) DO UPDATE,
+        большие загружаются через COPY во временную таблицу и сливаются в candles.
+        
+        Args:
+            db: Сессия базы данных
+            data_by_ticker: Словарь {ticker: ряд свечей}
+            interval: Интервал свечей
+        """
+        # Ряды не содержат повторов времени, поэтому upsert не изменит одну строку дважды
+        rows = [
+            record
+            for ticker, data in data_by_ticker.items()
+            for record in self._to_records(ticker, interval, data)
+        ]
+        if not rows:
+            return
+        
+        tickers = ', '.join(data_by_ticker)
+        try:
+            with stage('cache_write'):
+                if len(rows) >= CACHE_COPY_THRESHOLD:
+                    await self._copy_upsert(db, rows)
+                else:
+                    await self._insert_upsert(db, rows)
+                
+                await db.commit()
+            self.cache_stats['rows_written'] += len(rows)
+            logger.debug(f"Сохранено {len(rows)} записей в кэш для {tickers}")
+            
+            # Обновляем уже загруженные в память тикеры
+            for ticker, data in data_by_ticker.items():
+                self.hot_cache.update(ticker, interval, data)
+            
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Ошибка при сохранении данных в кэш для {tickers}: {e}")
+            raise
+    
+    def _to_records(self, ticker: str, interval: CandleInterval, data: CandleSeries) -> List[CandleRecord]:
+        """Строки таблицы candles для ряда свечей"""
+        return [
+            (
+                ticker, interval.iss_code, moment, open_price, high, low, close,
+                None if volume is None else int(volume), value
+            )
+            for moment, open_price, high, low, close, volume, value in data
+        ]
+    
+    async def _insert_upsert(self, db: AsyncSession, rows: List[CandleRecord]) -> None:
+        """Записывает строки многострочным INSERT ... ON CONFLICT DO UPDATE"""
+        for offset in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            chunk = rows[offset:offset + UPSERT_CHUNK_SIZE]
+            stmt = insert(Candle).values([dict(zip(CANDLE_COLUMNS, row)) for row in chunk])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Candle.ticker, Candle.interval, Candle.ts],
+                set_={
+                    'open': stmt.excluded.open,
+                    'high': stmt.excluded.high,
+                    'low': stmt.excluded.low,
+                    'close': stmt.excluded.close,
+                    'volume': stmt.excluded.volume,
+                    'value': stmt.excluded.value
+                },
+                where=text(CANDLE_CHANGED)
+            )
+            await db.execute(stmt)
+    
+    async def _copy_upsert(self, db: AsyncSession, rows: List[CandleRecord]) -> None:
+        """Загружает строки через COPY во временную таблицу и сливает их в candles"""
+        # Временная таблица создается в текущей транзакции и удаляется при commit
+        await db.execute(text("""
+            CREATE TEMP TABLE candles_stage (LIKE candles INCLUDING DEFAULTS) ON COMMIT DROP
+        """))
+        
+        connection = await db.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            'candles_stage',
+            records=rows,
+            columns=CANDLE_COLUMNS
+        )
+        
+        await db.execute(text(f"""
+            INSERT INTO candles ({', '.join(CANDLE_COLUMNS)})
+            SELECT {', '.join(CANDLE_COLUMNS)} FROM candles_stage
+            ON CONFLICT (ticker, interval, ts) DO UPDATE
+            SET open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low,
+                close = EXCLUDED.close, volume = EXCLUDED.volume, value = EXCLUDED.value
+            WHERE {CANDLE_CHANGED}
+        """))
+    
+    async def get_covered_intervals(
+        self,
+        db: AsyncSession,
+        ticker: str,
+        start_date: date,
+        end_date: date,
+        interval: CandleInterval = CandleInterval.DAY_1
+    ) -> List[Interval]:
+        """
+        Получает интервалы, уже запрошенные у MOEX и пересекающие период
+        
+        Args:
+            db: Сессия базы данных
             ticker: Тикер акции
-            data: Список словарей с данными о ценах
+            start_date: Дата начала периода
+            end_date: Дата окончания периода
+            interval: Интервал свечей
+            
+        Returns:
+            Отсортированный список непересекающихся интервалов (start_date, end_date)
         """
         try:
-            for item in data:
-                # Проверяем, существует ли уже запись
-                query = select(StockData).where(
+            query = select(StockCoverage.start_date, StockCoverage.end_date).where(
+                and_(
+                    StockCoverage.ticker == ticker,
+                    StockCoverage.interval == interval.iss_code,
+                    StockCoverage.start_date <= end_date,
+                    StockCoverage.end_date >= start_date
+                )
+            )
+            result = await db.execute(query)
+            return merge_intervals((row.start_date, row.end_date) for row in result)
+            
+        except Exception as e:
+            logger.error(f"Ошибка при получении покрытия кэша для {ticker}: {e}")
+            return []
+    
+    async def get_covered_intervals_many(
+        self,
+        db: AsyncSession,
+        tickers: List[str],
+        start_date: date,
+        end_date: date,
+        interval: CandleInterval = CandleInterval.DAY_1
+    ) -> Dict[str, List[Interval]]:
+        """
+        Получает интервалы, уже запрошенные у MOEX, по нескольким тикерам одним запросом
+        
+        Returns:
+            Словарь {ticker: отсортированный список непересекающихся интервалов}
+        """
+        intervals_by_ticker: Dict[str, List[Interval]] = {ticker: [] for ticker in tickers}
+        try:
+            query = select(StockCoverage.ticker, StockCoverage.start_date, StockCoverage.end_date).where(
+                and_(
+                    StockCoverage.ticker == any_(cast(tickers, ARRAY(String))),
+                    StockCoverage.interval == interval.iss_code,
+                    StockCoverage.start_date <= end_date,
+                    StockCoverage.end_date >= start_date
+                )
+            )
+            result = await db.execute(query)
+            for row in result:
+                intervals_by_ticker[row.ticker].append((row.start_date, row.end_date))
+            
+        except Exception as e:
+            logger.error(f"Ошибка при получении покрытия кэша для {len(tickers)} тикеров: {e}")
+            return {ticker: [] for ticker in tickers}
+        
+        return {ticker: merge_intervals(intervals) for ticker, intervals in intervals_by_ticker.items()}
+    
+    async def save_coverage(
+        self,
+        db: AsyncSession,
+        ticker: str,
+        intervals: List[Interval],
+        interval: CandleInterval = CandleInterval.DAY_1
+    ) -> None:
+        """
+        Запоминает, что периоды были запрошены у MOEX
+        
+        Новые интервалы сливаются с пересекающимися и соседними сохраненными,
+        поэтому для тикера хранится минимальный набор непересекающихся интервалов.
+        Незакрытый период свечей не отмечается: текущий день, а для недельных свечей - текущая неделя
+        (свеча начинается в понедельник и меняется до конца недели).
+        
+        Args:
+            db: Сессия базы данных
+            ticker: Тикер акции
+            intervals: Запрошенные периоды (start_date, end_date)
+            interval: Интервал свечей
+        """
+        closed_end = last_closed_date(interval)
+        intervals = [
+            (start, min(end, closed_end))
+            for start, end in intervals
+            if start <= closed_end
+        ]
+        if not intervals:
+            return
+        
+        lower_bound = min(start for start, _ in intervals) - timedelta(days=1)
+        upper_bound = max(end for _, end in intervals) + timedelta(days=1)
+        
+        try:
+            with stage('cache_write'):
+                # Блокируем затронутые интервалы, чтобы параллельное слияние их не потеряло
+                query = select(StockCoverage).where(
                     and_(
-                        StockData.ticker == ticker,
-                        StockData.date == item['date']
+                        StockCoverage.ticker == ticker,
+                        StockCoverage.interval == interval.iss_code,
+                        StockCoverage.start_date <= upper_bound,
+                        StockCoverage.end_date >= lower_bound
                     )
+                ).with_for_update()
+                result = await db.execute(query)
+                existing_records = result.scalars().all()
+                
+                merged = merge_intervals(
+                    [(record.start_date, record.end_date) for record in existing_records] + intervals
                 )
-                result = await self.db.execute(query)
-                existing_record = result.scalar_one_or_none()
                 
-                if existing_record:
-                    # Обновляем существующую запись
-                    existing_record.price = item['price']
-                else:
-                    # Создаем новую запись
-                    new_record = StockData(
-                        ticker=ticker,
-                        date=item['date'],
-                        price=item['price']
-                    )
-                    self.db.add(new_record)
-            
-            await self.db.commit()
-            logger.info(f"Сохранено {len(data)} записей в кэш для {ticker}")
+                for record in existing_records:
+                    await db.delete(record)
+                db.add_all(
+                    StockCoverage(ticker=ticker, interval=interval.iss_code, start_date=start, end_date=end)
+                    for start, end in merged
+                )
+                await db.commit()
             
         except Exception as e:
-            await self.db.rollback()
-            logger.error(f"Ошибка при сохранении данных в кэш для {ticker}: {e}")
+            await db.rollback()
+            logger.error(f"Ошибка при сохранении покрытия кэша для {ticker}: {e}")
             raise
     
-    def get_missing_dates(self, cached_data: List[Dict], start_date: date, end_date: date) -> List[date]:
+    def get_missing_dates(
+        self,
+        start_date: date,
+        end_date: date,
+        covered_intervals: Optional[List[Tuple[date, date]]] = None
+    ) -> List[date]:
         """
-        Определяет даты, для которых нет данных в кэше
+        Определяет даты, для которых нужно получить данные у MOEX
+        
+        Полными считаются только дни из уже запрошенных интервалов. Свечи вне покрытия
+        могли быть сохранены частично (текущий день, внутридневные свечи до конца торговой
+        сессии, цены закрытия из прежней таблицы stock_data), поэтому такие дни
+        загружаются заново, даже если свечи за них есть.
         
         Args:
-            cached_data: Данные из кэша
             start_date: Дата начала периода
             end_date: Дата окончания периода
+            covered_intervals: Интервалы, уже запрошенные у MOEX (даты без торгов в них не считаются недостающими)
             
         Returns:
             Список дат, для которых нужно получить данные
         """
-        # Создаем множество кэшированных дат для быстрого поиска
-        cached_dates: Set[date] = {item['date'] for item in cached_data}
-        
-        # Создаем новый список недостающих дат
-        missing_dates = [
+        return [
             current_date
-            for current_date in self._date_range(start_date, end_date)
-            if current_date not in cached_dates
+            for start, end in subtract_intervals(start_date, end_date, covered_intervals or [])
+            for current_date in self._date_range(start, end)
         ]
-        
-        return missing_dates
     
     def _date_range(self, start_date: date, end_date: date):
         """Генератор для создания диапазона дат"""
@@ -126,81 +512,466 @@ class DataService:
             yield current_date
             current_date += timedelta(days=1)
     
-    async def get_stock_data(self, tickers: List[str], start_date: date, end_date: date) -> Dict[str, Dict[str, float]]:
+    def _upstream_lock(self, ticker: str, interval: CandleInterval):
+        """Блокировка загрузок тикера с MOEX между процессами (дает True, если ее пришлось ждать)"""
+        if self.locks is None:
+            return nullcontext(False)
+        return self.locks.hold(f"fetch:{ticker}:{interval.iss_code}")
+    
+    def _market_params(self, ticker: str) -> Dict[str, str]:
+        """Торговая система и рынок бумаги для запросов свечей"""
+        return self.securities.market_params(ticker) if self.securities is not None else {}
+    
+    def _known_intervals(
+        self, ticker: str, start_date: date, end_date: date, covered_intervals: List[Interval]
+    ) -> List[Interval]:
+        """Интервалы, которые не нужно запрашивать у MOEX: уже запрошенные и вне дат торгов бумагой"""
+        if self.securities is None:
+            return covered_intervals
+        return covered_intervals + self.securities.unlisted_ranges(ticker, start_date, end_date)
+    
+    async def _uncovered_ranges(
+        self, ticker: str, interval: CandleInterval, start_date: date, end_date: date
+    ) -> List[Interval]:
+        """Части периода, еще не запрошенные у MOEX"""
+        async with self.session_factory() as db:
+            covered_intervals = await self.get_covered_intervals(db, ticker, start_date, end_date, interval)
+        return subtract_intervals(start_date, end_date, covered_intervals)
+    
+    async def _fetch_and_store(
+        self, ticker: str, interval: CandleInterval, start_date: date, end_date: date
+    ) -> CandleSeries:
         """
-        Асинхронно получает данные по акциям с учетом кэширования
+        Загружает период с MOEX и сохраняет его в кэш вместе с интервалом покрытия
+        
+        Если тот же тикер загружал другой процесс, после ожидания с MOEX загружается только
+        оставшаяся непокрытой часть периода, остальное читается из кэша.
         
         Args:
-            tickers: Список тикеров
+            ticker: Тикер акции
+            interval: Интервал свечей
             start_date: Дата начала периода
             end_date: Дата окончания периода
             
         Returns:
-            Словарь в формате {ticker: {date: price}}
+            Ряд свечей за период
         """
-        result = {}
-        
-        # Создаем задачи для обработки всех тикеров
-        tasks = [
-            (ticker, self._process_ticker(ticker, start_date, end_date))
-            for ticker in tickers
-        ]
+        async with self._upstream_lock(ticker, interval) as waited:
+            if not waited:
+                return await self._download_and_store(ticker, interval, start_date, end_date)
+            
+            remaining = await self._uncovered_ranges(ticker, interval, start_date, end_date)
+            if remaining == [(start_date, end_date)]:
+                return await self._download_and_store(ticker, interval, start_date, end_date)
+            logger.debug(f"{ticker}: период загружен другим процессом, осталось {len(remaining)} частей")
+            fetched = [
+                await self._download_and_store(ticker, interval, range_start, range_end)
+                for range_start, range_end in remaining
+            ]
+            async with self.session_factory() as db:
+                cached_data = await self.get_cached_data(db, ticker, start_date, end_date, interval)
+            return CandleSeries.concat([cached_data, *fetched])
+    
+    async def _download_and_store(
+        self, ticker: str, interval: CandleInterval, start_date: date, end_date: date
+    ) -> CandleSeries:
+        """Загружает период с MOEX и сохраняет его в кэш вместе с интервалом покрытия"""
+        self.cache_stats['upstream_calls'] += 1
+        new_data = await self.moex_client.get_stock_data(
+            ticker, start_date, end_date, interval, **self._market_params(ticker)
+        )
         
-        # Выполняем все задачи параллельно
-        for ticker, task in tasks:
-            try:
-                ticker_result = await task
-                result[ticker] = ticker_result
-            except Exception as e:
-                logger.error(f"Ошибка при получении данных для {ticker}: {e}")
-                result[ticker] = {}
+        async with self.session_factory() as db:
+            if new_data:
+                # Сохраняем новые данные в кэш
+                await self.save_data_to_cache(db, ticker, new_data, interval)
+            
+            # Даже пустой ответ означает, что торгов в эти дни не было
+            await self.save_coverage(db, ticker, [(start_date, end_date)], interval)
         
-        return result
+        return new_data
     
-    async def _process_ticker(self, ticker: str, start_date: date, end_date: date) -> Dict[str, float]:
+    async def _stream_and_store(
+        self, ticker: str, interval: CandleInterval, start_date: date, end_date: date
+    ) -> None:
         """
-        Обрабатывает один тикер: получает данные из кэша и дополняет недостающие
+        Загружает период с MOEX постранично, записывая страницы в кэш пачками
+        
+        В отличие от _fetch_and_store период целиком в памяти не собирается: страницы
+        копятся до STREAM_BATCH_SIZE строк, чтобы крупные пачки шли через COPY одной транзакцией.
+        Если тот же тикер загружал другой процесс, загружается только оставшаяся непокрытой часть.
         
         Args:
             ticker: Тикер акции
+            interval: Интервал свечей
             start_date: Дата начала периода
             end_date: Дата окончания периода
+        """
+        async with self._upstream_lock(ticker, interval) as waited:
+            remaining = (
+                await self._uncovered_ranges(ticker, interval, start_date, end_date)
+                if waited else [(start_date, end_date)]
+            )
+            for range_start, range_end in remaining:
+                await self._stream_range(ticker, interval, range_start, range_end)
+    
+    async def _stream_range(
+        self, ticker: str, interval: CandleInterval, start_date: date, end_date: date
+    ) -> None:
+        """Загружает период с MOEX постранично и записывает его в кэш вместе с интервалом покрытия"""
+        self.cache_stats['upstream_calls'] += 1
+        
+        # Сессия возвращает соединение в пул после каждого commit, пока идет запрос к MOEX
+        async with self.session_factory() as db:
+            pending: List[CandleSeries] = []
+            pending_rows = 0
+            pages = self.moex_client.iter_stock_data(
+                ticker, start_date, end_date, interval, **self._market_params(ticker)
+            )
+            async for page in pages:
+                pending.append(page)
+                pending_rows += len(page)
+                if pending_rows >= STREAM_BATCH_SIZE:
+                    await self.save_data_to_cache(db, ticker, CandleSeries.concat(pending), interval)
+                    pending, pending_rows = [], 0
+            if pending_rows:
+                await self.save_data_to_cache(db, ticker, CandleSeries.concat(pending), interval)
             
+            # Покрытие записывается только после того, как весь период сохранен
+            await self.save_coverage(db, ticker, [(start_date, end_date)], interval)
+    
+    def get_cache_stats(self) -> Dict[str, float]:
+        """
+        Возвращает счетчики кэша и долю тикеров, обслуженных без запроса к MOEX
+        
         Returns:
-            Словарь с данными в формате {date: price}
+            Словарь со счетчиками и hit_rate
+        """
+        stats = dict(self.cache_stats)
+        requests = stats['ticker_requests']
+        stats['hit_rate'] = stats['cache_hits'] / requests if requests else 0.0
+        stats['hot_cache'] = self.hot_cache.get_stats()
+        stats['single_flight'] = self.single_flight.get_stats()
+        stats['moex'] = self.moex_client.get_stats()
+        stats['locks'] = self.locks.get_stats() if self.locks is not None else None
+        stats['securities'] = self.securities.get_stats() if self.securities is not None else None
+        return stats
+    
+    async def get_stock_data(
+        self,
+        tickers: List[str],
+        start_date: date,
+        end_date: date,
+        interval: CandleInterval = CandleInterval.DAY_1,
+        ohlcv: bool = False,
+        stale: Optional[Set[str]] = None
+    ) -> Dict[str, Dict]:
         """
-        # Получаем данные из кэша
-        cached_data = await self.get_cached_data(ticker, start_date, end_date)
+        Асинхронно получает данные по акциям с учетом кэширования
         
-        # Определяем недостающие даты
-        missing_dates = self.get_missing_dates(cached_data, start_date, end_date)
+        Args:
+            tickers: Список тикеров
+            start_date: Дата начала периода
+            end_date: Дата окончания периода
+            interval: Интервал свечей
+            ohlcv: Возвращать все поля свечи, а не только цену закрытия
+            stale: Сюда добавляются тикеры, отданные только из кэша, потому что MOEX недоступен
+            
+        Returns:
+            Словарь в формате {ticker: {date: price}} или {ticker: {date: {open, high, low, close, volume, value}}}
+        """
+        series_by_ticker = await self.get_stock_series(tickers, start_date, end_date, interval, stale)
+        date_only = not interval.is_intraday
+        with stage('serialize'):
+            return {
+                ticker: series.to_ohlcv_dict(date_only) if ohlcv else series.to_dict(date_only)
+                for ticker, series in series_by_ticker.items()
+            }
+    
+    async def get_stock_series(
+        self,
+        tickers: List[str],
+        start_date: date,
+        end_date: date,
+        interval: CandleInterval = CandleInterval.DAY_1,
+        stale: Optional[Set[str]] = None
+    ) -> Dict[str, CandleSeries]:
+        """
+        Асинхронно получает ряды свечей по акциям с учетом кэширования
+        
+        Свечи и покрытие всех тикеров, которых нет в кэше в памяти, читаются из базы данных
+        одним запросом каждое; затем недостающие периоды всех тикеров дозагружаются с MOEX
+        параллельно (не более max_concurrency тикеров одновременно).
         
-        if missing_dates:
-            logger.info(f"Для {ticker} отсутствуют данные за {len(missing_dates)} дней")
+        Args:
+            tickers: Список тикеров
+            start_date: Дата начала периода
+            end_date: Дата окончания периода
+            interval: Интервал свечей
+            stale: Сюда добавляются тикеры, отданные только из кэша, потому что MOEX недоступен
             
-            # Получаем недостающие данные с MOEX
-            min_missing_date = min(missing_dates)
-            max_missing_date = max(missing_dates)
+        Returns:
+            Словарь {ticker: ряд свечей}; при ошибке тикера его ряд пустой
+        """
+        series_by_ticker: Dict[str, CandleSeries] = {}
+        pending: List[str] = []
+        for ticker in dict.fromkeys(tickers):
+            self.cache_stats['ticker_requests'] += 1
+            # Сначала проверяем кэш в памяти
+            hot_data = self.hot_cache.get(ticker, interval, start_date, end_date)
+            if hot_data is not None:
+                self.cache_stats['cache_hits'] += 1
+                series_by_ticker[ticker] = hot_data
+            else:
+                pending.append(ticker)
+        
+        if pending:
+            # Кэш всех тикеров читается двумя запросами (соединение возвращается в пул до запросов к MOEX)
+            with stage('cache_read'):
+                async with self.session_factory() as db:
+                    cached_by_ticker = await self.get_cached_data_many(db, pending, start_date, end_date, interval)
+                    covered_by_ticker = await self.get_covered_intervals_many(
+                        db, pending, start_date, end_date, interval
+                    )
             
-            new_data = await self.moex_client.get_stock_data(
-                ticker, min_missing_date, max_missing_date
-            )
+            # Недостающие периоды всех тикеров определяются сразу, до первого запроса к MOEX
+            with stage('gap_planning'):
+                fetch_plan = {
+                    ticker: self._plan_fetch(ticker, start_date, end_date, covered_by_ticker[ticker])
+                    for ticker in pending
+                }
             
-            if new_data:
-                # Сохраняем новые данные в кэш
-                await self.save_data_to_cache(ticker, new_data)
-                
-                # Объединяем кэшированные и новые данные
-                all_data = cached_data + new_data
-            else:
-                all_data = cached_data
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            
+            async def process_with_limit(ticker: str) -> CandleSeries:
+                async with semaphore:
+                    try:
+                        return await self._process_ticker(
+                            ticker, cached_by_ticker[ticker], fetch_plan[ticker], start_date, end_date, interval, stale
+                        )
+                    except Exception as e:
+                        # Ошибка одного тикера не должна влиять на остальные
+                        logger.error(f"Ошибка при получении данных для {ticker}: {e}")
+                        return CandleSeries()
+            
+            # Загрузки с MOEX всех тикеров запускаются вместе
+            ticker_results = await asyncio.gather(*(process_with_limit(ticker) for ticker in pending))
+            series_by_ticker.update(zip(pending, ticker_results))
+        
+        return {ticker: series_by_ticker[ticker] for ticker in tickers}
+    
+    def _plan_fetch(
+        self,
+        ticker: str,
+        start_date: date,
+        end_date: date,
+        covered_intervals: List[Interval]
+    ) -> List[Interval]:
+        """Периоды, которые нужно запросить у MOEX, чтобы дополнить кэш тикера (в пределах дат торгов бумагой)"""
+        known_intervals = self._known_intervals(ticker, start_date, end_date, covered_intervals)
+        missing_dates = self.get_missing_dates(start_date, end_date, known_intervals)
+        if not missing_dates:
+            return []
+        logger.debug(f"Для {ticker} отсутствуют данные за {len(missing_dates)} дней")
+        return plan_fetch_ranges(missing_dates, FETCH_MERGE_GAP_DAYS)
+    
+    async def _process_ticker(
+        self,
+        ticker: str,
+        cached_data: CandleSeries,
+        fetch_ranges: List[Interval],
+        start_date: date,
+        end_date: date,
+        interval: CandleInterval = CandleInterval.DAY_1,
+        stale: Optional[Set[str]] = None
+    ) -> CandleSeries:
+        """
+        Обрабатывает один тикер: дополняет прочитанные из кэша данные недостающими периодами
+        
+        Если MOEX недоступен, отдается то, что есть в кэше, а тикер добавляется в stale.
+        
+        Args:
+            ticker: Тикер акции
+            cached_data: Данные тикера из кэша
+            fetch_ranges: Периоды, которых нет в кэше
+            start_date: Дата начала периода
+            end_date: Дата окончания периода
+            interval: Интервал свечей
+            stale: Сюда добавляются тикеры, отданные только из кэша
+            
+        Returns:
+            Ряд свечей за период
+        """
+        if fetch_ranges:
+            # Запрашиваем у MOEX только непокрытые периоды, объединяясь с уже идущими загрузками
+            try:
+                fetched = await asyncio.gather(*(
+                    self.single_flight.run(ticker, interval, range_start, range_end, self._fetch_and_store)
+                    for range_start, range_end in fetch_ranges
+                ))
+            except MoexUnavailableError as e:
+                # Неполные данные не попадают в кэш в памяти
+                logger.warning(f"MOEX недоступен, {ticker} отдается только из кэша: {e}")
+                self.cache_stats['stale_served'] += 1
+                if stale is not None:
+                    stale.add(ticker)
+                return cached_data
+            
+            # Объединяем кэшированные и новые данные
+            all_data = CandleSeries.concat([cached_data, *fetched])
         else:
+            self.cache_stats['cache_hits'] += 1
             all_data = cached_data
         
-        # Формируем результат в нужном формате
-        ticker_result = {
-            item['date'].strftime('%Y-%m-%d'): item['price']
-            for item in all_data
-        }
+        # Данные за период теперь полные - кладем их в кэш в памяти
+        self.hot_cache.put(ticker, interval, all_data, start_date, end_date)
+        
+        return all_data
+    
+    async def stream_stock_data(
+        self,
+        tickers: List[str],
+        start_date: date,
+        end_date: date,
+        interval: CandleInterval = CandleInterval.DAY_1
+    ) -> AsyncIterator[Tuple[str, CandleSeries]]:
+        """
+        Потоково отдает данные по акциям: каждый тикер выдается, как только его кэш дополнен
+        
+        Не более max_concurrency тикеров дополняются одновременно, страницы MOEX сразу пишутся в кэш,
+        а готовые тикеры читаются из базы данных серверным курсором. Поэтому память ограничена
+        независимо от длины периода и числа тикеров.
+        
+        Args:
+            tickers: Список тикеров
+            start_date: Дата начала периода
+            end_date: Дата окончания периода
+            interval: Интервал свечей
+            
+        Yields:
+            Пары (тикер, пачка свечей); у тикера может быть несколько пачек, тикеры идут в порядке готовности
+        """
+        remaining = iter(tickers)
+        pending: Dict[asyncio.Task, str] = {}
+        
+        def launch() -> None:
+            while len(pending) < self.max_concurrency:
+                ticker = next(remaining, None)
+                if ticker is None:
+                    return
+                task = asyncio.create_task(self._fill_ticker(ticker, start_date, end_date, interval))
+                pending[task] = ticker
+        
+        launch()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    ticker = pending.pop(task)
+                    launch()
+                    try:
+                        hot_data = task.result()
+                        if hot_data is not None:
+                            yield ticker, hot_data
+                            continue
+                        async with self.session_factory() as db:
+                            async for batch in self.stream_cached_data(db, ticker, start_date, end_date, interval):
+                                yield ticker, batch
+                    except Exception as e:
+                        # Ошибка одного тикера не должна влиять на остальные
+                        logger.error(f"Ошибка при потоковой выдаче данных для {ticker}: {e}")
+        finally:
+            # Клиент мог отключиться - останавливаем незавершенные загрузки
+            for task in pending:
+                task.cancel()
+    
+    async def _fill_ticker(
+        self,
+        ticker: str,
+        start_date: date,
+        end_date: date,
+        interval: CandleInterval
+    ) -> Optional[CandleSeries]:
+        """
+        Дополняет кэш тикера за период, не читая сами свечи
         
-        return ticker_result 
\ No newline at end of file
+        Если MOEX недоступен, отдаются уже сохраненные в базе данных свечи.
+        
+        Returns:
+            Данные из кэша в памяти, если период в нем полный, иначе None (данные нужно читать из базы)
+        """
+        self.cache_stats['ticker_requests'] += 1
+        
+        hot_data = self.hot_cache.get(ticker, interval, start_date, end_date)
+        if hot_data is not None:
+            self.cache_stats['cache_hits'] += 1
+            return hot_data
+        
+        try:
+            if not await self.fill_cache(ticker, start_date, end_date, interval):
+                self.cache_stats['cache_hits'] += 1
+        except MoexUnavailableError as e:
+            # Отдаем то, что уже есть в базе данных
+            logger.warning(f"MOEX недоступен, {ticker} отдается только из кэша: {e}")
+            self.cache_stats['stale_served'] += 1
+        return None
+    
+    async def fill_cache(
+        self,
+        ticker: str,
+        start_date: date,
+        end_date: date,
+        interval: CandleInterval = CandleInterval.DAY_1
+    ) -> bool:
+        """
+        Дополняет кэш тикера в базе данных за период, не читая сами свечи
+        
+        Args:
+            ticker: Тикер акции
+            start_date: Дата начала периода
+            end_date: Дата окончания периода
+            interval: Интервал свечей
+            
+        Returns:
+            True, если недостающие данные загружались с MOEX
+        """
+        with stage('cache_read'):
+            async with self.session_factory() as db:
+                covered_intervals = await self.get_covered_intervals(db, ticker, start_date, end_date, interval)
+        
+        with stage('gap_planning'):
+            known_intervals = self._known_intervals(ticker, start_date, end_date, covered_intervals)
+            missing_dates = self.get_missing_dates(start_date, end_date, known_intervals)
+            fetch_ranges = plan_fetch_ranges(missing_dates, FETCH_MERGE_GAP_DAYS) if missing_dates else []
+        if not missing_dates:
+            return False
+        
+        logger.debug(f"Для {ticker} отсутствуют данные за {len(missing_dates)} дней")
+        # Периоды загружаются по очереди, чтобы в памяти была не больше одной страницы MOEX
+        for range_start, range_end in fetch_ranges:
+            await self._stream_and_store(ticker, interval, range_start, range_end)
+        return True
+    
+    async def refresh(
+        self,
+        ticker: str,
+        start_date: date,
+        end_date: date,
+        interval: CandleInterval = CandleInterval.DAY_1
+    ) -> CandleSeries:
+        """
+        Перезагружает период с MOEX независимо от кэша (свечи текущего дня меняются в течение сессии)
+        
+        Загрузка объединяется с уже идущими запросами того же тикера, результат записывается
+        в базу данных и в уже загруженный кэш в памяти.
+        
+        Args:
+            ticker: Тикер акции
+            start_date: Дата начала периода
+            end_date: Дата окончания периода
+            interval: Интервал свечей
+            
+        Returns:
+            Ряд свечей за период
+        """
+        return await self.single_flight.run(ticker, interval, start_date, end_date, self._fetch_and_store)
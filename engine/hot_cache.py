@@ -0,0 +1,169 @@
+"""
+Быстрый кэш в памяти процесса перед кэшем в PostgreSQL
+
+Для каждого тикера и интервала свечей хранит ряд свечей (CandleSeries) и интервалы,
+за которые эти массивы полны. Закрытые периоды свечей неизменны и хранятся до вытеснения,
+незакрытый (текущий день, для недельных свечей - текущая неделя) считается действительным
+не дольше HOT_CACHE_TODAY_TTL секунд.
+"""
+
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from models.candle import CandleInterval
+
+from .coverage import ONE_DAY, Interval, last_closed_date, merge_intervals, subtract_intervals
+from .series import CandleSeries
+
+logger = logging.getLogger(__name__)
+
+# Максимальное число свечей во всех записях кэша
+HOT_CACHE_MAX_POINTS = int(os.getenv("HOT_CACHE_MAX_POINTS", "1000000"))
+
+# Сколько секунд данные незакрытого периода свечей (текущего дня) считаются актуальными
+HOT_CACHE_TODAY_TTL = float(os.getenv("HOT_CACHE_TODAY_TTL", "60"))
+
+
+class _Entry:
+    """Данные одного тикера и интервала"""
+    
+    __slots__ = ('series', 'intervals', 'closed_end', 'open_start', 'open_expires_at')
+    
+    def __init__(self):
+        self.series = CandleSeries()
+        self.intervals: List[Interval] = []        # Полные интервалы закрытых периодов
+        self.closed_end: Optional[date] = None     # Конец закрытых периодов при загрузке незакрытого
+        self.open_start: Optional[date] = None     # С какой даты загружен незакрытый период
+        self.open_expires_at = 0.0
+
+
+class HotCache:
+    """
+    LRU кэш свечей по тикерам с ограничением по общему числу свечей
+    
+    Args:
+        max_points: Максимальное число свечей во всех записях
+        today_ttl: Время жизни данных незакрытого периода свечей, секунды
+    """
+    
+    def __init__(self, max_points: Optional[int] = None, today_ttl: Optional[float] = None):
+        self.max_points = max_points if max_points is not None else HOT_CACHE_MAX_POINTS
+        self.today_ttl = today_ttl if today_ttl is not None else HOT_CACHE_TODAY_TTL
+        self._entries: "OrderedDict[Tuple[str, CandleInterval], _Entry]" = OrderedDict()
+        self._points = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+    
+    def get(
+        self, ticker: str, interval: CandleInterval, start_date: date, end_date: date
+    ) -> Optional[CandleSeries]:
+        """
+        Возвращает данные за период, если кэш содержит их полностью
+        
+        Args:
+            ticker: Тикер акции
+            interval: Интервал свечей
+            start_date: Дата начала периода
+            end_date: Дата окончания периода
+            
+        Returns:
+            Ряд свечей за период или None при промахе
+        """
+        key = (ticker, interval)
+        entry = self._entries.get(key)
+        if entry is None or not self._is_complete(entry, interval, start_date, end_date):
+            self.stats['misses'] += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self.stats['hits'] += 1
+        return entry.series.slice(start_date, end_date)
+    
+    def put(
+        self, ticker: str, interval: CandleInterval, data: CandleSeries, start_date: date, end_date: date
+    ) -> None:
+        """
+        Сохраняет полные данные тикера за период
+        
+        Args:
+            ticker: Тикер акции
+            interval: Интервал свечей
+            data: Все свечи за период
+            start_date: Дата начала периода
+            end_date: Дата окончания периода
+        """
+        key = (ticker, interval)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry()
+        self._entries.move_to_end(key)
+        self._merge(entry, data)
+        
+        closed_end = last_closed_date(interval)
+        historical_end = min(end_date, closed_end)
+        if start_date <= historical_end:
+            entry.intervals = merge_intervals(entry.intervals + [(start_date, historical_end)])
+        if end_date > closed_end:
+            entry.closed_end = closed_end
+            entry.open_start = max(start_date, closed_end + ONE_DAY)
+            entry.open_expires_at = time.monotonic() + self.today_ttl
+        
+        self._evict()
+    
+    def update(self, ticker: str, interval: CandleInterval, data: CandleSeries) -> None:
+        """
+        Обновляет свечи уже закэшированного тикера после записи в базу данных
+        
+        Интервалы полноты не расширяются, поэтому новые данные не приводят к ложным попаданиям.
+        
+        Args:
+            ticker: Тикер акции
+            interval: Интервал свечей
+            data: Записанные свечи
+        """
+        entry = self._entries.get((ticker, interval))
+        if entry is None:
+            return
+        self._merge(entry, data)
+        self._evict()
+    
+    def invalidate(self, ticker: str, interval: CandleInterval) -> None:
+        """Удаляет данные тикера из кэша"""
+        entry = self._entries.pop((ticker, interval), None)
+        if entry is not None:
+            self._points -= len(entry.series)
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Возвращает счетчики попаданий, промахов и вытеснений"""
+        return {**self.stats, 'tickers': len(self._entries), 'points': self._points}
+    
+    def _merge(self, entry: _Entry, data: CandleSeries) -> None:
+        """Добавляет или обновляет свечи записи с учетом общего числа свечей"""
+        self._points -= len(entry.series)
+        entry.series = entry.series.merge(data)
+        self._points += len(entry.series)
+    
+    def _is_complete(self, entry: _Entry, interval: CandleInterval, start_date: date, end_date: date) -> bool:
+        """Проверяет, что запись содержит все данные за период"""
+        closed_end = last_closed_date(interval)
+        historical_end = min(end_date, closed_end)
+        if start_date <= historical_end and subtract_intervals(start_date, historical_end, entry.intervals):
+            return False
+        if end_date > closed_end:
+            return (
+                entry.closed_end == closed_end
+                and entry.open_start <= max(start_date, closed_end + ONE_DAY)
+                and time.monotonic() < entry.open_expires_at
+            )
+        return True
+    
+    def _evict(self) -> None:
+        """Вытесняет давно не использованные тикеры, пока кэш не уложится в лимит"""
+        while self._points > self.max_points and self._entries:
+            (ticker, interval), entry = self._entries.popitem(last=False)
+            self._points -= len(entry.series)
+            self.stats['evictions'] += 1
+            logger.debug(f"Тикер {ticker} ({interval.value}) вытеснен из кэша в памяти")
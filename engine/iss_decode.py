@@ -0,0 +1,99 @@
+"""
+Быстрый разбор ответов ISS
+
+JSON разбирается из сырого тела ответа самым быстрым доступным парсером: orjson или msgspec
+(необязательные зависимости, poetry install -E fast-json), иначе стандартным json.
+
+Блок свечей ISS ({"columns": [...], "data": [[...], ...]}) декодируется по колонкам:
+индексы полей находятся по именам из columns, строки транспонируются одним zip,
+значения переносятся в array('d') целыми колонками, а время начала свечи разбирается
+из кэша дат и времени суток (одни и те же даты повторяются во всех строках дня и у всех тикеров)
+вместо datetime.strptime на каждую строку.
+"""
+
+import json
+from array import array
+from datetime import date
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+
+from .series import EPOCH_ORDINAL, NAN, SECONDS_PER_DAY, VALUE_COLUMNS, CandleSeries
+
+try:
+    import orjson
+    JSON_BACKEND = "orjson"
+    loads = orjson.loads
+except ImportError:
+    try:
+        import msgspec
+        JSON_BACKEND = "msgspec"
+        loads = msgspec.json.decode
+    except ImportError:
+        JSON_BACKEND = "json"
+        loads = json.loads
+
+# Колонка времени начала свечи (колонки значений называются в ISS так же, как в CandleSeries)
+ISS_BEGIN_COLUMN = 'begin'
+
+
+@lru_cache(maxsize=65536)
+def _day_seconds(day: str) -> int:
+    """Секунды от 1970-01-01 до начала дня YYYY-MM-DD"""
+    return (date(int(day[:4]), int(day[5:7]), int(day[8:10])).toordinal() - EPOCH_ORDINAL) * SECONDS_PER_DAY
+
+
+@lru_cache(maxsize=4096)
+def _time_seconds(time_of_day: str) -> int:
+    """Секунды от начала суток для HH:MM:SS (пустая строка - начало суток)"""
+    if not time_of_day:
+        return 0
+    return int(time_of_day[:2]) * 3600 + int(time_of_day[3:5]) * 60 + int(time_of_day[6:8])
+
+
+def parse_timestamps(values: Sequence[str]) -> array:
+    """Время 'YYYY-MM-DD HH:MM:SS' (или 'YYYY-MM-DD') в секунды от 1970-01-01"""
+    return array('q', [_day_seconds(value[:10]) + _time_seconds(value[11:19]) for value in values])
+
+
+def _float_column(values: Sequence) -> array:
+    """Колонка чисел в array('d'), null заменяется на NaN"""
+    try:
+        return array('d', values)
+    except TypeError:
+        return array('d', [NAN if value is None else value for value in values])
+
+
+def decode_candles(columns: List[str], data: List[List]) -> CandleSeries:
+    """
+    Декодирует строки свечей ISS в ряд свечей
+    
+    Args:
+        columns: Имена колонок блока candles
+        data: Строки блока candles
+        
+    Returns:
+        Ряд свечей, упорядоченный по времени без повторов (при повторе остается последняя строка)
+        
+    Raises:
+        ValueError: В блоке нет колонки begin или close
+    """
+    index = {name: position for position, name in enumerate(columns)}
+    for required in (ISS_BEGIN_COLUMN, 'close'):
+        if required not in index:
+            raise ValueError(f"В ответе ISS нет колонки {required}: {columns}")
+    if not data:
+        return CandleSeries()
+    
+    transposed = list(zip(*data))
+    ts = parse_timestamps(transposed[index[ISS_BEGIN_COLUMN]])
+    size = len(ts)
+    values: Dict[str, array] = {}
+    for name in VALUE_COLUMNS:
+        position: Optional[int] = index.get(name)
+        values[name] = _float_column(transposed[position]) if position is not None else array('d', [NAN]) * size
+    
+    series = CandleSeries(ts, **values)
+    if all(left < right for left, right in zip(ts, ts[1:])):
+        return series
+    # ISS отдает свечи по порядку; на случай перестановок и повторов сортируем строки
+    return CandleSeries.from_rows(series)
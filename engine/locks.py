@@ -0,0 +1,161 @@
+"""
+Координация нескольких процессов приложения через advisory locks PostgreSQL
+
+При запуске с несколькими воркерами (uvicorn --workers, несколько реплик) кэш в PostgreSQL общий,
+а single-flight и кэш в памяти у каждого процесса свои. Чтобы один и тот же пропуск не загружался
+с ISS каждым процессом, загрузка тикера и интервала выполняется под сессионной advisory lock:
+остальные процессы ждут ее освобождения и загружают только то, что осталось непокрытым.
+Так же выбирается процесс, выполняющий фоновый прогрев кэша.
+
+Блокировки держатся на одном выделенном соединении процесса (в режиме autocommit), а не на
+соединениях запросов, поэтому ожидание и загрузка не занимают пул, а при падении процесса
+PostgreSQL сам освобождает все его блокировки. Блокировки сессии повторно входимы: задачи
+одного процесса друг друга не ждут, их объединяет single-flight.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from .resilience import DeadlineExceededError, remaining_budget
+
+logger = logging.getLogger(__name__)
+
+# Согласовывать загрузки с ISS между процессами приложения
+FETCH_LOCKS = os.getenv("FETCH_LOCKS", "true").lower() in ("1", "true", "yes")
+
+# Как часто проверять, освободилась ли блокировка, секунды
+LOCK_POLL_INTERVAL = float(os.getenv("LOCK_POLL_INTERVAL", "0.1"))
+
+# Сколько ждать загрузку другим процессом, прежде чем загружать самостоятельно, секунды
+LOCK_WAIT_TIMEOUT = float(os.getenv("LOCK_WAIT_TIMEOUT", "60"))
+
+
+def lock_key(name: str) -> int:
+    """Ключ advisory lock (bigint) для имени блокировки"""
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), 'big', signed=True)
+
+
+class AdvisoryLocks:
+    """
+    Сессионные advisory locks процесса на выделенном соединении
+    
+    Args:
+        engine: Движок базы данных, из пула которого берется соединение
+        poll_interval: Период проверки занятой блокировки, секунды
+        wait_timeout: Максимальное время ожидания блокировки, секунды
+    """
+    
+    def __init__(
+        self, engine: AsyncEngine, poll_interval: Optional[float] = None, wait_timeout: Optional[float] = None
+    ):
+        self.engine = engine
+        self.poll_interval = poll_interval if poll_interval is not None else LOCK_POLL_INTERVAL
+        self.wait_timeout = wait_timeout if wait_timeout is not None else LOCK_WAIT_TIMEOUT
+        self._connection: Optional[AsyncConnection] = None
+        # Соединение не выполняет запросы параллельно
+        self._mutex = asyncio.Lock()
+        self.stats = {
+            'acquired': 0,   # Блокировок получено
+            'contended': 0,  # Блокировок, которые пришлось ждать
+            'timeouts': 0,   # Ожиданий, прерванных по LOCK_WAIT_TIMEOUT
+            'errors': 0      # Ошибок соединения (работа продолжается без блокировки)
+        }
+    
+    async def try_acquire(self, name: str) -> bool:
+        """
+        Пытается получить блокировку без ожидания
+        
+        Если база данных недоступна, блокировка считается полученной: согласование - оптимизация,
+        и без него процесс работает как единственный.
+        """
+        try:
+            acquired = await self._execute("SELECT pg_try_advisory_lock(:key)", lock_key(name))
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"Не удалось получить блокировку {name}, продолжаем без нее: {e}")
+            return True
+        if acquired:
+            self.stats['acquired'] += 1
+        return bool(acquired)
+    
+    async def release(self, name: str) -> None:
+        """Освобождает блокировку, полученную try_acquire или hold"""
+        try:
+            await self._execute("SELECT pg_advisory_unlock(:key)", lock_key(name))
+        except Exception as e:
+            # Соединение потеряно - PostgreSQL уже освободил его блокировки
+            self.stats['errors'] += 1
+            logger.warning(f"Не удалось освободить блокировку {name}: {e}")
+    
+    @asynccontextmanager
+    async def hold(self, name: str) -> AsyncIterator[bool]:
+        """
+        Держит блокировку на время блока, дожидаясь ее освобождения другим процессом
+        
+        Ожидание ограничено wait_timeout и сроком текущего запроса к API; по wait_timeout
+        блок выполняется без блокировки.
+        
+        Yields:
+            True, если блокировку пришлось ждать (другой процесс мог уже выполнить работу)
+            
+        Raises:
+            DeadlineExceededError: Срок запроса истек во время ожидания
+        """
+        acquired = await self.try_acquire(name)
+        waited = not acquired
+        if waited:
+            self.stats['contended'] += 1
+            logger.debug(f"Блокировка {name} занята другим процессом, ждем")
+        give_up_at = time.monotonic() + self.wait_timeout
+        while not acquired:
+            budget = remaining_budget()
+            if budget is not None and budget <= self.poll_interval:
+                raise DeadlineExceededError(f"Истек срок запроса при ожидании блокировки {name}")
+            if time.monotonic() >= give_up_at:
+                self.stats['timeouts'] += 1
+                logger.warning(f"Блокировка {name} не освободилась за {self.wait_timeout:.0f} с, продолжаем без нее")
+                break
+            await asyncio.sleep(self.poll_interval)
+            acquired = await self.try_acquire(name)
+        try:
+            yield waited
+        finally:
+            if acquired:
+                # Освобождение не должно прерываться отменой ожидающего запроса
+                await asyncio.shield(self.release(name))
+    
+    async def close(self) -> None:
+        """Закрывает соединение; все блокировки процесса освобождаются"""
+        async with self._mutex:
+            if self._connection is not None:
+                await self._connection.close()
+                self._connection = None
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Счетчики блокировок"""
+        return dict(self.stats)
+    
+    async def _execute(self, statement: str, key: int):
+        async with self._mutex:
+            if self._connection is None:
+                connection = await self.engine.connect()
+                self._connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+            try:
+                result = await self._connection.execute(text(statement), {'key': key})
+                return result.scalar()
+            except Exception:
+                # Следующий вызов откроет новое соединение
+                connection, self._connection = self._connection, None
+                try:
+                    await connection.close()
+                except Exception:
+                    pass
+                raise
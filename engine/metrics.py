@@ -0,0 +1,230 @@
+"""
+Встроенные метрики производительности в формате Prometheus
+
+Время этапов обработки запроса собирается в гистограммы через stage(): чтение кэша (cache_read),
+планирование пропусков (gap_planning), ожидание token bucket (rate_limit_wait), запрос к ISS
+(upstream_fetch), разбор ответа (parse), запись в кэш (cache_write), расчет агрегатов (analytics)
+и сериализация ответа (serialize). Внутри collect_timings()
+время этапов дополнительно суммируется для заголовка Server-Timing текущего запроса.
+Счетчики сервисов (DataService, MoexClient) не дублируются: они читаются в момент выдачи /metrics
+через коллекторы.
+
+Текстовый формат Prometheus формируется без внешних зависимостей.
+"""
+
+import contextvars
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы корзин гистограмм длительности, секунды
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+# Семейство метрик от коллектора: (имя, тип, описание, [(метки, значение)])
+MetricFamily = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами и метками"""
+    
+    def __init__(
+        self, name: str, documentation: str, labels: Iterable[str] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = buckets
+        # Для каждого набора меток: счетчики по корзинам (последняя - +Inf), сумма
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+    
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(labels[name] for name in self.labels)
+        counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        else:
+            counts[-1] += 1
+        total[0] += value
+    
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for key, (counts, total) in self._values.items():
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                bucket_labels = {**labels, 'le': _format_value(bound) if math.isinf(bound) else repr(bound)}
+                yield f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {_format_value(total[0])}"
+            yield f"{self.name}_count{_format_labels(labels)} {cumulative}"
+
+
+class Registry:
+    """Набор метрик процесса и коллекторов, читаемых при выдаче"""
+    
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: Dict[str, Callable[[], Iterable[MetricFamily]]] = {}
+    
+    def histogram(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Histogram:
+        metric = Histogram(name, documentation, labels)
+        self._metrics.append(metric)
+        return metric
+    
+    def set_collector(self, name: str, collector: Callable[[], Iterable[MetricFamily]]) -> None:
+        """Регистрирует (или заменяет) коллектор под именем name"""
+        self._collectors[name] = collector
+    
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors.values():
+            for name, metric_type, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_DURATION = REGISTRY.histogram(
+    'moex_stage_duration_seconds', 'Время этапов обработки запроса', labels=('stage',)
+)
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    'moex_http_request_duration_seconds', 'Время обработки HTTP запроса', labels=('method', 'handler', 'status')
+)
+
+_request_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    'request_timings', default=None
+)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Засекает время этапа name для гистограммы и Server-Timing текущего запроса"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def record_stage(name: str, seconds: float) -> None:
+    """Учитывает уже измеренное время этапа"""
+    STAGE_DURATION.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def collect_timings() -> Iterator[Dict[str, float]]:
+    """
+    Суммирует время этапов внутри блока, включая задачи, созданные в нем
+    
+    Этапы разных тикеров выполняются параллельно, поэтому сумма может превышать общее время запроса.
+    """
+    timings: Dict[str, float] = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def server_timing_header(timings: Dict[str, float], total: Optional[float] = None) -> str:
+    """Значение заголовка Server-Timing (длительности в миллисекундах)"""
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ', '.join(parts)
+
+
+def service_metrics(stats: Dict) -> List[MetricFamily]:
+    """
+    Семейства метрик из DataService.get_cache_stats(): попадания в кэш, запросы к ISS,
+    полученные байты и строки, состояние circuit breaker и скорость token bucket
+    """
+    moex = stats['moex']
+    hot_cache = stats['hot_cache']
+    single_flight = stats['single_flight']
+    families: List[MetricFamily] = [
+        ('moex_ticker_requests_total', 'counter', 'Обработано тикеров', [({}, stats['ticker_requests'])]),
+        ('moex_cache_hits_total', 'counter', 'Тикеров, полностью обслуженных из кэша', [({}, stats['cache_hits'])]),
+        (
+            'moex_cache_misses_total', 'counter', 'Тикеров, для которых данные загружались с ISS',
+            [({}, stats['ticker_requests'] - stats['cache_hits'])]
+        ),
+        ('moex_cache_rows_written_total', 'counter', 'Свечей записано в кэш', [({}, stats['rows_written'])]),
+        (
+            'moex_stale_served_total', 'counter', 'Тикеров, отданных только из кэша при недоступном ISS',
+            [({}, stats['stale_served'])]
+        ),
+        (
+            'moex_hot_cache_lookups_total', 'counter', 'Обращения к кэшу в памяти',
+            [({'result': 'hit'}, hot_cache['hits']), ({'result': 'miss'}, hot_cache['misses'])]
+        ),
+        ('moex_hot_cache_points', 'gauge', 'Свечей в кэше в памяти', [({}, hot_cache['points'])]),
+        (
+            'moex_single_flight_total', 'counter', 'Загрузки и запросы, объединенные с чужой загрузкой',
+            [({'kind': kind}, single_flight[kind]) for kind in ('flights', 'coalesced', 'partial')]
+        ),
+        ('moex_upstream_calls_total', 'counter', 'Загрузок периодов с ISS', [({}, stats['upstream_calls'])]),
+        ('moex_upstream_requests_total', 'counter', 'HTTP запросов к ISS', [({}, moex['requests'])]),
+        ('moex_upstream_retries_total', 'counter', 'Повторов запросов к ISS', [({}, moex['retries'])]),
+        ('moex_upstream_failures_total', 'counter', 'Запросов к ISS без ответа после повторов', [({}, moex['failures'])]),
+        ('moex_upstream_bytes_total', 'counter', 'Байт получено от ISS', [({}, moex['bytes'])]),
+        ('moex_upstream_rows_total', 'counter', 'Свечей получено от ISS', [({}, moex['rows'])]),
+        (
+            'moex_circuit_breaker_open', 'gauge', 'Цепь запросов к ISS разомкнута (1) или замкнута (0)',
+            [({}, 0 if moex['breaker']['state'] == 'closed' else 1)]
+        ),
+    ]
+    if stats['locks'] is not None:
+        families.append(
+            ('moex_fetch_lock_waits_total', 'counter', 'Загрузок, ожидавших загрузку того же тикера другим процессом',
+             [({}, stats['locks']['contended'])])
+        )
+    if stats['securities'] is not None:
+        securities = stats['securities']
+        families.append(
+            ('moex_securities_checks_total', 'counter', 'Проверки тикеров по справочнику бумаг',
+             [({'result': 'hit'}, securities['hits']), ({'result': 'lookup'}, securities['lookups'])])
+        )
+        families.append(
+            ('moex_securities_rejected_total', 'counter', 'Неизвестных тикеров в запросах',
+             [({}, securities['rejected'])])
+        )
+    if moex['rate_limiter'] is not None:
+        families.append(
+            ('moex_rate_limit_rate', 'gauge', 'Текущая скорость token bucket, запросов в секунду',
+             [({}, moex['rate_limiter']['rate'])])
+        )
+    return families
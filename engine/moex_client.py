@@ -1,70 +1,185 @@
 import aiohttp
+import asyncio
 import logging
-from typing import List, Dict, Optional, Tuple
-from datetime import date, datetime
+import os
+import time
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+from datetime import date, datetime, timedelta
+from models.candle import CandleInterval
+from .iss_decode import decode_candles, loads
+from .metrics import record_stage, stage
+from .rate_limit import TokenBucket
+from .resilience import (
+    MOEX_RETRY_ATTEMPTS, RETRYABLE_STATUSES, CircuitBreaker, CircuitOpenError, DeadlineExceededError,
+    MoexUnavailableError, backoff_delay, remaining_budget
+)
+from .series import CandleSeries
 
 logger = logging.getLogger(__name__)
 
+# Базовый адрес ISS API (переопределяется, например, для локальной заглушки)
+MOEX_ISS_URL = os.getenv("MOEX_ISS_URL", "https://iss.moex.com/iss")
+
+# Таймаут одной попытки запроса к ISS, секунды (неудачные попытки повторяются)
+MOEX_API_TIMEOUT = float(os.getenv("MOEX_API_TIMEOUT", "10"))
+
+# Настройки пула HTTP соединений
+MOEX_CONNECTION_LIMIT = int(os.getenv("MOEX_CONNECTION_LIMIT", "100"))
+MOEX_CONNECTION_LIMIT_PER_HOST = int(os.getenv("MOEX_CONNECTION_LIMIT_PER_HOST", "10"))
+MOEX_DNS_CACHE_TTL = int(os.getenv("MOEX_DNS_CACHE_TTL", "300"))
+MOEX_KEEPALIVE_TIMEOUT = float(os.getenv("MOEX_KEEPALIVE_TIMEOUT", "60"))
+
+# Длинные периоды дневных свечей загружаются параллельно частями не длиннее этого числа дней
+MOEX_CHUNK_DAYS = int(os.getenv("MOEX_CHUNK_DAYS", "365"))
+
+# Торговая система и рынок бумаг, для которых рынок не известен из справочника бумаг
+DEFAULT_ENGINE = "stock"
+DEFAULT_MARKET = "shares"
+
+# Строки блока ISS вместе с именами его колонок
+CandleBlock = Tuple[List[str], List[List]]
+
+# Размер части для остальных интервалов: примерно одна-две страницы свечей
+CHUNK_DAYS_BY_INTERVAL = {
+    CandleInterval.MINUTE_1: 1,
+    CandleInterval.MINUTE_10: 7,
+    CandleInterval.HOUR_1: 30,
+    CandleInterval.WEEK_1: MOEX_CHUNK_DAYS * 7,
+}
+
+# Длительность свечи: следующая свеча начинается не раньше, чем через столько после предыдущей
+CANDLE_DURATION = {
+    CandleInterval.MINUTE_1: timedelta(minutes=1),
+    CandleInterval.MINUTE_10: timedelta(minutes=10),
+    CandleInterval.HOUR_1: timedelta(hours=1),
+    CandleInterval.DAY_1: timedelta(days=1),
+    CandleInterval.WEEK_1: timedelta(days=7),
+}
+
 class MoexClient:
-    """Асинхронный клиент для работы с API Московской биржи"""
+    """
+    Асинхронный клиент для работы с API Московской биржи
+    
+    Держит одну долгоживущую HTTP сессию с пулом keep-alive соединений,
+    поэтому должен создаваться один раз на приложение и закрываться через close().
+    Недоступность ISS (исчерпаны повторы, разомкнута цепь, истек срок запроса)
+    сообщается исключением MoexUnavailableError.
+    """
     
-    def __init__(self):
-        self.timeout = aiohttp.ClientTimeout(total=30)
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        rate_limiter: Optional[TokenBucket] = None,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        """
+        Args:
+            base_url: Адрес ISS API (по умолчанию MOEX_ISS_URL)
+            rate_limiter: Общий бюджет частоты запросов к ISS (None - без ограничения)
+            breaker: Circuit breaker запросов к ISS (если не передан, создается собственный)
+        """
+        self.base_url = (base_url or MOEX_ISS_URL).rstrip('/')
+        self.timeout = aiohttp.ClientTimeout(total=MOEX_API_TIMEOUT)
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Общий бюджет одновременных запросов к ISS
+        self._request_semaphore = asyncio.Semaphore(MOEX_CONNECTION_LIMIT_PER_HOST)
+        self.rate_limiter = rate_limiter
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0, 'deadline_exceeded': 0, 'bytes': 0, 'rows': 0}
+        # Размер полной страницы свечей, определенный по ответам ISS (None - еще не известен)
+        self.page_size: Optional[int] = None
+    
+    async def __aenter__(self) -> "MoexClient":
+        await self.start()
+        return self
     
-    async def get_stock_data(self, ticker: str, start_date: date, end_date: date) -> List[Dict]:
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+    
+    async def start(self) -> None:
+        """Создает HTTP сессию с настроенным пулом соединений"""
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=MOEX_CONNECTION_LIMIT,
+            limit_per_host=MOEX_CONNECTION_LIMIT_PER_HOST,
+            ttl_dns_cache=MOEX_DNS_CACHE_TTL,
+            keepalive_timeout=MOEX_KEEPALIVE_TIMEOUT
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.timeout,
+            headers=self.headers
+        )
+        logger.info("HTTP сессия MOEX клиента создана")
+    
+    async def close(self) -> None:
+        """Закрывает HTTP сессию и все соединения пула"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("HTTP сессия MOEX клиента закрыта")
+        self._session = None
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Возвращает общую HTTP сессию, создавая ее при первом обращении"""
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+    
+    async def get_stock_data(
+        self,
+        ticker: str,
+        start_date: date,
+        end_date: date,
+        interval: CandleInterval = CandleInterval.DAY_1,
+        engine: str = DEFAULT_ENGINE,
+        market: str = DEFAULT_MARKET
+    ) -> CandleSeries:
         """
-        Асинхронно получает данные по акции за указанный период
+        Асинхронно получает свечи по акции за указанный период
+        
+        Длинные периоды разбиваются на части (для дневных свечей - по MOEX_CHUNK_DAYS дней),
+        которые загружаются параллельно (не более MOEX_CONNECTION_LIMIT_PER_HOST запросов одновременно),
+        каждая часть дочитывается постранично.
         
         Args:
             ticker: Тикер акции (например, 'SBER')
             start_date: Дата начала периода
             end_date: Дата окончания периода
+            interval: Интервал свечей
+            engine: Торговая система бумаги
+            market: Рынок бумаги
             
         Returns:
-            Список словарей с данными о ценах
+            Ряд свечей OHLCV за период
         """
         try:
-            # Формируем URL для запроса
-            url = f"https://iss.moex.com/iss/engines/stock/markets/shares/securities/{ticker}/candles.json"
-            
-            params = {
-                'from': start_date.strftime('%Y-%m-%d'),
-                'till': end_date.strftime('%Y-%m-%d'),
-                'interval': 24,  # Дневные свечи
-                'iss.meta': 'off',
-                'iss.only': 'candles'
-            }
+            logger.debug(f"Запрос данных для {ticker} ({interval.value}) с {start_date} по {end_date}")
             
-            logger.info(f"Запрос данных для {ticker} с {start_date} по {end_date}")
+            chunk_days = CHUNK_DAYS_BY_INTERVAL.get(interval, MOEX_CHUNK_DAYS)
+            chunks = self._split_range(start_date, end_date, chunk_days)
+            chunk_results = await asyncio.gather(*(
+                self._fetch_candles(ticker, chunk_start, chunk_end, interval, engine, market)
+                for chunk_start, chunk_end in chunks
+            ))
             
-            async with aiohttp.ClientSession(timeout=self.timeout, headers=self.headers) as session:
-                async with session.get(url, params=params) as response:
-                    response.raise_for_status()
-                    data = await response.json()
-            
-            if 'candles' not in data:
-                logger.warning(f"Нет данных для тикера {ticker}")
-                return []
+            # Склеиваем части по порядку и декодируем одним проходом, если колонки у частей одинаковые
+            chunk_results = [(columns, rows) for columns, rows in chunk_results if rows]
+            if len({tuple(columns) for columns, _ in chunk_results}) <= 1:
+                columns = chunk_results[0][0] if chunk_results else []
+                result = self._decode_candles(columns, [row for _, rows in chunk_results for row in rows])
+            else:
+                result = CandleSeries.concat(self._decode_candles(columns, rows) for columns, rows in chunk_results)
             
-            # Обрабатываем полученные данные
-            candles_data = data['candles']['data']
-            logger.info(f"Получено {len(candles_data)} свечей для {ticker}")
-            
-            # Создаем новый список для каждого запроса
-            result = [
-                {
-                    'date': datetime.strptime(candle[6], '%Y-%m-%d %H:%M:%S').date(),
-                    'price': float(candle[1])  # Цена закрытия находится на позиции 1
-                }
-                for candle in candles_data
-            ]
-            
-            logger.info(f"Обработано {len(result)} записей для {ticker}")
+            logger.debug(f"Обработано {len(result)} записей для {ticker} ({len(chunks)} частей)")
             return result
             
+        except MoexUnavailableError as e:
+            logger.warning(f"MOEX API недоступен для {ticker}: {e}")
+            raise
         except aiohttp.ClientError as e:
             logger.error(f"Ошибка при запросе к MOEX API для {ticker}: {e}")
             raise
@@ -72,4 +187,334 @@ class MoexClient:
             logger.error(f"Неожиданная ошибка при получении данных для {ticker}: {e}")
             raise
     
- 
\ No newline at end of file
+    async def get_board_securities(
+        self, board: str, engine: str = DEFAULT_ENGINE, market: str = DEFAULT_MARKET
+    ) -> List[str]:
+        """
+        Получает тикеры всех бумаг режима торгов
+        
+        Args:
+            board: Режим торгов (например, 'TQBR')
+            engine: Торговая система
+            market: Рынок
+            
+        Returns:
+            Тикеры бумаг режима торгов
+        """
+        url = f"{self.base_url}/engines/{engine}/markets/{market}/boards/{board}/securities.json"
+        params = {
+            'iss.meta': 'off',
+            'iss.only': 'securities',
+            'securities.columns': 'SECID'
+        }
+        data = await self._get_json(url, params)
+        block = data.get('securities', {})
+        position = block.get('columns', ['SECID']).index('SECID')
+        securities = [row[position] for row in block.get('data', [])]
+        logger.info(f"Режим торгов {board}: {len(securities)} бумаг")
+        return securities
+    
+    async def get_board_listing(
+        self, board: str, engine: str = DEFAULT_ENGINE, market: str = DEFAULT_MARKET
+    ) -> List[Dict]:
+        """
+        Получает бумаги режима торгов с размером лота и статусом торгов
+        
+        Args:
+            board: Режим торгов (например, 'TQBR')
+            engine: Торговая система
+            market: Рынок
+            
+        Returns:
+            Строки с полями SECID, SHORTNAME, LOTSIZE и STATUS ('A' - бумага торгуется)
+        """
+        url = f"{self.base_url}/engines/{engine}/markets/{market}/boards/{board}/securities.json"
+        params = {
+            'iss.meta': 'off',
+            'iss.only': 'securities',
+            'securities.columns': 'SECID,SHORTNAME,LOTSIZE,STATUS'
+        }
+        data = await self._get_json(url, params)
+        return self._block_rows(data, 'securities')
+    
+    async def get_security_boards(self, ticker: str) -> List[Dict]:
+        """
+        Получает режимы торгов бумаги (рынок, даты торгов, признак основного режима)
+        
+        Args:
+            ticker: Тикер бумаги
+            
+        Returns:
+            Строки блока boards ISS (boardid, engine, market, is_traded, is_primary, history_from,
+            history_till, listed_from, listed_till); пустой список, если ISS не знает бумагу
+        """
+        url = f"{self.base_url}/securities/{ticker}.json"
+        params = {'iss.meta': 'off', 'iss.only': 'boards'}
+        try:
+            data = await self._get_json(url, params)
+        except aiohttp.ClientResponseError as e:
+            if e.status == 404:
+                return []
+            raise
+        return self._block_rows(data, 'boards')
+    
+    @staticmethod
+    def _block_rows(data: Dict, name: str) -> List[Dict]:
+        """Строки блока ISS в виде словарей {колонка: значение}"""
+        block = data.get(name) or {}
+        columns = block.get('columns', [])
+        return [dict(zip(columns, row)) for row in block.get('data', [])]
+    
+    async def iter_stock_data(
+        self,
+        ticker: str,
+        start_date: date,
+        end_date: date,
+        interval: CandleInterval = CandleInterval.DAY_1,
+        engine: str = DEFAULT_ENGINE,
+        market: str = DEFAULT_MARKET
+    ) -> AsyncIterator[CandleSeries]:
+        """
+        Отдает свечи по акции за период постранично, не накапливая весь период в памяти
+        
+        Части периода загружаются последовательно, поэтому в памяти находится не больше одной страницы ISS.
+        
+        Args:
+            ticker: Тикер акции (например, 'SBER')
+            start_date: Дата начала периода
+            end_date: Дата окончания периода
+            interval: Интервал свечей
+            engine: Торговая система бумаги
+            market: Рынок бумаги
+            
+        Yields:
+            Ряд свечей одной страницы ответа
+        """
+        logger.debug(f"Потоковый запрос данных для {ticker} ({interval.value}) с {start_date} по {end_date}")
+        
+        chunk_days = CHUNK_DAYS_BY_INTERVAL.get(interval, MOEX_CHUNK_DAYS)
+        for chunk_start, chunk_end in self._split_range(start_date, end_date, chunk_days):
+            async for columns, rows in self._iter_pages(ticker, chunk_start, chunk_end, interval, engine, market):
+                yield self._decode_candles(columns, rows)
+    
+    def _decode_candles(self, columns: List[str], rows: List[List]) -> CandleSeries:
+        """Строит ряд свечей из строк ISS, находя поля по именам колонок"""
+        if not rows:
+            return CandleSeries()
+        with stage('parse'):
+            series = decode_candles(columns, rows)
+        self.stats['rows'] += len(series)
+        return series
+    
+    def _split_range(self, start_date: date, end_date: date, chunk_days: int) -> List[Tuple[date, date]]:
+        """Разбивает период на части не длиннее chunk_days дней"""
+        chunks = []
+        chunk_start = start_date
+        while chunk_start <= end_date:
+            chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end_date)
+            chunks.append((chunk_start, chunk_end))
+            chunk_start = chunk_end + timedelta(days=1)
+        return chunks
+    
+    async def _fetch_candles(
+        self, ticker: str, start_date: date, end_date: date, interval: CandleInterval,
+        engine: str = DEFAULT_ENGINE, market: str = DEFAULT_MARKET
+    ) -> CandleBlock:
+        """
+        Загружает все свечи за период, переходя по страницам ISS через параметр start
+        
+        Returns:
+            Имена колонок и строки свечей в формате ISS (страницы одного запроса имеют одинаковые колонки)
+        """
+        columns: List[str] = []
+        candles_data = []
+        async for columns, rows in self._iter_pages(ticker, start_date, end_date, interval, engine, market):
+            candles_data.extend(rows)
+        
+        logger.debug(f"Получено {len(candles_data)} свечей для {ticker} с {start_date} по {end_date}")
+        return columns, candles_data
+    
+    async def _iter_pages(
+        self, ticker: str, start_date: date, end_date: date, interval: CandleInterval,
+        engine: str = DEFAULT_ENGINE, market: str = DEFAULT_MARKET
+    ) -> AsyncIterator[CandleBlock]:
+        """
+        Отдает непустые страницы свечей за период (колонки и строки) по мере загрузки
+        
+        Конец выдачи определяется по блоку candles.cursor, если ISS его отдает, иначе по пустой странице,
+        по странице короче полной или по последней свече, после которой следующая начиналась бы уже
+        за концом периода. Размер полной страницы клиент узнает из ответов ISS (страница, за которой
+        последовала следующая, была полной), а не из настроек, поэтому ограничение ISS на число строк
+        в ответе не обрезает историю.
+        """
+        url = f"{self.base_url}/engines/{engine}/markets/{market}/securities/{ticker}/candles.json"
+        params = {
+            'from': start_date.strftime('%Y-%m-%d'),
+            'till': end_date.strftime('%Y-%m-%d'),
+            'interval': interval.iss_code,
+            'iss.meta': 'off',
+            'iss.only': 'candles,candles.cursor'
+        }
+        
+        period_end = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+        offset = 0
+        previous_size = 0
+        while True:
+            params['start'] = offset
+            columns, page, total = await self._fetch_page(url, params)
+            if not page:
+                break
+            if previous_size:
+                self.page_size = previous_size
+            offset += len(page)
+            yield columns, page
+            if total is not None:
+                if offset >= total:
+                    break
+            # Страница короче полной - последняя
+            elif self.page_size is not None and len(page) < self.page_size:
+                break
+            elif self._reaches_period_end(columns, page, interval, period_end):
+                break
+            previous_size = len(page)
+    
+    @staticmethod
+    def _reaches_period_end(
+        columns: List[str], page: List[List], interval: CandleInterval, period_end: datetime
+    ) -> bool:
+        """Проверяет, что следующая после страницы свеча начиналась бы за концом периода"""
+        if 'begin' not in columns:
+            return False
+        last_begin = datetime.fromisoformat(page[-1][columns.index('begin')])
+        return last_begin + CANDLE_DURATION[interval] >= period_end
+    
+    async def _fetch_page(self, url: str, params: Dict) -> Tuple[List[str], List[List], Optional[int]]:
+        """
+        Загружает одну страницу свечей
+        
+        Returns:
+            Имена колонок, строки свечей и общее число свечей по блоку candles.cursor (None - блока нет)
+        """
+        data = await self._get_json(url, params)
+        
+        cursor = self._block_rows(data, 'candles.cursor')
+        total = int(cursor[0]['TOTAL']) if cursor and cursor[0].get('TOTAL') is not None else None
+        if 'candles' not in data:
+            return [], [], total
+        return data['candles']['columns'], data['candles']['data'], total
+    
+    def get_stats(self) -> Dict[str, object]:
+        """Счетчики запросов, состояние circuit breaker и ограничителя частоты"""
+        return {
+            **self.stats,
+            'breaker': self.breaker.get_stats(),
+            'rate_limiter': self.rate_limiter.get_stats() if self.rate_limiter is not None else None
+        }
+    
+    async def _get_json(self, url: str, params: Dict) -> Dict:
+        """
+        Выполняет GET запрос к ISS с повторами при 429/5xx, таймаутах и ошибках соединения
+        
+        Raises:
+            CircuitOpenError: Цепь разомкнута, запрос не выполнялся
+            DeadlineExceededError: Истек срок запроса к API
+            MoexUnavailableError: Попытки исчерпаны
+            aiohttp.ClientResponseError: ISS ответил ошибкой, которую нет смысла повторять (например, 404)
+        """
+        if not self.breaker.allow_request():
+            raise CircuitOpenError("ISS недоступен, запросы временно приостановлены")
+        
+        attempt = 0
+        while True:
+            attempt += 1
+            retry_after = None
+            try:
+                data = await self._request_json(url, params)
+            except aiohttp.ClientResponseError as e:
+                if e.status not in RETRYABLE_STATUSES:
+                    # ISS отвечает, ошибка в самом запросе
+                    self.breaker.record_success()
+                    raise
+                if e.status == 429:
+                    retry_after = self._retry_after(e)
+                    if self.rate_limiter is not None:
+                        self.rate_limiter.penalize()
+                error = e
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+                budget = remaining_budget()
+                if budget is not None and budget <= 0:
+                    self.stats['deadline_exceeded'] += 1
+                    raise DeadlineExceededError("Истек срок запроса к ISS") from e
+                error = e
+            else:
+                self.breaker.record_success()
+                if self.rate_limiter is not None:
+                    self.rate_limiter.reward()
+                return data
+            
+            delay = backoff_delay(attempt, retry_after)
+            budget = remaining_budget()
+            if attempt >= MOEX_RETRY_ATTEMPTS or (budget is not None and delay >= budget):
+                self.stats['failures'] += 1
+                self.breaker.record_failure()
+                raise MoexUnavailableError(
+                    f"ISS не ответил за {attempt} попыток: {self._describe_error(error)}"
+                ) from error
+            
+            self.stats['retries'] += 1
+            logger.warning(
+                f"Ошибка запроса к ISS ({self._describe_error(error)}), попытка {attempt + 1} через {delay:.2f} с"
+            )
+            await asyncio.sleep(delay)
+            # Пока запрос ждал, цепь могла разомкнуться из-за других запросов
+            if self.breaker.state == 'open':
+                raise CircuitOpenError("ISS недоступен, запросы временно приостановлены") from error
+    
+    async def _request_json(self, url: str, params: Dict) -> Dict:
+        """Одна попытка GET запроса в рамках общего бюджета частоты, числа одновременных запросов и срока"""
+        if self.rate_limiter is not None:
+            waiting_since = time.perf_counter()
+            budget = remaining_budget()
+            if budget is None:
+                await self.rate_limiter.acquire()
+            else:
+                try:
+                    await asyncio.wait_for(self.rate_limiter.acquire(), max(budget, 0))
+                except asyncio.TimeoutError:
+                    self.stats['deadline_exceeded'] += 1
+                    raise DeadlineExceededError("Истек срок запроса к ISS в очереди ограничителя частоты") from None
+            record_stage('rate_limit_wait', time.perf_counter() - waiting_since)
+        
+        session = await self._get_session()
+        async with self._request_semaphore:
+            # Таймаут попытки не выходит за срок запроса к API
+            budget = remaining_budget()
+            if budget is not None and budget <= 0:
+                self.stats['deadline_exceeded'] += 1
+                raise DeadlineExceededError("Истек срок запроса к ISS")
+            timeout = aiohttp.ClientTimeout(total=MOEX_API_TIMEOUT if budget is None else min(MOEX_API_TIMEOUT, budget))
+            
+            self.stats['requests'] += 1
+            with stage('upstream_fetch'):
+                async with session.get(url, params=params, timeout=timeout) as response:
+                    response.raise_for_status()
+                    body = await response.read()
+        
+        self.stats['bytes'] += len(body)
+        with stage('parse'):
+            return loads(body)
+    
+    @staticmethod
+    def _describe_error(error: Exception) -> str:
+        """Краткое описание ошибки запроса для логов"""
+        if isinstance(error, aiohttp.ClientResponseError):
+            return f"HTTP {error.status}"
+        return str(error) or type(error).__name__
+    
+    @staticmethod
+    def _retry_after(error: aiohttp.ClientResponseError) -> Optional[float]:
+        """Задержка из заголовка Retry-After (в секундах), если он есть"""
+        try:
+            return float(error.headers.get('Retry-After')) if error.headers else None
+        except (TypeError, ValueError):
+            return None
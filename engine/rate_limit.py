@@ -0,0 +1,104 @@
+"""
+Ограничение частоты запросов к ISS
+
+Token bucket: токены пополняются со скоростью rate в секунду до capacity,
+каждый запрос забирает один токен. Ожидающие обслуживаются по очереди.
+
+Скорость адаптивная (AIMD): ответ 429 от ISS вдвое снижает ее (не ниже MOEX_RATE_MIN_FRACTION
+от настроенной), каждый успешный ответ понемногу возвращает ее к настроенной.
+"""
+
+import asyncio
+import os
+import time
+from typing import Dict, Optional
+
+# Общий бюджет запросов к ISS в секунду (0 - без ограничения)
+MOEX_RATE_LIMIT = float(os.getenv("MOEX_RATE_LIMIT", "10"))
+
+# Число процессов приложения: бюджет делится между ними поровну
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+# Сколько запросов можно сделать подряд без ожидания
+MOEX_RATE_BURST = float(os.getenv("MOEX_RATE_BURST", "20"))
+
+# Нижняя граница скорости после замедлений, доля от настроенной
+MOEX_RATE_MIN_FRACTION = float(os.getenv("MOEX_RATE_MIN_FRACTION", "0.1"))
+
+# За сколько успешных запросов скорость восстанавливается от нижней границы до настроенной
+MOEX_RATE_RECOVERY_REQUESTS = int(os.getenv("MOEX_RATE_RECOVERY_REQUESTS", "50"))
+
+
+class TokenBucket:
+    """
+    Асинхронный token bucket, общий для всех запросов к ISS
+    
+    Args:
+        rate: Пополнение, токенов в секунду
+        capacity: Максимальный запас токенов (по умолчанию max(rate, 1))
+    """
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.max_rate = rate
+        self.min_rate = rate * MOEX_RATE_MIN_FRACTION
+        self.capacity = capacity or max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.stats = {'acquired': 0, 'waited': 0, 'wait_seconds': 0.0, 'throttled': 0}
+    
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """Забирает токены, дожидаясь пополнения при необходимости"""
+        async with self._lock:
+            started = time.monotonic()
+            self._refill()
+            if self._tokens < tokens:
+                self.stats['waited'] += 1
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
+            self.stats['acquired'] += 1
+            self.stats['wait_seconds'] += time.monotonic() - started
+    
+    def penalize(self) -> None:
+        """Вдвое снижает скорость и сбрасывает запас токенов (ISS ответил 429)"""
+        self._refill()
+        self.rate = max(self.min_rate, self.rate / 2)
+        self._tokens = 0.0
+        self.stats['throttled'] += 1
+    
+    def reward(self) -> None:
+        """Понемногу возвращает скорость к настроенной после успешного ответа"""
+        if self.rate < self.max_rate:
+            self._refill()
+            step = (self.max_rate - self.min_rate) / max(MOEX_RATE_RECOVERY_REQUESTS, 1)
+            self.rate = min(self.max_rate, self.rate + step)
+    
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+    
+    def get_stats(self) -> Dict[str, float]:
+        """Счетчики и текущие настройки"""
+        self._refill()
+        return {
+            **self.stats,
+            'rate': self.rate,
+            'max_rate': self.max_rate,
+            'capacity': self.capacity,
+            'tokens': self._tokens
+        }
+
+
+def default_rate_limiter() -> Optional[TokenBucket]:
+    """
+    Ограничитель процесса по MOEX_RATE_LIMIT и MOEX_RATE_BURST или None, если ограничение выключено
+    
+    При нескольких процессах приложения каждый получает 1/WEB_CONCURRENCY бюджета.
+    """
+    if MOEX_RATE_LIMIT <= 0:
+        return None
+    return TokenBucket(MOEX_RATE_LIMIT / WEB_CONCURRENCY, max(1.0, MOEX_RATE_BURST / WEB_CONCURRENCY))
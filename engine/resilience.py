@@ -0,0 +1,157 @@
+"""
+Устойчивость запросов к ISS: повторы с backoff, сроки запросов и circuit breaker
+
+- Ответы 429/5xx, таймауты и ошибки соединения повторяются с экспоненциальной задержкой
+  со случайным разбросом (full jitter), заголовок Retry-After учитывается.
+- Срок (deadline) задается на весь запрос к API через deadline_scope и хранится в contextvar,
+  поэтому действует и в задачах, созданных внутри запроса. Таймаут каждой попытки не превышает
+  оставшийся бюджет, повтор не начинается, если задержка перед ним выходит за срок.
+- Circuit breaker после MOEX_BREAKER_FAILURES неудачных запросов подряд на MOEX_BREAKER_RESET_SECONDS
+  перестает обращаться к ISS, затем пропускает пробный запрос.
+"""
+
+import contextvars
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Число попыток одного запроса к ISS (включая первую)
+MOEX_RETRY_ATTEMPTS = int(os.getenv("MOEX_RETRY_ATTEMPTS", "3"))
+
+# Базовая и максимальная задержка между попытками, секунды
+MOEX_RETRY_BASE_DELAY = float(os.getenv("MOEX_RETRY_BASE_DELAY", "0.2"))
+MOEX_RETRY_MAX_DELAY = float(os.getenv("MOEX_RETRY_MAX_DELAY", "5"))
+
+# Сколько неудачных запросов подряд размыкают цепь и на сколько секунд
+MOEX_BREAKER_FAILURES = int(os.getenv("MOEX_BREAKER_FAILURES", "5"))
+MOEX_BREAKER_RESET_SECONDS = float(os.getenv("MOEX_BREAKER_RESET_SECONDS", "30"))
+
+# Коды ответа ISS, при которых запрос повторяется
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class MoexUnavailableError(Exception):
+    """ISS не ответил: попытки исчерпаны, цепь разомкнута или истек срок запроса"""
+
+
+class CircuitOpenError(MoexUnavailableError):
+    """Цепь разомкнута: запрос к ISS не выполнялся"""
+
+
+class DeadlineExceededError(MoexUnavailableError):
+    """Истек срок запроса к API"""
+
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar('moex_deadline', default=None)
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[None]:
+    """
+    Ограничивает все запросы к ISS внутри блока сроком в seconds секунд от текущего момента
+    
+    Вложенный срок не может быть позже внешнего. None - без ограничения.
+    """
+    if seconds is None:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    """Секунд до срока текущего запроса (может быть отрицательным) или None, если срока нет"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    Задержка перед повтором после attempt неудачных попыток
+    
+    Случайная в пределах [0, base * 2^(attempt-1)], не больше MOEX_RETRY_MAX_DELAY;
+    Retry-After от ISS задает нижнюю границу.
+    """
+    delay = random.uniform(0, min(MOEX_RETRY_MAX_DELAY, MOEX_RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker запросов к ISS
+    
+    closed - запросы идут, неудачи считаются; open - запросы не выполняются;
+    half_open - срок размыкания прошел, пропускается один пробный запрос: успех замыкает цепь,
+    неудача снова размыкает. Если пробный запрос не завершился за reset_seconds (например, отменен),
+    пропускается следующий.
+    
+    Args:
+        failure_threshold: Неудачных запросов подряд до размыкания
+        reset_seconds: Сколько секунд цепь остается разомкнутой
+    """
+    
+    def __init__(self, failure_threshold: Optional[int] = None, reset_seconds: Optional[float] = None):
+        self.failure_threshold = failure_threshold or MOEX_BREAKER_FAILURES
+        self.reset_seconds = reset_seconds if reset_seconds is not None else MOEX_BREAKER_RESET_SECONDS
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at: Optional[float] = None
+        self.stats = {'opened': 0, 'rejected': 0}
+    
+    def allow_request(self) -> bool:
+        """Можно ли выполнить запрос к ISS"""
+        if self.state == 'closed':
+            return True
+        now = time.monotonic()
+        if self.state == 'open' and now - self._opened_at >= self.reset_seconds:
+            self.state = 'half_open'
+            self._probe_started_at = None
+        if self.state == 'half_open':
+            if self._probe_started_at is None or now - self._probe_started_at >= self.reset_seconds:
+                self._probe_started_at = now
+                return True
+        self.stats['rejected'] += 1
+        return False
+    
+    def record_success(self) -> None:
+        """ISS ответил: цепь замыкается"""
+        if self.state != 'closed':
+            logger.info("ISS снова отвечает, запросы возобновлены")
+        self.state = 'closed'
+        self._failures = 0
+        self._probe_started_at = None
+    
+    def record_failure(self) -> None:
+        """ISS не ответил после всех попыток"""
+        self._failures += 1
+        if self.state == 'half_open' or self._failures >= self.failure_threshold:
+            if self.state != 'open':
+                self.stats['opened'] += 1
+                logger.warning(
+                    f"ISS недоступен ({self._failures} неудач подряд), "
+                    f"запросы приостановлены на {self.reset_seconds:.0f} с"
+                )
+            self.state = 'open'
+            self._opened_at = time.monotonic()
+            self._probe_started_at = None
+    
+    def get_stats(self) -> Dict[str, object]:
+        """Состояние цепи и счетчики"""
+        return {**self.stats, 'state': self.state, 'consecutive_failures': self._failures}
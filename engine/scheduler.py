@@ -0,0 +1,337 @@
+"""
+Фоновый прогрев кэша для настроенного набора тикеров
+
+Две задачи в процессе приложения:
+- eod: после окончания вечерней сессии дополняет кэш за последние PREFETCH_HISTORY_DAYS дней
+  по предыдущий день включительно (загружаются только непокрытые периоды), прогресс сохраняется
+  в prefetch_state, поэтому прерванный прогон продолжается после перезапуска;
+- refresh: в торговые часы каждые PREFETCH_REFRESH_SECONDS секунд перезагружает свечи текущего дня.
+
+Время запуска - локальное время сервера. Запросы к ISS идут через общий MoexClient,
+поэтому подчиняются общему бюджету частоты запросов (MOEX_RATE_LIMIT).
+Если у DataService есть блокировки между процессами, каждый прогон выполняет только один
+процесс приложения, остальные его пропускают.
+"""
+
+import asyncio
+import logging
+import os
+import random
+from contextlib import asynccontextmanager
+from datetime import date, datetime, time, timedelta
+from typing import AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from models.candle import CandleInterval
+from models.prefetch_state import PrefetchState
+
+from .data_service import DataService
+
+logger = logging.getLogger(__name__)
+
+# Тикеры для прогрева через запятую
+PREFETCH_TICKERS = os.getenv("PREFETCH_TICKERS", "")
+
+# Режим торгов, все бумаги которого прогреваются (например, TQBR)
+PREFETCH_BOARD = os.getenv("PREFETCH_BOARD", "")
+
+# Интервалы свечей через запятую
+PREFETCH_INTERVALS = os.getenv("PREFETCH_INTERVALS", "1d")
+
+# Глубина истории, которую держит прогрев, дней
+PREFETCH_HISTORY_DAYS = int(os.getenv("PREFETCH_HISTORY_DAYS", "365"))
+
+# Время ежедневного прогона за предыдущий день (ЧЧ:ММ), после окончания вечерней сессии
+PREFETCH_EOD_TIME = os.getenv("PREFETCH_EOD_TIME", "01:00")
+
+# Начало торговых часов, в которые обновляются свечи текущего дня (ЧЧ:ММ)
+PREFETCH_REFRESH_FROM = os.getenv("PREFETCH_REFRESH_FROM", "10:00")
+
+# Конец торговых часов (ЧЧ:ММ), окончание вечерней сессии
+PREFETCH_REFRESH_TILL = os.getenv("PREFETCH_REFRESH_TILL", "23:50")
+
+# Период обновления свечей текущего дня, секунды (0 - не обновлять)
+PREFETCH_REFRESH_SECONDS = float(os.getenv("PREFETCH_REFRESH_SECONDS", "300"))
+
+# Случайная добавка к каждому ожиданию, секунды
+PREFETCH_JITTER_SECONDS = float(os.getenv("PREFETCH_JITTER_SECONDS", "30"))
+
+# Число тикеров, прогреваемых одновременно
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "2"))
+
+EOD_JOB = "eod"
+REFRESH_JOB = "refresh"
+
+
+def _parse_time(value: str) -> time:
+    hours, minutes = value.split(':')
+    return time(int(hours), int(minutes))
+
+
+def _split(value: str) -> List[str]:
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class PrefetchScheduler:
+    """
+    Планировщик фонового прогрева кэша
+    
+    Args:
+        data_service: Общий сервис данных приложения
+        session_factory: Фабрика сессий для сохранения прогресса
+        tickers: Тикеры для прогрева (по умолчанию PREFETCH_TICKERS)
+        board: Режим торгов, все бумаги которого прогреваются (по умолчанию PREFETCH_BOARD)
+        intervals: Интервалы свечей (по умолчанию PREFETCH_INTERVALS)
+    """
+    
+    def __init__(
+        self,
+        data_service: DataService,
+        session_factory: async_sessionmaker,
+        tickers: Optional[List[str]] = None,
+        board: Optional[str] = None,
+        intervals: Optional[List[CandleInterval]] = None
+    ):
+        self.data_service = data_service
+        self.session_factory = session_factory
+        self.tickers = [ticker.upper() for ticker in (tickers if tickers is not None else _split(PREFETCH_TICKERS))]
+        self.board = board if board is not None else PREFETCH_BOARD
+        self.intervals = intervals or [CandleInterval(value) for value in _split(PREFETCH_INTERVALS)]
+        self.history_days = PREFETCH_HISTORY_DAYS
+        self.eod_time = _parse_time(PREFETCH_EOD_TIME)
+        self.refresh_from = _parse_time(PREFETCH_REFRESH_FROM)
+        self.refresh_till = _parse_time(PREFETCH_REFRESH_TILL)
+        self.refresh_seconds = PREFETCH_REFRESH_SECONDS
+        self.jitter_seconds = PREFETCH_JITTER_SECONDS
+        self.concurrency = PREFETCH_CONCURRENCY
+        self._universe: List[str] = []
+        self._tasks: List[asyncio.Task] = []
+        self.jobs: Dict[str, Dict] = {job: self._new_job_status() for job in (EOD_JOB, REFRESH_JOB)}
+    
+    @property
+    def enabled(self) -> bool:
+        return bool(self.tickers or self.board)
+    
+    async def start(self) -> None:
+        """Запускает фоновые задачи, если задан набор тикеров"""
+        if not self.enabled:
+            logger.info("Фоновый прогрев кэша выключен: не заданы PREFETCH_TICKERS и PREFETCH_BOARD")
+            return
+        self._tasks = [asyncio.create_task(self._eod_loop(), name="prefetch-eod")]
+        if self.refresh_seconds > 0:
+            self._tasks.append(asyncio.create_task(self._refresh_loop(), name="prefetch-refresh"))
+        logger.info(f"Фоновый прогрев кэша запущен: тикеры {self.tickers}, режим торгов '{self.board}'")
+    
+    async def stop(self) -> None:
+        """Останавливает фоновые задачи; прогресс прогона уже сохранен в базе данных"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+    
+    def get_status(self) -> Dict:
+        """Настройки и состояние задач прогрева"""
+        return {
+            'enabled': self.enabled,
+            'board': self.board or None,
+            'tickers': len(self._universe) or len(self.tickers),
+            'intervals': [interval.value for interval in self.intervals],
+            'history_days': self.history_days,
+            'jobs': {
+                job: {
+                    key: value.isoformat() if isinstance(value, (date, datetime)) else value
+                    for key, value in status.items()
+                }
+                for job, status in self.jobs.items()
+            }
+        }
+    
+    async def resolve_universe(self) -> List[str]:
+        """Тикеры для прогрева: заданный список и бумаги режима торгов"""
+        tickers = set(self.tickers)
+        if self.board:
+            try:
+                tickers.update(await self.data_service.moex_client.get_board_securities(self.board))
+            except Exception as e:
+                # Оставляем состав, полученный в прошлый раз
+                logger.error(f"Ошибка при получении бумаг режима торгов {self.board}: {e}")
+                tickers.update(self._universe)
+        self._universe = sorted(tickers)
+        return self._universe
+    
+    def eod_run_date(self, now: Optional[datetime] = None) -> date:
+        """Закрытый день, за который уже должен был пройти ежедневный прогон (накануне дня прогона)"""
+        now = now or datetime.now()
+        if now.time() >= self.eod_time:
+            return now.date() - timedelta(days=1)
+        return now.date() - timedelta(days=2)
+    
+    def next_eod_at(self, now: Optional[datetime] = None) -> datetime:
+        """Время следующего ежедневного прогона"""
+        now = now or datetime.now()
+        run_at = datetime.combine(now.date(), self.eod_time)
+        return run_at if run_at > now else run_at + timedelta(days=1)
+    
+    async def run_eod(self, run_date: date) -> None:
+        """
+        Дополняет кэш всех тикеров за PREFETCH_HISTORY_DAYS дней по закрытый день run_date
+        
+        Обновление в торговые часы записывает свечи run_date без покрытия, поэтому после окончания
+        сессии они загружаются заново вместе с остальными непокрытыми периодами и только теперь
+        отмечаются в покрытии. Недельные свечи незакрытой недели в покрытие не попадают.
+        Прогон, прерванный для того же run_date, продолжается с сохраненной позиции,
+        уже завершенный прогон не повторяется.
+        """
+        state = await self._load_state(EOD_JOB)
+        if state is not None and state.run_date == run_date and state.completed:
+            logger.info(f"Ежедневный прогрев за {run_date} уже выполнен")
+            return
+        cursor = state.cursor if state is not None and state.run_date == run_date else 0
+        
+        tickers = await self.resolve_universe()
+        start_date = run_date - timedelta(days=self.history_days)
+        status = self.jobs[EOD_JOB]
+        status.update(
+            running=True, run_date=run_date, done=min(cursor, len(tickers)), total=len(tickers),
+            errors=0, started_at=datetime.now()
+        )
+        if cursor:
+            logger.info(f"Продолжаем ежедневный прогрев за {run_date} с {cursor}/{len(tickers)}")
+        await self._save_state(EOD_JOB, run_date, cursor, len(tickers), completed=False)
+        
+        semaphore = asyncio.Semaphore(self.concurrency)
+        finished = set()
+        next_cursor = cursor
+        
+        async def process(index: int, ticker: str) -> None:
+            nonlocal next_cursor
+            async with semaphore:
+                await self._warm_ticker(EOD_JOB, ticker, start_date, run_date)
+            status['done'] += 1
+            # Сохраняем позицию, до которой все тикеры обработаны
+            finished.add(index)
+            advanced = next_cursor in finished
+            while next_cursor in finished:
+                finished.discard(next_cursor)
+                next_cursor += 1
+            if advanced:
+                await self._save_state(EOD_JOB, run_date, next_cursor, len(tickers), completed=False)
+        
+        try:
+            await asyncio.gather(*(
+                process(index, ticker) for index, ticker in enumerate(tickers) if index >= cursor
+            ))
+        finally:
+            status['running'] = False
+        
+        await self._save_state(EOD_JOB, run_date, len(tickers), len(tickers), completed=True)
+        status['finished_at'] = datetime.now()
+        logger.info(f"Ежедневный прогрев за {run_date} завершен: {len(tickers)} тикеров, ошибок {status['errors']}")
+    
+    async def run_refresh(self, day: date) -> None:
+        """Перезагружает свечи за день для всех тикеров"""
+        tickers = self._universe or await self.resolve_universe()
+        status = self.jobs[REFRESH_JOB]
+        status.update(running=True, run_date=day, done=0, total=len(tickers), errors=0, started_at=datetime.now())
+        semaphore = asyncio.Semaphore(self.concurrency)
+        
+        async def process(ticker: str) -> None:
+            async with semaphore:
+                for interval in self.intervals:
+                    try:
+                        await self.data_service.refresh(ticker, day, day, interval)
+                    except Exception as e:
+                        self._record_error(REFRESH_JOB, ticker, e)
+            status['done'] += 1
+        
+        try:
+            await asyncio.gather(*(process(ticker) for ticker in tickers))
+        finally:
+            status['running'] = False
+        status['finished_at'] = datetime.now()
+    
+    @asynccontextmanager
+    async def _exclusive(self, job: str) -> AsyncIterator[bool]:
+        """Дает True, если прогон задачи выполняет этот процесс, а не другой процесс приложения"""
+        locks = self.data_service.locks
+        name = f"prefetch:{job}"
+        if locks is None:
+            yield True
+        elif not await locks.try_acquire(name):
+            logger.debug(f"Прогон {job} выполняет другой процесс приложения")
+            yield False
+        else:
+            try:
+                yield True
+            finally:
+                await locks.release(name)
+    
+    async def _eod_loop(self) -> None:
+        while True:
+            try:
+                async with self._exclusive(EOD_JOB) as owner:
+                    if owner:
+                        await self.run_eod(self.eod_run_date())
+            except Exception as e:
+                self.jobs[EOD_JOB]['last_error'] = str(e)
+                logger.error(f"Ошибка ежедневного прогрева кэша: {e}")
+            await self._sleep_until(EOD_JOB, self.next_eod_at())
+    
+    async def _refresh_loop(self) -> None:
+        while True:
+            await self._sleep_until(REFRESH_JOB, datetime.now() + timedelta(seconds=self.refresh_seconds))
+            now = datetime.now()
+            # Только в торговые часы рабочих дней, после них день загружает ежедневный прогон
+            if now.weekday() >= 5 or not self.refresh_from <= now.time() < self.refresh_till:
+                continue
+            try:
+                async with self._exclusive(REFRESH_JOB) as owner:
+                    if owner:
+                        await self.run_refresh(now.date())
+            except Exception as e:
+                self.jobs[REFRESH_JOB]['last_error'] = str(e)
+                logger.error(f"Ошибка обновления свечей текущего дня: {e}")
+    
+    async def _warm_ticker(self, job: str, ticker: str, start_date: date, run_date: date) -> None:
+        for interval in self.intervals:
+            try:
+                await self.data_service.fill_cache(ticker, start_date, run_date, interval)
+            except Exception as e:
+                # Покрытие не сохранено, следующий прогон загрузит период снова
+                self._record_error(job, ticker, e)
+    
+    def _record_error(self, job: str, ticker: str, error: Exception) -> None:
+        self.jobs[job]['errors'] += 1
+        self.jobs[job]['last_error'] = f"{ticker}: {error}"
+        logger.error(f"Ошибка прогрева кэша для {ticker}: {error}")
+    
+    async def _sleep_until(self, job: str, moment: datetime) -> None:
+        """Ждет до момента времени со случайной добавкой, чтобы не создавать всплесков запросов"""
+        delay = max(0.0, (moment - datetime.now()).total_seconds()) + random.uniform(0, self.jitter_seconds)
+        self.jobs[job]['next_run_at'] = datetime.now() + timedelta(seconds=delay)
+        await asyncio.sleep(delay)
+    
+    async def _load_state(self, job: str) -> Optional[PrefetchState]:
+        async with self.session_factory() as db:
+            result = await db.execute(select(PrefetchState).where(PrefetchState.job == job))
+            return result.scalar_one_or_none()
+    
+    async def _save_state(self, job: str, run_date: date, cursor: int, total: int, completed: bool) -> None:
+        values = {'run_date': run_date, 'cursor': cursor, 'total': total, 'completed': completed}
+        stmt = insert(PrefetchState).values(job=job, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[PrefetchState.job], set_={**values, 'updated_at': func.now()}
+        )
+        async with self.session_factory() as db:
+            await db.execute(stmt)
+            await db.commit()
+    
+    @staticmethod
+    def _new_job_status() -> Dict:
+        return {
+            'running': False, 'run_date': None, 'done': 0, 'total': 0, 'errors': 0,
+            'started_at': None, 'finished_at': None, 'next_run_at': None, 'last_error': None
+        }
@@ -0,0 +1,414 @@
+"""
+Справочник бумаг ISS: проверка тикеров, даты торгов и рынок бумаги без лишних запросов к бирже
+
+Справочник хранится в таблице securities и в памяти каждого процесса:
+- бумаги режимов торгов SECURITIES_BOARDS (лот, статус торгов, название) загружаются с ISS
+  раз в SECURITIES_REFRESH_HOURS часов одним процессом приложения, остальные перечитывают таблицу;
+- при первом запросе тикера его режимы торгов читаются из securities/{ticker}.json: основной режим,
+  торговая система и рынок для запросов свечей, первый и последний дни торгов на рынке;
+- тикер, которого ISS не знает, запоминается на SECURITIES_NEGATIVE_TTL_HOURS часов, и запросы
+  с ним отклоняются без обращения к бирже.
+
+Если ISS недоступен, непроверенный тикер считается существующим: справочник - оптимизация,
+и без него запросы обрабатываются как раньше.
+"""
+
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+from sqlalchemy import String, any_, cast, func, select
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from models.securities_refresh import SecuritiesRefresh
+from models.security import Security
+
+from .coverage import ONE_DAY, Interval
+from .locks import AdvisoryLocks
+from .moex_client import DEFAULT_ENGINE, DEFAULT_MARKET, MoexClient
+
+logger = logging.getLogger(__name__)
+
+# Проверять тикеры запросов по справочнику бумаг
+SECURITIES_DIRECTORY = os.getenv("SECURITIES_DIRECTORY", "true").lower() in ("1", "true", "yes")
+
+# Режимы торгов рынка акций, бумаги которых загружаются в справочник через запятую
+SECURITIES_BOARDS = os.getenv("SECURITIES_BOARDS", "TQBR")
+
+# Период обновления справочника и проверки известных тикеров, часы
+SECURITIES_REFRESH_HOURS = float(os.getenv("SECURITIES_REFRESH_HOURS", "24"))
+
+# Сколько помнить, что ISS не знает тикер, часы
+SECURITIES_NEGATIVE_TTL_HOURS = float(os.getenv("SECURITIES_NEGATIVE_TTL_HOURS", "6"))
+
+# Тикеров, проверяемых по ISS одновременно
+SECURITIES_LOOKUP_CONCURRENCY = int(os.getenv("SECURITIES_LOOKUP_CONCURRENCY", "4"))
+
+# Как часто перечитывать таблицу (проверки других процессов) и проверять, пора ли обновлять справочник, секунды
+RELOAD_SECONDS = 600
+
+# Блокировка обновления справочника с ISS между процессами приложения
+REFRESH_LOCK = "securities:refresh"
+
+# Колонки, которые обновляет список бумаг режима торгов (режим и рынок для известных тикеров
+# задает проверка тикера - основной режим бумаги может отличаться)
+BOARD_FIELDS = ('found', 'name', 'lot_size', 'is_traded')
+
+# Колонки, которые обновляет проверка тикера
+LOOKUP_FIELDS = ('found', 'board', 'engine', 'market', 'is_traded', 'listed_from', 'listed_till', 'checked_at')
+
+
+class SecurityInfo(NamedTuple):
+    """Запись справочника бумаг (колонки таблицы securities)"""
+    ticker: str
+    found: bool
+    name: Optional[str]
+    board: Optional[str]
+    engine: Optional[str]
+    market: Optional[str]
+    lot_size: Optional[int]
+    is_traded: Optional[bool]
+    listed_from: Optional[date]
+    listed_till: Optional[date]
+    checked_at: Optional[datetime]
+
+
+SECURITY_COLUMNS = [getattr(Security, field) for field in SecurityInfo._fields]
+
+
+def _parse_date(value: Optional[str]) -> Optional[date]:
+    return date.fromisoformat(value[:10]) if value else None
+
+
+def security_from_boards(ticker: str, boards: List[Dict], checked_at: datetime) -> SecurityInfo:
+    """
+    Запись справочника по режимам торгов бумаги из securities/{ticker}.json
+    
+    Рынок берется у основного режима торгов, даты торгов - по всем режимам этого рынка,
+    потому что свечи рынка включают историю режимов, на которых бумага торговалась раньше.
+    """
+    if not boards:
+        return SecurityInfo(ticker, False, None, None, None, None, None, None, None, None, checked_at)
+    
+    primary = next((board for board in boards if board.get('is_primary') == 1), boards[0])
+    market_boards = [
+        board for board in boards
+        if board.get('engine') == primary.get('engine') and board.get('market') == primary.get('market')
+    ]
+    starts = [
+        day for day in (_parse_date(board.get('history_from') or board.get('listed_from')) for board in market_boards)
+        if day is not None
+    ]
+    ends = [
+        day for day in (_parse_date(board.get('history_till') or board.get('listed_till')) for board in market_boards)
+        if day is not None
+    ]
+    is_traded = any(board.get('is_traded') == 1 for board in market_boards)
+    return SecurityInfo(
+        ticker=ticker,
+        found=True,
+        name=None,
+        board=primary.get('boardid'),
+        engine=primary.get('engine') or DEFAULT_ENGINE,
+        market=primary.get('market') or DEFAULT_MARKET,
+        lot_size=None,
+        is_traded=is_traded,
+        listed_from=min(starts) if starts else None,
+        # У торгуемой бумаги последний день торгов - сегодня
+        listed_till=None if is_traded or not ends else max(ends),
+        checked_at=checked_at
+    )
+
+
+class SecuritiesDirectory:
+    """
+    Справочник бумаг ISS с кэшем в памяти процесса
+    
+    Args:
+        moex_client: Общий клиент MOEX
+        session_factory: Фабрика сессий базы данных
+        locks: Блокировки между процессами (обновление с ISS выполняет один процесс)
+        boards: Режимы торгов, бумаги которых загружаются (по умолчанию SECURITIES_BOARDS)
+    """
+    
+    def __init__(
+        self,
+        moex_client: MoexClient,
+        session_factory: async_sessionmaker,
+        locks: Optional[AdvisoryLocks] = None,
+        boards: Optional[List[str]] = None
+    ):
+        self.moex_client = moex_client
+        self.session_factory = session_factory
+        self.locks = locks
+        self.boards = boards if boards is not None else [
+            board.strip().upper() for board in SECURITIES_BOARDS.split(',') if board.strip()
+        ]
+        self.refresh_interval = timedelta(hours=SECURITIES_REFRESH_HOURS)
+        self.negative_ttl = timedelta(hours=SECURITIES_NEGATIVE_TTL_HOURS)
+        self._entries: Dict[str, SecurityInfo] = {}
+        self._lookup_semaphore = asyncio.Semaphore(SECURITIES_LOOKUP_CONCURRENCY)
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {
+            'hits': 0,           # Тикеров, проверенных по справочнику без запроса к ISS
+            'negative_hits': 0,  # Из них неизвестных ISS
+            'lookups': 0,        # Тикеров, проверенных по ISS
+            'rejected': 0,       # Неизвестных тикеров в запросах
+            'errors': 0          # Ошибок обращения к ISS и базе данных
+        }
+        self.refreshed_at: Optional[datetime] = None
+    
+    async def start(self) -> None:
+        """Загружает справочник из базы данных и запускает его периодическое обновление"""
+        try:
+            await self.load()
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"Не удалось загрузить справочник бумаг: {e}")
+        self._task = asyncio.create_task(self._refresh_loop(), name="securities-refresh")
+    
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+    
+    def get(self, ticker: str) -> Optional[SecurityInfo]:
+        """Запись справочника (None - тикер еще не проверялся)"""
+        return self._entries.get(ticker)
+    
+    def market_params(self, ticker: str) -> Dict[str, str]:
+        """Торговая система и рынок бумаги для запросов свечей (пустой словарь - рынок акций по умолчанию)"""
+        entry = self._entries.get(ticker)
+        if entry is None or not entry.found or not entry.engine or not entry.market:
+            return {}
+        return {'engine': entry.engine, 'market': entry.market}
+    
+    def unlisted_ranges(self, ticker: str, start_date: date, end_date: date) -> List[Interval]:
+        """
+        Части периода до начала и после окончания торгов бумагой
+        
+        За эти дни свечей нет, поэтому они не запрашиваются у MOEX.
+        """
+        entry = self._entries.get(ticker)
+        if entry is None or not entry.found:
+            return []
+        ranges = []
+        if entry.listed_from is not None and start_date < entry.listed_from:
+            ranges.append((start_date, min(end_date, entry.listed_from - ONE_DAY)))
+        if entry.listed_till is not None and end_date > entry.listed_till:
+            ranges.append((max(start_date, entry.listed_till + ONE_DAY), end_date))
+        return ranges
+    
+    async def find_unknown(self, tickers: Sequence[str]) -> List[str]:
+        """
+        Проверяет тикеры по справочнику, обращаясь к ISS только за еще не проверенными
+        
+        Args:
+            tickers: Тикеры запроса
+            
+        Returns:
+            Тикеры, которых ISS не знает, в порядке запроса
+        """
+        tickers = list(dict.fromkeys(tickers))
+        unchecked = [ticker for ticker in tickers if not self._is_fresh(self._entries.get(ticker))]
+        self.stats['hits'] += len(tickers) - len(unchecked)
+        if unchecked:
+            # Тикеры мог уже проверить другой процесс приложения
+            await self._load_safe(unchecked)
+            unchecked = [ticker for ticker in unchecked if not self._is_fresh(self._entries.get(ticker))]
+            if unchecked:
+                await self.check(unchecked)
+        
+        unknown = [
+            ticker for ticker in tickers
+            if (entry := self._entries.get(ticker)) is not None and not entry.found and self._is_fresh(entry)
+        ]
+        self.stats['negative_hits'] += len([ticker for ticker in unknown if ticker not in unchecked])
+        self.stats['rejected'] += len(unknown)
+        return unknown
+    
+    async def check(self, tickers: Iterable[str]) -> None:
+        """Проверяет тикеры по ISS и сохраняет результат (в том числе отрицательный)"""
+        async def lookup(ticker: str) -> Optional[SecurityInfo]:
+            async with self._lookup_semaphore:
+                try:
+                    boards = await self.moex_client.get_security_boards(ticker)
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    logger.warning(f"Не удалось проверить тикер {ticker} по ISS, считаем его существующим: {e}")
+                    return None
+            self.stats['lookups'] += 1
+            return security_from_boards(ticker, boards, datetime.now(timezone.utc))
+        
+        results = [entry for entry in await asyncio.gather(*(lookup(ticker) for ticker in tickers)) if entry]
+        if not results:
+            return
+        for entry in results:
+            if not entry.found:
+                logger.info(f"Тикер {entry.ticker} не найден на ISS")
+        # В памяти результат нужен сразу, даже если база данных недоступна
+        for entry in results:
+            previous = self._entries.get(entry.ticker)
+            self._entries[entry.ticker] = entry if previous is None else previous._replace(
+                **{field: getattr(entry, field) for field in LOOKUP_FIELDS}
+            )
+        try:
+            await self._upsert([entry._asdict() for entry in results], LOOKUP_FIELDS)
+            await self.load([entry.ticker for entry in results])
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"Не удалось сохранить проверку тикеров в справочник бумаг: {e}")
+    
+    async def refresh(self) -> int:
+        """
+        Загружает бумаги режимов торгов с ISS и перепроверяет давно проверенные тикеры
+        
+        Returns:
+            Число бумаг в режимах торгов
+        """
+        rows: Dict[str, Dict] = {}
+        counts: Dict[str, int] = {}
+        for board in self.boards:
+            listing = await self.moex_client.get_board_listing(board)
+            counts[board] = len(listing)
+            for security in listing:
+                # Бумага нескольких режимов торгов сохраняется по первому из них
+                rows.setdefault(security['SECID'], {
+                    'ticker': security['SECID'],
+                    'found': True,
+                    'name': (security.get('SHORTNAME') or '')[:64] or None,
+                    'board': board,
+                    'engine': DEFAULT_ENGINE,
+                    'market': DEFAULT_MARKET,
+                    'lot_size': security.get('LOTSIZE'),
+                    'is_traded': security.get('STATUS') == 'A'
+                })
+        await self._upsert(list(rows.values()), BOARD_FIELDS)
+        await self.load()
+        
+        # Бумага могла перейти в другой режим торгов или прекратить торговаться
+        checked_before = datetime.now(timezone.utc) - self.refresh_interval
+        stale = [
+            entry.ticker for entry in self._entries.values()
+            if entry.found and entry.checked_at is not None and entry.checked_at < checked_before
+        ]
+        if stale:
+            await self.check(stale)
+        
+        self.refreshed_at = datetime.now(timezone.utc)
+        if counts:
+            await self._save_refresh_state(counts)
+        logger.info(f"Справочник бумаг обновлен: {len(rows)} бумаг режимов {', '.join(self.boards)}, "
+                    f"перепроверено {len(stale)} тикеров")
+        return len(rows)
+    
+    async def load(self, tickers: Optional[List[str]] = None) -> None:
+        """Перечитывает записи справочника (по умолчанию все) из базы данных"""
+        query = select(*SECURITY_COLUMNS)
+        if tickers is not None:
+            query = query.where(Security.ticker == any_(cast(tickers, ARRAY(String))))
+        async with self.session_factory() as db:
+            result = await db.execute(query)
+            entries = {row.ticker: SecurityInfo(*row) for row in result}
+        if tickers is None:
+            self._entries = entries
+        else:
+            self._entries.update(entries)
+    
+    def get_stats(self) -> Dict[str, object]:
+        """Счетчики справочника"""
+        return {
+            **self.stats,
+            'entries': len(self._entries),
+            'unknown': sum(1 for entry in self._entries.values() if not entry.found),
+            'refreshed_at': self.refreshed_at.isoformat() if self.refreshed_at else None
+        }
+    
+    def _is_fresh(self, entry: Optional[SecurityInfo]) -> bool:
+        """Можно ли отвечать по записи без проверки по ISS"""
+        if entry is None or entry.checked_at is None:
+            # Бумага известна только из списка режима торгов - дат торгов и рынка еще нет
+            return False
+        if entry.found:
+            # Известные тикеры перепроверяются при обновлении справочника
+            return True
+        return datetime.now(timezone.utc) - entry.checked_at < self.negative_ttl
+    
+    async def _load_safe(self, tickers: List[str]) -> None:
+        try:
+            await self.load(tickers)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"Не удалось прочитать справочник бумаг: {e}")
+    
+    async def _upsert(self, rows: List[Dict], fields: Sequence[str]) -> None:
+        """Добавляет записи и обновляет у существующих колонки fields"""
+        if not rows:
+            return
+        async with self.session_factory() as db:
+            # 12 параметров на строку, лимит asyncpg - 32767 параметров
+            for offset in range(0, len(rows), 2000):
+                stmt = insert(Security).values(rows[offset:offset + 2000])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[Security.ticker],
+                    set_={**{field: stmt.excluded[field] for field in fields}, 'updated_at': func.now()}
+                )
+                await db.execute(stmt)
+            await db.commit()
+    
+    async def _refresh_due(self) -> bool:
+        """Прошло ли SECURITIES_REFRESH_HOURS часов с обновления какого-либо режима торгов любым процессом"""
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(SecuritiesRefresh.board, SecuritiesRefresh.refreshed_at)
+                .where(SecuritiesRefresh.board == any_(cast(self.boards, ARRAY(String))))
+            )
+            refreshed = {board: refreshed_at for board, refreshed_at in result}
+        if refreshed:
+            self.refreshed_at = min(refreshed.values())
+        if set(self.boards) - refreshed.keys():
+            return True
+        return datetime.now(timezone.utc) - self.refreshed_at >= self.refresh_interval
+    
+    async def _save_refresh_state(self, counts: Dict[str, int]) -> None:
+        """Отмечает обновление режимов торгов (режим торгов - число его бумаг)"""
+        rows = [{'board': board, 'securities': total} for board, total in counts.items()]
+        stmt = insert(SecuritiesRefresh).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[SecuritiesRefresh.board],
+            set_={'securities': stmt.excluded.securities, 'refreshed_at': func.now()}
+        )
+        async with self.session_factory() as db:
+            await db.execute(stmt)
+            await db.commit()
+    
+    @asynccontextmanager
+    async def _exclusive(self) -> AsyncIterator[bool]:
+        """Дает True, если обновление выполняет этот процесс, а не другой процесс приложения"""
+        if self.locks is None:
+            yield True
+        elif not await self.locks.try_acquire(REFRESH_LOCK):
+            yield False
+        else:
+            try:
+                yield True
+            finally:
+                await self.locks.release(REFRESH_LOCK)
+    
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                if self.boards and await self._refresh_due():
+                    async with self._exclusive() as owner:
+                        if owner:
+                            await self.refresh()
+                await self.load()
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"Ошибка обновления справочника бумаг: {e}")
+            await asyncio.sleep(RELOAD_SECONDS)
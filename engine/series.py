@@ -0,0 +1,251 @@
+"""
+Компактный ряд свечей OHLCV
+
+Время начала свечи хранится как число секунд от 1970-01-01 (время биржи, без часового пояса)
+в array('q'), значения OHLCV - в array('d') по колонке на поле; отсутствующее значение - NaN.
+Ряд всегда упорядочен по времени и не содержит повторов.
+"""
+
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+SECONDS_PER_DAY = 86400
+
+# Колонки значений свечи в порядке хранения
+VALUE_COLUMNS = ('open', 'high', 'low', 'close', 'volume', 'value')
+
+NAN = float('nan')
+
+CandleRow = Tuple[datetime, Optional[float], Optional[float], Optional[float], float, Optional[float], Optional[float]]
+
+
+def to_timestamp(moment: datetime) -> int:
+    """Число секунд от 1970-01-01 для момента времени"""
+    return (
+        (moment.toordinal() - EPOCH_ORDINAL) * SECONDS_PER_DAY
+        + moment.hour * 3600 + moment.minute * 60 + moment.second
+    )
+
+
+def date_to_timestamp(day: date) -> int:
+    """Число секунд от 1970-01-01 для начала дня"""
+    return (day.toordinal() - EPOCH_ORDINAL) * SECONDS_PER_DAY
+
+
+def from_timestamp(ts: int) -> datetime:
+    """Момент времени для числа секунд от 1970-01-01"""
+    return EPOCH + timedelta(seconds=ts)
+
+
+@lru_cache(maxsize=65536)
+def _iso_date(ts: int) -> str:
+    """Строка YYYY-MM-DD (одни и те же моменты повторяются у всех тикеров)"""
+    return date.fromordinal(ts // SECONDS_PER_DAY + EPOCH_ORDINAL).isoformat()
+
+
+@lru_cache(maxsize=65536)
+def _iso_datetime(ts: int) -> str:
+    """Строка YYYY-MM-DD HH:MM:SS"""
+    return from_timestamp(ts).isoformat(' ')
+
+
+def _value(value) -> float:
+    return NAN if value is None else float(value)
+
+
+def _optional(value: float) -> Optional[float]:
+    return None if value != value else value
+
+
+class CandleSeries:
+    """
+    Упорядоченный по времени ряд свечей OHLCV
+    
+    Args:
+        ts: Время начала свечей по возрастанию без повторов
+        open, high, low, close, volume, value: Колонки значений той же длины
+    """
+    
+    __slots__ = ('ts',) + VALUE_COLUMNS
+    
+    def __init__(
+        self,
+        ts: Optional[array] = None,
+        open: Optional[array] = None,
+        high: Optional[array] = None,
+        low: Optional[array] = None,
+        close: Optional[array] = None,
+        volume: Optional[array] = None,
+        value: Optional[array] = None
+    ):
+        self.ts = ts if ts is not None else array('q')
+        for name, column in zip(VALUE_COLUMNS, (open, high, low, close, volume, value)):
+            setattr(self, name, column if column is not None else array('d', [NAN]) * len(self.ts))
+    
+    @classmethod
+    def from_rows(cls, rows: Iterable[CandleRow]) -> "CandleSeries":
+        """
+        Строит ряд из строк (начало, open, high, low, close, volume, value) в произвольном порядке
+        
+        При повторе времени остается последняя строка.
+        """
+        by_ts = {to_timestamp(row[0]): row for row in rows}
+        ordered = sorted(by_ts)
+        return cls(
+            array('q', ordered),
+            *(
+                array('d', [_value(by_ts[ts][column]) for ts in ordered])
+                for column in range(1, len(VALUE_COLUMNS) + 1)
+            )
+        )
+    
+    @classmethod
+    def from_closes(cls, pairs: Iterable[Tuple[date, float]]) -> "CandleSeries":
+        """Строит дневной ряд только из цен закрытия (дата, цена)"""
+        return cls.from_rows(
+            (datetime.combine(day, datetime.min.time()), None, None, None, price, None, None)
+            for day, price in pairs
+        )
+    
+    @classmethod
+    def concat(cls, series_list: Iterable["CandleSeries"]) -> "CandleSeries":
+        """Объединяет несколько рядов, при совпадении времени побеждает более поздний ряд"""
+        result = cls()
+        for series in series_list:
+            result = result.merge(series)
+        return result
+    
+    def __len__(self) -> int:
+        return len(self.ts)
+    
+    def __iter__(self) -> Iterator[CandleRow]:
+        """Итерирует строки (начало, open, high, low, close, volume, value), NaN заменяется на None"""
+        for index, ts in enumerate(self.ts):
+            yield (from_timestamp(ts), *(_optional(column[index]) for column in self.columns()))
+    
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, CandleSeries):
+            return NotImplemented
+        # Сравнение по байтам, чтобы NaN в одинаковых позициях считались равными
+        return all(
+            mine.tobytes() == theirs.tobytes()
+            for mine, theirs in zip((self.ts, *self.columns()), (other.ts, *other.columns()))
+        )
+    
+    def __repr__(self) -> str:
+        if not self.ts:
+            return "<CandleSeries(empty)>"
+        return f"<CandleSeries({len(self)} candles, {_iso_datetime(self.ts[0])}..{_iso_datetime(self.ts[-1])})>"
+    
+    def columns(self) -> Tuple[array, ...]:
+        """Колонки значений в порядке VALUE_COLUMNS"""
+        return tuple(getattr(self, name) for name in VALUE_COLUMNS)
+    
+    @property
+    def nbytes(self) -> int:
+        """Размер данных ряда в байтах"""
+        return sum(column.itemsize * len(column) for column in (self.ts, *self.columns()))
+    
+    def dates(self) -> List[date]:
+        """Даты начала свечей"""
+        return [date.fromordinal(ts // SECONDS_PER_DAY + EPOCH_ORDINAL) for ts in self.ts]
+    
+    def slice(self, start_date: date, end_date: date) -> "CandleSeries":
+        """
+        Возвращает свечи, начинающиеся в период (границы включительно)
+        
+        Args:
+            start_date: Дата начала периода
+            end_date: Дата окончания периода
+        """
+        lo = bisect_left(self.ts, date_to_timestamp(start_date))
+        hi = bisect_left(self.ts, date_to_timestamp(end_date + timedelta(days=1)))
+        if lo == 0 and hi == len(self.ts):
+            return self
+        return self._take(lo, hi)
+    
+    def merge(self, other: "CandleSeries") -> "CandleSeries":
+        """
+        Объединяет два ряда, при совпадении времени берется свеча из other
+        
+        Args:
+            other: Ряд с более свежими данными
+        """
+        if not other.ts:
+            return self
+        if not self.ts:
+            return other
+        # Непересекающиеся ряды просто склеиваются
+        if self.ts[-1] < other.ts[0]:
+            return self._concat(self, other)
+        if other.ts[-1] < self.ts[0]:
+            return self._concat(other, self)
+        
+        # Слияние двух упорядоченных рядов по индексам
+        order: List[Tuple[int, int]] = []  # (источник, индекс): 0 - self, 1 - other
+        i = j = 0
+        while i < len(self.ts) and j < len(other.ts):
+            left, right = self.ts[i], other.ts[j]
+            if left < right:
+                order.append((0, i))
+                i += 1
+            else:
+                order.append((1, j))
+                j += 1
+                if left == right:
+                    i += 1
+        order.extend((0, index) for index in range(i, len(self.ts)))
+        order.extend((1, index) for index in range(j, len(other.ts)))
+        
+        sources = ((self.ts, *self.columns()), (other.ts, *other.columns()))
+        return CandleSeries(*(
+            array(sources[0][column].typecode, [sources[source][column][index] for source, index in order])
+            for column in range(len(VALUE_COLUMNS) + 1)
+        ))
+    
+    def labels(self, date_only: bool = True) -> List[str]:
+        """
+        Строковые метки времени свечей
+        
+        Args:
+            date_only: Метки YYYY-MM-DD (дневные и недельные свечи) вместо YYYY-MM-DD HH:MM:SS
+        """
+        return list(map(_iso_date if date_only else _iso_datetime, self.ts))
+    
+    def to_dict(self, date_only: bool = True) -> Dict[str, float]:
+        """
+        Словарь {время: цена закрытия} для ответа API
+        
+        Args:
+            date_only: Ключи YYYY-MM-DD (дневные и недельные свечи) вместо YYYY-MM-DD HH:MM:SS
+        """
+        return dict(zip(self.labels(date_only), self.close))
+    
+    def to_ohlcv_dict(self, date_only: bool = True) -> Dict[str, Dict[str, Optional[float]]]:
+        """
+        Словарь {время: {open, high, low, close, volume, value}} для ответа API
+        
+        Args:
+            date_only: Ключи YYYY-MM-DD (дневные и недельные свечи) вместо YYYY-MM-DD HH:MM:SS
+        """
+        key = _iso_date if date_only else _iso_datetime
+        columns = self.columns()
+        return {
+            key(ts): {name: _optional(column[index]) for name, column in zip(VALUE_COLUMNS, columns)}
+            for index, ts in enumerate(self.ts)
+        }
+    
+    def _take(self, lo: int, hi: int) -> "CandleSeries":
+        return CandleSeries(self.ts[lo:hi], *(column[lo:hi] for column in self.columns()))
+    
+    @staticmethod
+    def _concat(first: "CandleSeries", second: "CandleSeries") -> "CandleSeries":
+        return CandleSeries(
+            first.ts + second.ts,
+            *(mine + theirs for mine, theirs in zip(first.columns(), second.columns()))
+        )
@@ -0,0 +1,108 @@
+"""
+Объединение одновременных запросов к MOEX (single-flight)
+
+Если загрузка периода по тикеру и интервалу свечей уже выполняется, новый запрос с пересекающимся
+периодом дожидается ее результата и сам запрашивает только непокрытый остаток.
+"""
+
+import asyncio
+import logging
+from datetime import date
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from models.candle import CandleInterval
+from .coverage import subtract_intervals
+from .series import CandleSeries
+
+logger = logging.getLogger(__name__)
+
+FetchFunction = Callable[[str, CandleInterval, date, date], Awaitable[CandleSeries]]
+
+
+class _Flight:
+    """Выполняющаяся загрузка периода по тикеру"""
+    
+    __slots__ = ('start_date', 'end_date', 'task')
+    
+    def __init__(self, start_date: date, end_date: date, task: asyncio.Task):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.task = task
+
+
+class SingleFlight:
+    """Реестр выполняющихся загрузок по тикерам и интервалам свечей"""
+    
+    def __init__(self):
+        self._flights: Dict[Tuple[str, CandleInterval], List[_Flight]] = {}
+        self.stats = {
+            'flights': 0,        # Запущено загрузок
+            'coalesced': 0,       # Запросов, полностью обслуженных чужой загрузкой
+            'partial': 0          # Запросов, частично обслуженных чужой загрузкой
+        }
+    
+    async def run(
+        self, ticker: str, interval: CandleInterval, start_date: date, end_date: date, fetch: FetchFunction
+    ) -> CandleSeries:
+        """
+        Получает данные за период, присоединяясь к уже выполняющимся загрузкам
+        
+        Args:
+            ticker: Тикер акции
+            interval: Интервал свечей
+            start_date: Дата начала периода
+            end_date: Дата окончания периода
+            fetch: Функция загрузки периода fetch(ticker, interval, start_date, end_date)
+            
+        Returns:
+            Ряд свечей за период
+        """
+        joined = [
+            flight for flight in self._flights.get((ticker, interval), [])
+            if flight.start_date <= end_date and flight.end_date >= start_date
+        ]
+        remaining = subtract_intervals(
+            start_date, end_date,
+            [(flight.start_date, flight.end_date) for flight in joined]
+        )
+        
+        if joined:
+            self.stats['partial' if remaining else 'coalesced'] += 1
+            logger.debug(f"Запрос {ticker} с {start_date} по {end_date} присоединен к {len(joined)} загрузкам")
+        
+        flights = joined + [
+            self._start(ticker, interval, range_start, range_end, fetch)
+            for range_start, range_end in remaining
+        ]
+        
+        # shield: отмена одного ожидающего не должна прерывать общую загрузку
+        results = await asyncio.gather(*(asyncio.shield(flight.task) for flight in flights))
+        
+        return CandleSeries.concat(results).slice(start_date, end_date)
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Возвращает счетчики загрузок и сэкономленных запросов"""
+        return {**self.stats, 'in_flight': sum(len(flights) for flights in self._flights.values())}
+    
+    def _start(
+        self, ticker: str, interval: CandleInterval, start_date: date, end_date: date, fetch: FetchFunction
+    ) -> _Flight:
+        """Запускает загрузку периода и регистрирует ее до завершения"""
+        self.stats['flights'] += 1
+        key = (ticker, interval)
+        task = asyncio.ensure_future(fetch(ticker, interval, start_date, end_date))
+        flight = _Flight(start_date, end_date, task)
+        self._flights.setdefault(key, []).append(flight)
+        
+        def finish(_):
+            flights = self._flights.get(key, [])
+            if flight in flights:
+                flights.remove(flight)
+            if not flights:
+                self._flights.pop(key, None)
+            # Ошибку получают все ожидающие, здесь только помечаем ее как обработанную
+            if not task.cancelled():
+                task.exception()
+        
+        task.add_done_callback(finish)
+        return flight
@@ -0,0 +1,133 @@
+"""
+Кодирование потоковых ответов в NDJSON и CSV
+
+Принимает пары (тикер, пачка свечей) из DataService.stream_stock_data и отдает байты
+по одной пачке за раз, не собирая ответ целиком.
+"""
+
+import csv
+import io
+import json
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+from models.pydantic_models import StreamFormat
+from .series import VALUE_COLUMNS, CandleSeries
+
+STREAM_MEDIA_TYPES = {
+    StreamFormat.NDJSON: "application/x-ndjson",
+    StreamFormat.CSV: "text/csv",
+}
+
+
+def negotiate_media_type(accept: Optional[str], offered: List[str]) -> Optional[str]:
+    """
+    Выбирает формат ответа по заголовку Accept
+    
+    Args:
+        accept: Значение заголовка Accept (None или пустое - подходит любой формат)
+        offered: Форматы, которые может отдать сервер, в порядке предпочтения
+        
+    Returns:
+        Формат с наибольшим q (при равенстве - первый в offered) или None, если ни один не подходит
+    """
+    if not accept:
+        return offered[0] if offered else None
+    
+    ranges = []
+    for part in accept.split(','):
+        media_range, *params = [item.strip() for item in part.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        ranges.append((media_range.lower(), quality))
+    
+    def quality_of(media_type: str) -> float:
+        main_type = media_type.split('/')[0]
+        # Более конкретный диапазон важнее общего: type/subtype, затем type/*, затем */*
+        for candidate in (media_type, f"{main_type}/*", "*/*"):
+            matches = [quality for media_range, quality in ranges if media_range == candidate]
+            if matches:
+                return max(matches)
+        return 0.0
+    
+    best = max(offered, key=quality_of, default=None)
+    if best is None or quality_of(best) <= 0:
+        return None
+    return best
+
+
+def _optional(value: float):
+    return None if value != value else value
+
+
+def _rows(series: CandleSeries, date_only: bool, ohlcv: bool) -> Iterator[Tuple]:
+    """Строки (метка времени, значения...) пачки, NaN заменяется на None"""
+    labels = series.labels(date_only)
+    if not ohlcv:
+        return zip(labels, map(_optional, series.close))
+    columns = [map(_optional, column) for column in series.columns()]
+    return zip(labels, *columns)
+
+
+def _field_names(date_only: bool, ohlcv: bool) -> List[str]:
+    return ['ticker', 'date' if date_only else 'time', *(VALUE_COLUMNS if ohlcv else ('close',))]
+
+
+async def encode_ndjson(
+    batches: AsyncIterator[Tuple[str, CandleSeries]],
+    date_only: bool = True,
+    ohlcv: bool = False
+) -> AsyncIterator[bytes]:
+    """
+    Кодирует пачки свечей в NDJSON: одна свеча - одна строка
+    
+    Args:
+        batches: Пары (тикер, пачка свечей)
+        date_only: Метки YYYY-MM-DD вместо YYYY-MM-DD HH:MM:SS
+        ohlcv: Выдавать все поля свечи, а не только цену закрытия
+    """
+    field_names = _field_names(date_only, ohlcv)
+    async for ticker, series in batches:
+        lines = [
+            json.dumps(dict(zip(field_names, (ticker, *row))), ensure_ascii=False)
+            for row in _rows(series, date_only, ohlcv)
+        ]
+        if lines:
+            yield ('\n'.join(lines) + '\n').encode()
+
+
+async def encode_csv(
+    batches: AsyncIterator[Tuple[str, CandleSeries]],
+    date_only: bool = True,
+    ohlcv: bool = False
+) -> AsyncIterator[bytes]:
+    """
+    Кодирует пачки свечей в CSV с заголовком; отсутствующие значения - пустые поля
+    
+    Args:
+        batches: Пары (тикер, пачка свечей)
+        date_only: Метки YYYY-MM-DD вместо YYYY-MM-DD HH:MM:SS
+        ohlcv: Выдавать все поля свечи, а не только цену закрытия
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(_field_names(date_only, ohlcv))
+    yield buffer.getvalue().encode()
+    
+    async for ticker, series in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows((ticker, *row) for row in _rows(series, date_only, ohlcv))
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+
+
+ENCODERS = {
+    StreamFormat.NDJSON: encode_ndjson,
+    StreamFormat.CSV: encode_csv,
+}
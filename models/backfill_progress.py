@@ -0,0 +1,18 @@
+from sqlalchemy import Column, String, DateTime
+from sqlalchemy.sql import func
+from models.stock_data import Base
+
+class BackfillProgress(Base):
+    """
+    Тикер, полностью загруженный задачей массовой загрузки истории
+    
+    Повторный запуск задачи с тем же именем пропускает записанные здесь тикеры.
+    """
+    __tablename__ = "backfill_progress"
+    
+    job = Column(String(64), primary_key=True)
+    ticker = Column(String(20), primary_key=True)
+    completed_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    def __repr__(self):
+        return f"<BackfillProgress(job='{self.job}', ticker='{self.ticker}')>"
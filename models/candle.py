@@ -0,0 +1,63 @@
+from enum import Enum
+from sqlalchemy import Column, String, SmallInteger, DateTime, Float, BigInteger, Index, PrimaryKeyConstraint
+from models.stock_data import Base
+
+class CandleInterval(str, Enum):
+    """Интервал свечей и его код в ISS API"""
+    
+    MINUTE_1 = "1m"
+    MINUTE_10 = "10m"
+    HOUR_1 = "1h"
+    DAY_1 = "1d"
+    WEEK_1 = "1w"
+    
+    @property
+    def iss_code(self) -> int:
+        """Код интервала в параметре interval запроса candles.json"""
+        return ISS_INTERVAL_CODES[self]
+    
+    @property
+    def is_intraday(self) -> bool:
+        """Внутридневной интервал (ключи ответа содержат время)"""
+        return self in (CandleInterval.MINUTE_1, CandleInterval.MINUTE_10, CandleInterval.HOUR_1)
+
+ISS_INTERVAL_CODES = {
+    CandleInterval.MINUTE_1: 1,
+    CandleInterval.MINUTE_10: 10,
+    CandleInterval.HOUR_1: 60,
+    CandleInterval.DAY_1: 24,
+    CandleInterval.WEEK_1: 7,
+}
+
+class Candle(Base):
+    """
+    Свеча OHLCV по тикеру и интервалу
+    
+    Таблица рассчитана на большой объем: без суррогатного ключа и служебных колонок,
+    первичный ключ (ticker, interval, ts) хранит колонки значений в INCLUDE, поэтому
+    выборка периода тикера читает только соседние страницы индекса (index-only scan),
+    BRIN индекс по ts - выборки по времени для всех тикеров.
+    Таблица может быть секционирована по годам (CANDLES_PARTITIONING=year в database_manager).
+    """
+    __tablename__ = "candles"
+    
+    ticker = Column(String(20), nullable=False)
+    interval = Column(SmallInteger, nullable=False)  # Код интервала ISS
+    ts = Column(DateTime, nullable=False)            # Начало свечи (время биржи)
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float, nullable=False)
+    volume = Column(BigInteger)
+    value = Column(Float)
+    
+    __table_args__ = (
+        PrimaryKeyConstraint(
+            'ticker', 'interval', 'ts', name='candles_pkey',
+            postgresql_include=['open', 'high', 'low', 'close', 'volume', 'value']
+        ),
+        Index('idx_candles_ts_brin', 'ts', postgresql_using='brin'),
+    )
+    
+    def __repr__(self):
+        return f"<Candle(ticker='{self.ticker}', interval={self.interval}, ts='{self.ts}', close={self.close})>"
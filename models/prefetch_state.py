@@ -0,0 +1,22 @@
+from sqlalchemy import Column, String, Integer, Date, DateTime, Boolean
+from sqlalchemy.sql import func
+from models.stock_data import Base
+
+class PrefetchState(Base):
+    """
+    Прогресс фоновой задачи прогрева кэша
+    
+    Позволяет продолжить прерванный прогон с того места, где он остановился:
+    все тикеры с номером меньше cursor (в отсортированном списке) уже обработаны.
+    """
+    __tablename__ = "prefetch_state"
+    
+    job = Column(String(32), primary_key=True)
+    run_date = Column(Date, nullable=False)          # Торговый день, за который выполняется прогон
+    cursor = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=False, default=0)
+    completed = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<PrefetchState(job='{self.job}', run_date='{self.run_date}', cursor={self.cursor}/{self.total})>"
@@ -1,6 +1,9 @@
+import os
+from enum import Enum
 from pydantic import BaseModel, Field, field_validator, model_validator, ConfigDict
 from typing import List, Dict, Optional
 from datetime import date, datetime
+from models.candle import CandleInterval
 
 class StockRequest(BaseModel):
     """Модель для запроса данных по акциям"""
@@ -10,6 +13,8 @@ class StockRequest(BaseModel):
     tickers: List[str] = Field(..., min_items=1, max_items=10, description="Список тикеров акций")
     start_date: date = Field(..., description="Дата начала периода")
     end_date: date = Field(..., description="Дата окончания периода")
+    interval: CandleInterval = Field(CandleInterval.DAY_1, description="Интервал свечей: 1m, 10m, 1h, 1d, 1w")
+    ohlcv: bool = Field(False, description="Возвращать свечи OHLCV вместо цен закрытия")
     
     @field_validator('tickers')
     @classmethod
@@ -32,6 +37,50 @@ class StockRequest(BaseModel):
             raise ValueError("Дата окончания не может быть раньше даты начала")
         return self
 
+class StreamFormat(str, Enum):
+    """Формат потокового ответа"""
+    
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+# Потоковый ответ не держит данные в памяти, поэтому тикеров в запросе может быть больше
+STREAM_MAX_TICKERS = int(os.getenv("STREAM_MAX_TICKERS", "1000"))
+
+class ExportRequest(StockRequest):
+    """Модель для запроса выгрузки данных по акциям (формат выбирается по заголовку Accept)"""
+    
+    tickers: List[str] = Field(..., min_items=1, max_items=STREAM_MAX_TICKERS, description="Список тикеров акций")
+
+class StreamRequest(ExportRequest):
+    """Модель для запроса потоковой выдачи данных по акциям"""
+    
+    format: StreamFormat = Field(StreamFormat.NDJSON, description="Формат ответа: ndjson или csv")
+
+class ResampleRule(str, Enum):
+    """Период агрегации свечей (значение совпадает с единицей date_trunc PostgreSQL)"""
+    
+    WEEK = "week"
+    MONTH = "month"
+    QUARTER = "quarter"
+
+class AnalyticsMetric(str, Enum):
+    """Показатель, рассчитываемый эндпоинтом /analytics"""
+    
+    PRICES = "prices"
+    RETURNS = "returns"
+    VOLATILITY = "volatility"
+    CORRELATION = "correlation"
+
+class AnalyticsRequest(StockRequest):
+    """Модель для запроса агрегатов по акциям"""
+    
+    resample: Optional[ResampleRule] = Field(None, description="Агрегировать свечи по неделям, месяцам или кварталам")
+    metrics: List[AnalyticsMetric] = Field(
+        [AnalyticsMetric.RETURNS, AnalyticsMetric.VOLATILITY], min_items=1,
+        description="Показатели: prices, returns (логарифмические доходности), volatility, correlation"
+    )
+    window: int = Field(20, ge=2, le=1000, description="Окно скользящей волатильности, свечей")
+
 class StockResponse(BaseModel):
     """Модель для ответа с данными по акциям"""
     
@@ -51,4 +100,7 @@ class ApiResponse(BaseModel):
     success: bool = Field(..., description="Статус выполнения запроса")
     data: Optional[Dict] = Field(None, description="Данные ответа")
     error: Optional[str] = Field(None, description="Описание ошибки")
+    stale: Optional[List[str]] = Field(
+        None, description="Тикеры, отданные только из кэша, пока MOEX недоступен (данные могут быть неполными)"
+    )
     timestamp: datetime = Field(default_factory=datetime.now, description="Время ответа") 
\ No newline at end of file
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, String, Integer, DateTime
+from sqlalchemy.sql import func
+from models.stock_data import Base
+
+class SecuritiesRefresh(Base):
+    """
+    Последнее обновление справочника бумаг с ISS по режиму торгов
+    
+    По refreshed_at процессы приложения определяют, пора ли снова загружать бумаги режима торгов.
+    """
+    __tablename__ = "securities_refresh"
+    
+    board = Column(String(12), primary_key=True)
+    securities = Column(Integer, nullable=False, default=0)  # Число бумаг режима торгов
+    refreshed_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    
+    def __repr__(self):
+        return f"<SecuritiesRefresh(board='{self.board}', securities={self.securities}, refreshed_at='{self.refreshed_at}')>"
@@ -0,0 +1,29 @@
+from sqlalchemy import Column, String, Integer, Boolean, Date, DateTime
+from sqlalchemy.sql import func
+from models.stock_data import Base
+
+class Security(Base):
+    """
+    Запись справочника бумаг ISS
+    
+    Строки режимов торгов из SECURITIES_BOARDS обновляются периодически (лот, статус, название),
+    рынок и даты торгов заполняются при первой проверке тикера по ISS (checked_at).
+    Тикер, которого ISS не знает, хранится с found = false, чтобы не проверять его при каждом запросе.
+    """
+    __tablename__ = "securities"
+    
+    ticker = Column(String(20), primary_key=True)
+    found = Column(Boolean, nullable=False, default=True)  # False - ISS не знает тикер
+    name = Column(String(64))
+    board = Column(String(12))                             # Основной режим торгов
+    engine = Column(String(20))                            # Торговая система и рынок для запросов свечей
+    market = Column(String(20))
+    lot_size = Column(Integer)
+    is_traded = Column(Boolean)
+    listed_from = Column(Date)                             # Первый и последний дни торгов на рынке
+    listed_till = Column(Date)                             # (NULL - бумага торгуется)
+    checked_at = Column(DateTime(timezone=True))           # Время проверки тикера по ISS
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<Security(ticker='{self.ticker}', found={self.found}, board='{self.board}', market='{self.market}')>"
@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, SmallInteger, String, Date, DateTime, Index
+from sqlalchemy.sql import func
+from models.stock_data import Base
+
+class StockCoverage(Base):
+    """
+    Интервал дат, уже запрошенный у MOEX для тикера и интервала свечей
+    
+    Все даты внутри интервала считаются известными: либо свечи есть в candles,
+    либо торгов в этот день не было (выходные, праздники, приостановка торгов).
+    """
+    __tablename__ = "stock_coverage"
+    
+    id = Column(Integer, primary_key=True)
+    ticker = Column(String(20), nullable=False)
+    interval = Column(SmallInteger, nullable=False, server_default='24')  # Код интервала ISS
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index('idx_coverage_ticker_interval_dates', 'ticker', 'interval', 'start_date', 'end_date'),
+    )
+    
+    def __repr__(self):
+        return f"<StockCoverage(ticker='{self.ticker}', interval={self.interval}, start_date='{self.start_date}', end_date='{self.end_date}')>"
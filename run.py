@@ -3,6 +3,7 @@
 Скрипт для запуска приложения MOEX Data Fetcher
 """
 
+import asyncio
 import uvicorn
 import os
 from dotenv import load_dotenv
@@ -15,16 +16,25 @@ def main():
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", "8000"))
     debug = os.getenv("DEBUG", "False").lower() == "true"
+    # Число процессов; в режиме отладки (перезагрузка кода) процесс один
+    workers = 1 if debug else int(os.getenv("WEB_CONCURRENCY", "1"))
     
     print(f"Запуск MOEX Data Fetcher на {host}:{port}")
-    print(f"Режим отладки: {debug}")
+    print(f"Режим отладки: {debug}, процессов: {workers}")
+    
+    if workers > 1:
+        # Миграция выполняется один раз до запуска процессов
+        from database_manager import setup_database
+        asyncio.run(setup_database())
+        os.environ["DB_MIGRATE_ON_STARTUP"] = "false"
     
     uvicorn.run(
         "engine.app:app",
         host=host,
         port=port,
         reload=debug,
-        log_level="info"
+        workers=workers,
+        log_level=os.getenv("LOG_LEVEL", "INFO").lower()
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,55 @@
+from datetime import date
+
+import pytest
+
+from benchmarks.fake_iss import FakeIssServer
+from database.database import engine as db_engine
+from database_manager import DatabaseManager
+from engine import coverage
+
+
+@pytest.fixture
+async def fake_iss():
+    """Фабрика заглушек ISS; все запущенные заглушки останавливаются после теста"""
+    servers = []
+
+    async def start(**kwargs) -> FakeIssServer:
+        server = FakeIssServer(**kwargs)
+        await server.start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        await server.stop()
+
+
+@pytest.fixture
+async def postgres():
+    """PostgreSQL из DATABASE_URL со всеми таблицами; если он недоступен, тест пропускается"""
+    try:
+        await DatabaseManager().create_tables()
+    except Exception as e:
+        pytest.skip(f"PostgreSQL недоступен: {e}")
+    yield
+    # Соединения пула привязаны к event loop теста
+    await db_engine.dispose()
+
+
+@pytest.fixture
+def today(monkeypatch):
+    """Подменяет текущую дату, по которой определяются закрытые периоды свечей"""
+
+    class FixedDate(date):
+        current = date.today()
+
+        @classmethod
+        def today(cls):
+            return cls.current
+
+    monkeypatch.setattr(coverage, "date", FixedDate)
+
+    def set_today(value: date) -> None:
+        FixedDate.current = value
+
+    return set_today
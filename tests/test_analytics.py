@@ -0,0 +1,165 @@
+"""Агрегаты по рядам свечей: ресемплинг, доходности, скользящая волатильность и корреляции (без базы данных)"""
+
+import math
+import statistics
+from array import array
+from datetime import date, datetime
+
+import pytest
+
+from engine.analytics import correlation_matrix, log_returns, resample, rolling_volatility
+from engine.series import NAN, CandleSeries, date_to_timestamp
+from models.pydantic_models import ResampleRule
+
+
+def candles(*rows) -> CandleSeries:
+    """Дневные свечи (дата, open, high, low, close, volume)"""
+    return CandleSeries.from_rows(
+        (datetime.combine(day, datetime.min.time()), open_, high, low, close, volume, None)
+        for day, open_, high, low, close, volume in rows
+    )
+
+
+def closes(*prices) -> CandleSeries:
+    return CandleSeries.from_closes((date(2024, 1, 1 + offset), price) for offset, price in enumerate(prices))
+
+
+def nan_list(values):
+    return [None if value != value else pytest.approx(value) for value in values]
+
+
+def test_resample_week_aggregates():
+    series = candles(
+        (date(2024, 1, 11), 10, 12, 9, 11, 100),
+        (date(2024, 1, 12), 11, 15, 10, 14, 200),
+        # Следующая неделя начинается в понедельник
+        (date(2024, 1, 15), 14, None, 13, 13.5, 300),
+        (date(2024, 1, 17), 13.5, 16, 12, 15, None),
+    )
+    result = resample(series, ResampleRule.WEEK)
+    assert result.dates() == [date(2024, 1, 8), date(2024, 1, 15)]
+    assert list(result.open) == [10, 14]
+    assert list(result.high) == [15, 16]
+    assert list(result.low) == [9, 12]
+    assert list(result.close) == [14, 15]
+    assert list(result.volume) == [300, 300]
+    assert all(value != value for value in result.value)
+
+
+@pytest.mark.parametrize("rule, days, expected", [
+    # Неделя через границу года начинается в понедельник 2024-12-30
+    (ResampleRule.WEEK, [date(2023, 12, 29), date(2024, 1, 1), date(2024, 12, 30), date(2025, 1, 3)],
+     [date(2023, 12, 25), date(2024, 1, 1), date(2024, 12, 30)]),
+    (ResampleRule.WEEK, [date(2024, 1, 14), date(2024, 1, 15)], [date(2024, 1, 8), date(2024, 1, 15)]),
+    (ResampleRule.MONTH, [date(2024, 1, 31), date(2024, 2, 1), date(2024, 2, 29), date(2024, 3, 1)],
+     [date(2024, 1, 1), date(2024, 2, 1), date(2024, 3, 1)]),
+    (ResampleRule.QUARTER, [date(2024, 3, 29), date(2024, 4, 1), date(2024, 6, 28), date(2024, 12, 31)],
+     [date(2024, 1, 1), date(2024, 4, 1), date(2024, 10, 1)]),
+])
+def test_resample_bucket_boundaries(rule, days, expected):
+    series = CandleSeries.from_closes((day, float(index)) for index, day in enumerate(days))
+    assert resample(series, rule).dates() == expected
+
+
+def test_resample_intraday_buckets_by_day():
+    series = CandleSeries.from_rows([
+        (datetime(2024, 1, 31, 23, 50), 1, 1, 1, 1, 1, 1),
+        (datetime(2024, 2, 1, 10, 0), 2, 2, 2, 2, 1, 1),
+    ])
+    result = resample(series, ResampleRule.MONTH)
+    assert result.dates() == [date(2024, 1, 1), date(2024, 2, 1)]
+    assert list(result.ts) == [date_to_timestamp(date(2024, 1, 1)), date_to_timestamp(date(2024, 2, 1))]
+
+
+def test_resample_empty():
+    assert len(resample(CandleSeries(), ResampleRule.WEEK)) == 0
+
+
+def test_log_returns_known_values():
+    timestamps, returns = log_returns(closes(100, 110, 99, 99))
+    assert list(timestamps) == list(closes(100, 110, 99, 99).ts[1:])
+    assert list(returns) == pytest.approx([math.log(1.1), math.log(0.9), 0.0])
+
+
+def test_log_returns_missing_and_non_positive():
+    series = CandleSeries.from_rows([
+        (datetime(2024, 1, 1), None, None, None, 100, None, None),
+        (datetime(2024, 1, 2), None, None, None, 0, None, None),
+        (datetime(2024, 1, 3), None, None, None, 50, None, None),
+        (datetime(2024, 1, 4), None, None, None, 100, None, None),
+    ])
+    _, returns = log_returns(series)
+    assert nan_list(returns) == [None, None, pytest.approx(math.log(2))]
+    assert len(log_returns(closes(100))[1]) == 0
+    assert len(log_returns(CandleSeries())[1]) == 0
+
+
+def test_rolling_volatility_known_values():
+    returns = array('d', [0.01, 0.03, -0.02, 0.04])
+    volatility = rolling_volatility(returns, 3, 252)
+    scale = math.sqrt(252)
+    assert nan_list(volatility) == [
+        None,
+        None,
+        pytest.approx(statistics.stdev([0.01, 0.03, -0.02]) * scale),
+        pytest.approx(statistics.stdev([0.03, -0.02, 0.04]) * scale),
+    ]
+
+
+def test_rolling_volatility_window_edges():
+    # Окно больше числа доходностей
+    assert nan_list(rolling_volatility(array('d', [0.01, 0.02]), 3, 252)) == [None, None]
+    # Окно с отсутствующей доходностью не считается, пока она не выйдет из окна
+    returns = array('d', [0.01, 0.03, NAN, 0.02, 0.05])
+    assert nan_list(rolling_volatility(returns, 2, 1)) == [
+        None,
+        pytest.approx(statistics.stdev([0.01, 0.03])),
+        None,
+        None,
+        pytest.approx(statistics.stdev([0.02, 0.05])),
+    ]
+    # Постоянные доходности (бегущие суммы дают погрешность порядка 1e-8)
+    assert list(rolling_volatility(array('d', [0.01] * 4), 2, 252))[1:] == pytest.approx([0.0] * 3, abs=1e-6)
+
+
+def returns_at(start: int, values):
+    return array('q', range(start, start + len(values))), array('d', values)
+
+
+def test_correlation_aligns_by_time():
+    left = [0.01, -0.02, 0.03, 0.00, 0.02]
+    right = [0.05, 0.015, -0.01, 0.025, 0.01]
+    matrix = correlation_matrix({
+        "A": returns_at(1, left),
+        # Ряд B сдвинут на один момент: общие моменты 2..5
+        "B": returns_at(2, right[:4]),
+    })
+    expected = statistics.correlation(left[1:], right[:4])
+    assert matrix["A"]["B"] == pytest.approx(expected)
+    assert matrix["B"]["A"] == matrix["A"]["B"]
+    assert matrix["A"]["A"] == pytest.approx(1.0)
+
+
+def test_correlation_perfect_and_inverse():
+    values = [0.01, -0.02, 0.03, 0.005]
+    matrix = correlation_matrix({
+        "A": returns_at(0, values),
+        "B": returns_at(0, [2 * value + 0.001 for value in values]),
+        "C": returns_at(0, [-value for value in values]),
+    })
+    assert matrix["A"]["B"] == pytest.approx(1.0)
+    assert matrix["A"]["C"] == pytest.approx(-1.0)
+
+
+def test_correlation_undefined():
+    matrix = correlation_matrix({
+        "A": returns_at(0, [0.01, 0.02, NAN, 0.03]),
+        # Общих моментов с доходностями меньше трех
+        "B": returns_at(1, [0.02, 0.01, 0.04]),
+        # Постоянный ряд
+        "C": returns_at(0, [0.01, 0.01, 0.01, 0.01]),
+    })
+    assert matrix["A"]["B"] is None
+    assert matrix["A"]["C"] is None
+    assert matrix["C"]["C"] is None
+    assert matrix["A"]["A"] == pytest.approx(1.0)
@@ -0,0 +1,133 @@
+"""
+backfill.py против локальной заглушки ISS: загрузка, контрольные точки, продолжение и --restart
+
+Нужен PostgreSQL из DATABASE_URL; если он недоступен, тесты пропускаются.
+Тестовые тикеры и задача удаляются после каждого теста.
+"""
+
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import delete, func, select
+
+import backfill
+from database.database import AsyncSessionLocal
+from models.backfill_progress import BackfillProgress
+from models.candle import Candle
+from models.stock_coverage import StockCoverage
+
+TICKERS = ["BFTA", "BFTB", "BFTC"]
+JOB = "test-backfill"
+START_DATE = date(2023, 1, 2)
+END_DATE = date(2023, 3, 31)
+
+
+async def clear() -> None:
+    async with AsyncSessionLocal() as db:
+        for model in (Candle, StockCoverage):
+            await db.execute(delete(model).where(model.ticker.in_(TICKERS)))
+        await db.execute(delete(BackfillProgress).where(BackfillProgress.job == JOB))
+        await db.commit()
+
+
+@pytest.fixture
+async def database(postgres):
+    await clear()
+    yield
+    await clear()
+
+
+def backfill_args(server, *extra: str):
+    return backfill.parse_args([
+        "--tickers", ",".join(TICKERS), "--start", START_DATE.isoformat(), "--end", END_DATE.isoformat(),
+        "--iss-url", server.base_url, "--rate-limit", "0", "--workers", "2", "--job", JOB, *extra
+    ])
+
+
+async def completed_tickers():
+    return sorted(await backfill.load_completed(JOB))
+
+
+async def candle_counts():
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Candle.ticker, func.count()).where(Candle.ticker.in_(TICKERS)).group_by(Candle.ticker)
+        )
+        return dict(result.all())
+
+
+def trading_days(start_date: date, end_date: date) -> int:
+    return sum(
+        1 for offset in range((end_date - start_date).days + 1)
+        if (start_date + timedelta(days=offset)).weekday() < 5
+    )
+
+
+async def test_backfill_loads_and_checkpoints(database, fake_iss, capsys):
+    server = await fake_iss(page_size=20)
+
+    assert await backfill.backfill(backfill_args(server)) == 0
+
+    assert await completed_tickers() == TICKERS
+    days = trading_days(START_DATE, END_DATE)
+    assert await candle_counts() == {ticker: days for ticker in TICKERS}
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(StockCoverage.ticker, StockCoverage.start_date, StockCoverage.end_date)
+            .where(StockCoverage.ticker.in_(TICKERS)).order_by(StockCoverage.ticker)
+        )
+        assert result.all() == [(ticker, START_DATE, END_DATE) for ticker in TICKERS]
+    assert "3 тикеров, 0 уже загружено" in capsys.readouterr().out
+
+
+async def test_backfill_resumes_from_checkpoint(database, fake_iss, capsys):
+    server = await fake_iss()
+    # Прерванный запуск успел загрузить первый тикер
+    await backfill.mark_completed(JOB, TICKERS[0])
+
+    assert await backfill.backfill(backfill_args(server)) == 0
+
+    assert await completed_tickers() == TICKERS
+    counts = await candle_counts()
+    assert TICKERS[0] not in counts
+    assert sorted(counts) == TICKERS[1:]
+    assert "3 тикеров, 1 уже загружено" in capsys.readouterr().out
+
+
+async def test_backfill_failed_tickers_are_retried(database, fake_iss):
+    # 404 не повторяется клиентом: все тикеры завершаются ошибкой и не отмечаются загруженными
+    failing = await fake_iss(error_rate=1.0, error_status=404)
+    assert await backfill.backfill(backfill_args(failing)) == 1
+    assert await completed_tickers() == []
+    assert await candle_counts() == {}
+
+    server = await fake_iss()
+    assert await backfill.backfill(backfill_args(server)) == 0
+    assert await completed_tickers() == TICKERS
+
+
+async def test_backfill_completed_job_and_restart(database, fake_iss, capsys):
+    server = await fake_iss()
+    assert await backfill.backfill(backfill_args(server)) == 0
+    capsys.readouterr()
+
+    # Повторный запуск завершенной задачи ничего не загружает
+    server.request_count = 0
+    assert await backfill.backfill(backfill_args(server)) == 0
+    assert server.request_count == 0
+    assert "3 тикеров, 3 уже загружено" in capsys.readouterr().out
+
+    # --restart забывает контрольные точки; покрытые периоды повторно у ISS не запрашиваются
+    assert await backfill.backfill(backfill_args(server, "--restart")) == 0
+    assert "3 тикеров, 0 уже загружено" in capsys.readouterr().out
+    assert await completed_tickers() == TICKERS
+    assert server.request_count == 0
+
+
+def test_parse_args_validation():
+    with pytest.raises(SystemExit):
+        backfill.parse_args(["--start", "2023-01-01"])
+    with pytest.raises(SystemExit):
+        backfill.parse_args(["--tickers", "SBER", "--start", "2023-02-01", "--end", "2023-01-01"])
+    args = backfill.parse_args(["--tickers", "SBER", "--start", "2023-01-01", "--end", "2023-12-31"])
+    assert args.job == "1d:2023-01-01:2023-12-31"
@@ -0,0 +1,117 @@
+"""Интервалы покрытия кэша и планирование запросов к MOEX (без базы данных)"""
+
+from datetime import date
+
+import pytest
+
+from engine.coverage import (
+    dates_to_intervals, last_closed_date, merge_intervals, plan_fetch_ranges, subtract_intervals
+)
+from models.candle import CandleInterval
+
+
+def d(day: int, month: int = 1) -> date:
+    return date(2024, month, day)
+
+
+@pytest.mark.parametrize("intervals, expected", [
+    ([], []),
+    ([(d(1), d(5))], [(d(1), d(5))]),
+    # Соседние интервалы (без пропуска дней) сливаются
+    ([(d(1), d(5)), (d(6), d(10))], [(d(1), d(10))]),
+    # Пересекающиеся
+    ([(d(1), d(7)), (d(5), d(10))], [(d(1), d(10))]),
+    # Вложенный интервал не сужает внешний
+    ([(d(1), d(20)), (d(5), d(10))], [(d(1), d(20))]),
+    # Пропуск в один день сохраняется
+    ([(d(1), d(5)), (d(7), d(10))], [(d(1), d(5)), (d(7), d(10))]),
+    # Порядок на входе не важен
+    ([(d(20), d(25)), (d(1), d(3)), (d(2), d(4))], [(d(1), d(4)), (d(20), d(25))]),
+    # Однодневные интервалы
+    ([(d(3), d(3)), (d(1), d(1)), (d(2), d(2))], [(d(1), d(3))]),
+])
+def test_merge_intervals(intervals, expected):
+    assert merge_intervals(intervals) == expected
+
+
+def test_merge_intervals_accepts_iterator():
+    assert merge_intervals(iter([(d(1), d(2)), (d(3), d(4))])) == [(d(1), d(4))]
+
+
+@pytest.mark.parametrize("covered, expected", [
+    ([], [(d(1), d(31))]),
+    ([(d(1), d(31))], []),
+    # Покрытие шире периода
+    ([(date(2023, 12, 1), d(1, 3))], []),
+    # Покрытие внутри периода
+    ([(d(10), d(20))], [(d(1), d(9)), (d(21), d(31))]),
+    # Покрытие у границ периода
+    ([(d(1), d(10)), (d(25), d(31))], [(d(11), d(24))]),
+    # Покрытие пересекает границы периода
+    ([(date(2023, 12, 20), d(5)), (d(28), d(10, 2))], [(d(6), d(27))]),
+    # Покрытие вне периода
+    ([(date(2023, 12, 1), date(2023, 12, 20)), (d(1, 3), d(5, 3))], [(d(1), d(31))]),
+    # Соседние и пересекающиеся интервалы покрытия
+    ([(d(5), d(10)), (d(11), d(15)), (d(14), d(18))], [(d(1), d(4)), (d(19), d(31))]),
+    # Однодневный пропуск
+    ([(d(1), d(14)), (d(16), d(31))], [(d(15), d(15))]),
+])
+def test_subtract_intervals(covered, expected):
+    assert subtract_intervals(d(1), d(31), covered) == expected
+
+
+def test_subtract_intervals_single_day():
+    assert subtract_intervals(d(5), d(5), []) == [(d(5), d(5))]
+    assert subtract_intervals(d(5), d(5), [(d(5), d(5))]) == []
+    assert subtract_intervals(d(5), d(5), [(d(6), d(9))]) == [(d(5), d(5))]
+
+
+def test_dates_to_intervals():
+    dates = [d(5), d(1), d(2), d(3), d(10), d(3)]
+    assert dates_to_intervals(dates) == [(d(1), d(3)), (d(5), d(5)), (d(10), d(10))]
+    assert dates_to_intervals([]) == []
+
+
+def test_plan_fetch_ranges_empty():
+    assert plan_fetch_ranges([], 7) == []
+
+
+def test_plan_fetch_ranges_without_gap_merging():
+    missing = [d(1), d(2), d(4), d(8), d(9)]
+    assert plan_fetch_ranges(missing) == [(d(1), d(2)), (d(4), d(4)), (d(8), d(9))]
+
+
+@pytest.mark.parametrize("max_gap_days, expected", [
+    # Промежуток d(3)..d(7) - 5 известных дней
+    (4, [(d(1), d(2)), (d(8), d(10))]),
+    (5, [(d(1), d(10))]),
+    (6, [(d(1), d(10))]),
+])
+def test_plan_fetch_ranges_gap_threshold(max_gap_days, expected):
+    missing = [d(1), d(2), d(8), d(9), d(10)]
+    assert plan_fetch_ranges(missing, max_gap_days) == expected
+
+
+def test_plan_fetch_ranges_merges_chain_of_gaps():
+    # Каждый промежуток не больше порога, поэтому все части сливаются в один запрос
+    missing = [d(1), d(4), d(7), d(10), d(20)]
+    assert plan_fetch_ranges(missing, 2) == [(d(1), d(10)), (d(20), d(20))]
+
+
+def test_plan_fetch_ranges_unsorted_duplicates():
+    missing = [d(9), d(1), d(2), d(9), d(1)]
+    assert plan_fetch_ranges(missing, 0) == [(d(1), d(2)), (d(9), d(9))]
+
+
+@pytest.mark.parametrize("interval, today, expected", [
+    # 2024-01-15 - понедельник
+    (CandleInterval.DAY_1, d(17), d(16)),
+    (CandleInterval.MINUTE_10, d(15), d(14)),
+    # Недельная свеча текущей недели не закрыта до воскресенья
+    (CandleInterval.WEEK_1, d(15), d(14)),
+    (CandleInterval.WEEK_1, d(17), d(14)),
+    (CandleInterval.WEEK_1, d(21), d(14)),
+    (CandleInterval.WEEK_1, d(22), d(21)),
+])
+def test_last_closed_date(interval, today, expected):
+    assert last_closed_date(interval, today) == expected
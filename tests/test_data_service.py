@@ -0,0 +1,160 @@
+"""
+DataService против локальной заглушки ISS: покрытие кэша, незакрытые периоды свечей,
+объединение одновременных загрузок и отдача кэша, пока MOEX недоступен
+
+Нужен PostgreSQL из DATABASE_URL; если он недоступен, тесты пропускаются.
+Тестовые тикеры удаляются после каждого теста.
+"""
+
+import asyncio
+from datetime import date
+
+import aiohttp
+import pytest
+from sqlalchemy import delete, select
+
+from database.database import AsyncSessionLocal
+from engine import resilience
+from engine.data_service import DataService
+from engine.hot_cache import HotCache
+from engine.moex_client import MoexClient
+from models.candle import Candle, CandleInterval
+from models.stock_coverage import StockCoverage
+
+TICKER = "DSTEST"
+
+
+async def clear() -> None:
+    async with AsyncSessionLocal() as db:
+        for model in (Candle, StockCoverage):
+            await db.execute(delete(model).where(model.ticker == TICKER))
+        await db.commit()
+
+
+@pytest.fixture
+async def database(postgres):
+    await clear()
+    yield
+    await clear()
+
+
+async def coverage(interval: CandleInterval):
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(StockCoverage.start_date, StockCoverage.end_date)
+            .where(StockCoverage.ticker == TICKER, StockCoverage.interval == interval.iss_code)
+            .order_by(StockCoverage.start_date)
+        )
+        return [tuple(row) for row in result]
+
+
+async def test_current_week_refetched(database, fake_iss, today):
+    server = await fake_iss()
+    week = CandleInterval.WEEK_1
+    start_date = date(2024, 1, 1)
+
+    async with MoexClient(base_url=server.base_url) as client:
+        # Данные незакрытого периода в кэше в памяти сразу устаревают
+        service = DataService(AsyncSessionLocal, moex_client=client, hot_cache=HotCache(today_ttl=0))
+
+        # Среда: свеча недели с понедельника 2024-01-15 еще не закрыта
+        today(date(2024, 1, 17))
+        series = await service.get_stock_series([TICKER], start_date, date(2024, 1, 17), week)
+        assert len(series[TICKER]) == 3
+        assert await coverage(week) == [(start_date, date(2024, 1, 14))]
+
+        # Пятница той же недели: неделя запрашивается заново с понедельника
+        today(date(2024, 1, 19))
+        server.candle_requests.clear()
+        series = await service.get_stock_series([TICKER], start_date, date(2024, 1, 19), week)
+        assert len(series[TICKER]) == 3
+        assert server.candle_requests == [(TICKER, date(2024, 1, 15), date(2024, 1, 19), 7)]
+        assert await coverage(week) == [(start_date, date(2024, 1, 14))]
+
+        # После воскресенья неделя закрыта: загружается последний раз и отмечается в покрытии
+        today(date(2024, 1, 22))
+        server.candle_requests.clear()
+        await service.get_stock_series([TICKER], start_date, date(2024, 1, 21), week)
+        assert server.candle_requests == [(TICKER, date(2024, 1, 15), date(2024, 1, 21), 7)]
+        assert await coverage(week) == [(start_date, date(2024, 1, 21))]
+
+        server.candle_requests.clear()
+        fresh = DataService(AsyncSessionLocal, moex_client=client)
+        await fresh.get_stock_series([TICKER], start_date, date(2024, 1, 21), week)
+        assert server.candle_requests == []
+
+
+async def test_concurrent_refresh_single_request(database, fake_iss):
+    server = await fake_iss(latency=0.05)
+    day = date(2024, 3, 15)
+
+    async with MoexClient(base_url=server.base_url) as client:
+        service = DataService(AsyncSessionLocal, moex_client=client)
+        results = await asyncio.gather(*(service.refresh(TICKER, day, day) for _ in range(10)))
+
+    assert server.request_count == 1
+    assert all(series == results[0] for series in results)
+    assert len(results[0]) == 1
+    assert service.single_flight.get_stats() == {'flights': 1, 'coalesced': 9, 'partial': 0, 'in_flight': 0}
+
+
+async def test_concurrent_refresh_fetches_only_remainder(database, fake_iss):
+    server = await fake_iss(latency=0.05)
+
+    async with MoexClient(base_url=server.base_url) as client:
+        service = DataService(AsyncSessionLocal, moex_client=client)
+        first, second = await asyncio.gather(
+            service.refresh(TICKER, date(2024, 1, 1), date(2024, 1, 31)),
+            service.refresh(TICKER, date(2024, 1, 15), date(2024, 2, 15))
+        )
+
+    # Второй запрос ждет первую загрузку и сам запрашивает только февраль
+    assert sorted(server.candle_requests) == [
+        (TICKER, date(2024, 1, 1), date(2024, 1, 31), 24),
+        (TICKER, date(2024, 2, 1), date(2024, 2, 15), 24),
+    ]
+    assert first.dates()[0] == date(2024, 1, 1)
+    assert second.dates()[0] == date(2024, 1, 15)
+    assert second.dates()[-1] == date(2024, 2, 15)
+    assert service.single_flight.stats['partial'] == 1
+
+
+async def test_concurrent_refresh_error_reaches_every_waiter(database, fake_iss):
+    server = await fake_iss(latency=0.05, error_rate=1.0, error_status=404)
+    day = date(2024, 3, 15)
+
+    async with MoexClient(base_url=server.base_url) as client:
+        service = DataService(AsyncSessionLocal, moex_client=client)
+        results = await asyncio.gather(
+            *(service.refresh(TICKER, day, day) for _ in range(5)), return_exceptions=True
+        )
+
+    # 404 не повторяется: одна ошибка ISS получена каждым ожидающим
+    assert server.request_count == 1
+    assert all(isinstance(result, aiohttp.ClientResponseError) for result in results)
+    assert all(result.status == 404 for result in results)
+    assert service.single_flight.get_stats()['in_flight'] == 0
+    assert await coverage(CandleInterval.DAY_1) == []
+
+
+async def test_stale_cache_served_when_moex_unavailable(database, fake_iss, monkeypatch):
+    monkeypatch.setattr(resilience, "MOEX_RETRY_BASE_DELAY", 0.001)
+    monkeypatch.setattr(resilience, "MOEX_RETRY_MAX_DELAY", 0.001)
+    server = await fake_iss()
+
+    async with MoexClient(base_url=server.base_url) as client:
+        service = DataService(AsyncSessionLocal, moex_client=client)
+        january = await service.get_stock_series([TICKER], date(2024, 1, 1), date(2024, 1, 31))
+
+        # ISS перестает отвечать: февраль загрузить нельзя, январь отдается из базы данных
+        server.error_rate = 1.0
+        stale = set()
+        fresh = DataService(AsyncSessionLocal, moex_client=client)
+        result = await fresh.get_stock_series([TICKER], date(2024, 1, 1), date(2024, 2, 29), stale=stale)
+
+        assert stale == {TICKER}
+        assert result[TICKER] == january[TICKER]
+        assert fresh.cache_stats['stale_served'] == 1
+        # Неполные данные не попадают в кэш в памяти
+        assert fresh.hot_cache.get(TICKER, CandleInterval.DAY_1, date(2024, 1, 1), date(2024, 2, 29)) is None
+        assert await coverage(CandleInterval.DAY_1) == [(date(2024, 1, 1), date(2024, 1, 31))]
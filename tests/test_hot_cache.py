@@ -0,0 +1,151 @@
+"""Кэш в памяти: полнота периодов, время жизни незакрытого периода и LRU вытеснение (без базы данных)"""
+
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from engine import hot_cache
+from engine.hot_cache import HotCache
+from engine.series import CandleSeries
+from models.candle import CandleInterval
+
+DAY = CandleInterval.DAY_1
+WEEK = CandleInterval.WEEK_1
+
+
+def d(day: int) -> date:
+    # 2024-01-15 - понедельник
+    return date(2024, 1, day)
+
+
+def closes(start_date: date, end_date: date, step: int = 1) -> CandleSeries:
+    days = [start_date + timedelta(days=offset) for offset in range(0, (end_date - start_date).days + 1, step)]
+    return CandleSeries.from_closes((day, 100.0 + day.day) for day in days)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Подменяет монотонные часы кэша; возвращает функцию сдвига часов"""
+    now = [1000.0]
+    monkeypatch.setattr(hot_cache, "time", SimpleNamespace(monotonic=lambda: now[0]))
+
+    def advance(seconds: float) -> None:
+        now[0] += seconds
+
+    return advance
+
+
+def test_closed_period_hit(today):
+    today(d(17))
+    cache = HotCache(max_points=1000, today_ttl=60)
+    cache.put("SBER", DAY, closes(d(1), d(10)), d(1), d(10))
+
+    assert cache.get("SBER", DAY, d(3), d(5)) == closes(d(3), d(5))
+    assert cache.get("SBER", DAY, d(1), d(12)) is None
+    # Другой интервал свечей - другая запись
+    assert cache.get("SBER", CandleInterval.HOUR_1, d(3), d(5)) is None
+    assert cache.get_stats()['hits'] == 1
+    assert cache.get_stats()['misses'] == 2
+
+
+def test_incomplete_range_until_gap_filled(today):
+    today(d(17))
+    cache = HotCache(max_points=1000, today_ttl=60)
+    cache.put("SBER", DAY, closes(d(1), d(5)), d(1), d(5))
+    cache.put("SBER", DAY, closes(d(8), d(10)), d(8), d(10))
+    assert cache.get("SBER", DAY, d(1), d(10)) is None
+    assert cache.get("SBER", DAY, d(8), d(10)) is not None
+
+    cache.put("SBER", DAY, closes(d(6), d(7)), d(6), d(7))
+    assert cache.get("SBER", DAY, d(1), d(10)) == closes(d(1), d(10))
+
+
+def test_update_does_not_extend_complete_range(today):
+    today(d(17))
+    cache = HotCache(max_points=1000, today_ttl=60)
+    cache.put("SBER", DAY, closes(d(1), d(5)), d(1), d(5))
+    cache.update("SBER", DAY, closes(d(6), d(10)))
+    assert cache.get("SBER", DAY, d(1), d(10)) is None
+    # Обновление незакэшированного тикера не создает запись
+    cache.update("GAZP", DAY, closes(d(1), d(5)))
+    assert cache.get_stats()['tickers'] == 1
+
+
+def test_today_expires_after_ttl(today, clock):
+    today(d(17))
+    cache = HotCache(max_points=1000, today_ttl=60)
+    cache.put("SBER", DAY, closes(d(10), d(17)), d(10), d(17))
+
+    clock(59)
+    assert cache.get("SBER", DAY, d(10), d(17)) is not None
+    clock(2)
+    assert cache.get("SBER", DAY, d(10), d(17)) is None
+    # Закрытые дни остаются действительными
+    assert cache.get("SBER", DAY, d(10), d(16)) is not None
+
+
+def test_today_not_complete_next_day(today, clock):
+    today(d(17))
+    cache = HotCache(max_points=1000, today_ttl=60)
+    cache.put("SBER", DAY, closes(d(10), d(17)), d(10), d(17))
+
+    # Снимок вчерашнего дня не попал в закрытые периоды
+    today(d(18))
+    assert cache.get("SBER", DAY, d(10), d(17)) is None
+    assert cache.get("SBER", DAY, d(10), d(16)) is not None
+
+
+def test_current_week_expires_mid_week(today, clock):
+    # Среда: свеча недели с понедельника еще меняется
+    today(d(17))
+    cache = HotCache(max_points=1000, today_ttl=60)
+    cache.put("SBER", WEEK, closes(d(1), d(15), step=7), d(1), d(17))
+    assert cache.get("SBER", WEEK, d(1), d(17)) is not None
+    assert cache.get("SBER", WEEK, d(1), d(14)) is not None
+
+    # Пятница той же недели: период до вчерашнего дня включает незакрытую неделю
+    today(d(19))
+    clock(61)
+    assert cache.get("SBER", WEEK, d(1), d(18)) is None
+    assert cache.get("SBER", WEEK, d(1), d(16)) is None
+    assert cache.get("SBER", WEEK, d(1), d(14)) is not None
+
+
+def test_current_week_requires_load_from_monday(today, clock):
+    today(d(17))
+    cache = HotCache(max_points=1000, today_ttl=60)
+    cache.put("SBER", WEEK, closes(d(1), d(8), step=7), d(1), d(14))
+    # Загрузка со среды не содержит свечи, начавшейся в понедельник
+    cache.put("SBER", WEEK, CandleSeries(), d(16), d(17))
+    assert cache.get("SBER", WEEK, d(1), d(17)) is None
+
+    cache.put("SBER", WEEK, closes(d(15), d(15)), d(15), d(17))
+    assert cache.get("SBER", WEEK, d(1), d(17)) is not None
+
+
+def test_lru_eviction_by_points(today):
+    today(d(17))
+    cache = HotCache(max_points=10, today_ttl=60)
+    cache.put("SBER", DAY, closes(d(1), d(5)), d(1), d(5))
+    cache.put("GAZP", DAY, closes(d(1), d(5)), d(1), d(5))
+    # SBER использован позже GAZP
+    assert cache.get("SBER", DAY, d(1), d(5)) is not None
+
+    cache.put("LKOH", DAY, closes(d(1), d(3)), d(1), d(3))
+
+    assert cache.get("GAZP", DAY, d(1), d(5)) is None
+    assert cache.get("SBER", DAY, d(1), d(5)) is not None
+    assert cache.get("LKOH", DAY, d(1), d(3)) is not None
+    stats = cache.get_stats()
+    assert stats['evictions'] == 1
+    assert stats['points'] == 8
+
+
+def test_invalidate(today):
+    today(d(17))
+    cache = HotCache(max_points=1000, today_ttl=60)
+    cache.put("SBER", DAY, closes(d(1), d(5)), d(1), d(5))
+    cache.invalidate("SBER", DAY)
+    assert cache.get("SBER", DAY, d(1), d(5)) is None
+    assert cache.get_stats()['points'] == 0
@@ -0,0 +1,93 @@
+"""Разбор ответов ISS: одинаковый результат всех парсеров JSON и поиск колонок по именам"""
+
+import json
+from datetime import datetime
+
+import pytest
+
+from engine.iss_decode import decode_candles, parse_timestamps
+from engine.series import CandleSeries
+
+PAYLOAD = b"""{
+"candles": {
+    "columns": ["open", "close", "high", "low", "value", "volume", "begin", "end"],
+    "data": [
+        [270.1, 271.5, 272.0, 269.8, 1357500000.5, 5000000, "2024-01-15 10:00:00", "2024-01-15 10:09:59"],
+        [271.5, 270.9, 271.7, null, 812700000, 3000000, "2024-01-15 10:10:00", "2024-01-15 10:19:59"],
+        [270.9, 272.25, 272.3, 270.5, null, null, "2024-01-15 10:20:00", "2024-01-15 10:29:59"]
+    ]
+}}"""
+
+EXPECTED = CandleSeries.from_rows([
+    (datetime(2024, 1, 15, 10, 0), 270.1, 272.0, 269.8, 271.5, 5000000, 1357500000.5),
+    (datetime(2024, 1, 15, 10, 10), 271.5, 271.7, None, 270.9, 3000000, 812700000),
+    (datetime(2024, 1, 15, 10, 20), 270.9, 272.3, 270.5, 272.25, None, None),
+])
+
+
+def backend_loads(name: str):
+    if name == "json":
+        return json.loads
+    if name == "orjson":
+        return pytest.importorskip("orjson").loads
+    return pytest.importorskip("msgspec").json.decode
+
+
+@pytest.fixture(params=["json", "orjson", "msgspec"])
+def loads(request):
+    return backend_loads(request.param)
+
+
+def decode(block) -> CandleSeries:
+    return decode_candles(block["columns"], block["data"])
+
+
+def test_backends_decode_same_candles(loads):
+    assert decode(loads(PAYLOAD)["candles"]) == EXPECTED
+
+
+def test_columns_found_by_name(loads):
+    block = loads(PAYLOAD)["candles"]
+    # Другой порядок колонок в ответе
+    order = [7, 6, 3, 2, 1, 0, 5, 4]
+    columns = [block["columns"][position] for position in order]
+    data = [[row[position] for position in order] for row in block["data"]]
+    assert decode_candles(columns, data) == EXPECTED
+
+
+def test_missing_value_columns_are_nan(loads):
+    block = loads(PAYLOAD)["candles"]
+    begin, close = block["columns"].index("begin"), block["columns"].index("close")
+    series = decode_candles(["begin", "close"], [[row[begin], row[close]] for row in block["data"]])
+    assert list(series) == [
+        (datetime(2024, 1, 15, 10, 0), None, None, None, 271.5, None, None),
+        (datetime(2024, 1, 15, 10, 10), None, None, None, 270.9, None, None),
+        (datetime(2024, 1, 15, 10, 20), None, None, None, 272.25, None, None),
+    ]
+
+
+@pytest.mark.parametrize("columns", [["close", "end"], ["begin", "open"]])
+def test_required_columns(columns):
+    with pytest.raises(ValueError):
+        decode_candles(columns, [])
+
+
+def test_empty_block():
+    assert len(decode_candles(["begin", "close"], [])) == 0
+
+
+def test_unsorted_and_duplicate_rows():
+    series = decode_candles(["close", "begin"], [
+        [3.0, "2024-01-17 00:00:00"],
+        [1.0, "2024-01-15 00:00:00"],
+        [2.0, "2024-01-16 00:00:00"],
+        [10.0, "2024-01-15 00:00:00"],
+    ])
+    # Упорядочено по времени, при повторе остается последняя строка
+    assert [(moment.day, close) for moment, *_, close, _, _ in series] == [(15, 10.0), (16, 2.0), (17, 3.0)]
+
+
+def test_parse_timestamps_date_only():
+    assert list(parse_timestamps(["2024-01-15", "2024-01-15 10:20:30", "1970-01-01"])) == [
+        1705276800, 1705276800 + 10 * 3600 + 20 * 60 + 30, 0
+    ]
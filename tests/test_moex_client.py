@@ -0,0 +1,164 @@
+"""Постраничная загрузка и загрузка частями в MoexClient против локальной заглушки ISS"""
+
+from datetime import date, timedelta
+
+import pytest
+
+from engine import moex_client
+from engine.moex_client import MoexClient
+from models.candle import CandleInterval
+
+
+def trading_days(start_date: date, end_date: date):
+    days = []
+    current_date = start_date
+    while current_date <= end_date:
+        if current_date.weekday() < 5:
+            days.append(current_date)
+        current_date += timedelta(days=1)
+    return days
+
+
+@pytest.fixture
+def chunk_days(monkeypatch):
+    def set_chunk_days(days: int) -> None:
+        monkeypatch.setattr(moex_client, "MOEX_CHUNK_DAYS", days)
+    return set_chunk_days
+
+
+async def test_multi_page(fake_iss, chunk_days):
+    chunk_days(100000)
+    server = await fake_iss(page_size=50)
+    start_date, end_date = date(2023, 1, 2), date(2023, 12, 29)
+    expected = trading_days(start_date, end_date)
+
+    async with MoexClient(base_url=server.base_url) as client:
+        data = await client.get_stock_data("PAGED", start_date, end_date)
+
+    assert data.dates() == expected
+    # Пять полных страниц и неполная последняя
+    assert server.request_count == len(expected) // 50 + 1
+
+
+async def test_server_page_smaller_than_expected(fake_iss, chunk_days):
+    # ISS отдает меньше строк, чем прежнее значение по умолчанию (500): история не обрезается
+    chunk_days(100000)
+    server = await fake_iss(page_size=120)
+    start_date, end_date = date(2020, 1, 1), date(2022, 12, 31)
+
+    async with MoexClient(base_url=server.base_url) as client:
+        data = await client.get_stock_data("CAPPED", start_date, end_date)
+        assert client.page_size == 120
+
+    assert data.dates() == trading_days(start_date, end_date)
+
+
+async def test_learned_page_size_skips_empty_page(fake_iss, chunk_days):
+    chunk_days(100000)
+    server = await fake_iss(page_size=100)
+
+    async with MoexClient(base_url=server.base_url) as client:
+        await client.get_stock_data("LEARN", date(2023, 1, 2), date(2023, 12, 29))
+        server.request_count = 0
+        # 23 свечи - меньше полной страницы, следующая не запрашивается (период кончается воскресеньем)
+        data = await client.get_stock_data("LEARN", date(2023, 3, 1), date(2023, 4, 2))
+
+    assert len(data) == 23
+    assert server.request_count == 1
+
+
+async def test_period_end_skips_empty_page(fake_iss, chunk_days):
+    chunk_days(100000)
+    server = await fake_iss(page_size=500)
+    start_date, end_date = date(2024, 1, 1), date(2024, 1, 31)
+
+    async with MoexClient(base_url=server.base_url) as client:
+        daily = await client.get_stock_data("ENDS", start_date, end_date)
+        weekly = await client.get_stock_data("ENDS", start_date, end_date, CandleInterval.WEEK_1)
+        assert client.page_size is None
+
+    # Последняя свеча приходится на конец периода: размер страницы не известен, но следующая не запрашивается
+    assert len(daily) == 23
+    assert len(weekly) == 5
+    assert server.request_count == 2
+
+
+async def test_full_last_page(fake_iss, chunk_days):
+    # Число свечей кратно размеру страницы: последняя полная страница не считается концом выдачи
+    chunk_days(100000)
+    server = await fake_iss(page_size=10)
+    # Период кончается воскресеньем, последняя свеча - в пятницу
+    start_date, end_date = date(2024, 1, 1), date(2024, 1, 28)
+    expected = trading_days(start_date, end_date)
+    assert len(expected) == 20
+
+    async with MoexClient(base_url=server.base_url) as client:
+        data = await client.get_stock_data("EXACT", start_date, end_date)
+
+    assert data.dates() == expected
+    assert server.request_count == 3
+
+
+async def test_cursor(fake_iss, chunk_days):
+    chunk_days(100000)
+    server = await fake_iss(page_size=10, cursor=True)
+    start_date, end_date = date(2024, 1, 1), date(2024, 1, 26)
+
+    async with MoexClient(base_url=server.base_url) as client:
+        data = await client.get_stock_data("CURSOR", start_date, end_date)
+
+    assert data.dates() == trading_days(start_date, end_date)
+    # По блоку candles.cursor пустая страница не запрашивается
+    assert server.request_count == 2
+
+
+async def test_multi_chunk(fake_iss, chunk_days):
+    chunk_days(90)
+    server = await fake_iss(page_size=40)
+    start_date, end_date = date(2021, 3, 15), date(2023, 8, 20)
+
+    async with MoexClient(base_url=server.base_url) as client:
+        data = await client.get_stock_data("CHUNKS", start_date, end_date)
+
+    # Части склеены по порядку без пропусков и повторов
+    assert data.dates() == trading_days(start_date, end_date)
+    assert len(set(data.ts)) == len(data)
+
+
+async def test_multi_chunk_intraday(fake_iss):
+    server = await fake_iss(page_size=100)
+    start_date, end_date = date(2024, 1, 8), date(2024, 1, 19)
+
+    async with MoexClient(base_url=server.base_url) as client:
+        data = await client.get_stock_data("HOURS", start_date, end_date, CandleInterval.MINUTE_10)
+
+    # 53 десятиминутные свечи за торговую сессию, две части по неделе
+    assert len(data) == 10 * 53
+    assert list(data.ts) == sorted(set(data.ts))
+    assert sorted(set(data.dates())) == trading_days(start_date, end_date)
+
+
+async def test_empty_range(fake_iss, chunk_days):
+    chunk_days(2)
+    server = await fake_iss(page_size=50)
+
+    async with MoexClient(base_url=server.base_url) as client:
+        # Суббота и воскресенье
+        data = await client.get_stock_data("EMPTY", date(2024, 1, 6), date(2024, 1, 7))
+        assert len(data) == 0
+        pages = [page async for page in client.iter_stock_data("EMPTY", date(2024, 1, 6), date(2024, 1, 7))]
+        assert pages == []
+
+    assert server.request_count == 2
+
+
+async def test_iter_stock_data_pages(fake_iss, chunk_days):
+    chunk_days(365)
+    server = await fake_iss(page_size=100)
+    start_date, end_date = date(2022, 1, 1), date(2023, 12, 31)
+
+    async with MoexClient(base_url=server.base_url) as client:
+        pages = [page async for page in client.iter_stock_data("STREAM", start_date, end_date)]
+
+    assert all(0 < len(page) <= 100 for page in pages)
+    assert [day for page in pages for day in page.dates()] == trading_days(start_date, end_date)
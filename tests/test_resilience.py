@@ -0,0 +1,192 @@
+"""Устойчивость запросов к ISS: circuit breaker, backoff, адаптивная частота и срок запроса к API"""
+
+import math
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from engine import app as app_module
+from engine import resilience
+from engine.moex_client import MoexClient
+from engine.rate_limit import TokenBucket
+from engine.resilience import CircuitBreaker, CircuitOpenError, MoexUnavailableError, backoff_delay
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Подменяет монотонные часы circuit breaker; возвращает функцию сдвига часов"""
+    now = [1000.0]
+    monkeypatch.setattr(resilience, "time", SimpleNamespace(monotonic=lambda: now[0]))
+
+    def advance(seconds: float) -> None:
+        now[0] += seconds
+
+    return advance
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(resilience, "MOEX_RETRY_BASE_DELAY", 0.001)
+    monkeypatch.setattr(resilience, "MOEX_RETRY_MAX_DELAY", 0.001)
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow_request()
+    assert breaker.get_stats() == {'opened': 1, 'rejected': 1, 'state': 'open', 'consecutive_failures': 3}
+
+
+def test_breaker_success_resets_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+
+
+def test_breaker_half_open_probe_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock(29)
+    assert not breaker.allow_request()
+
+    clock(1)
+    # Пропускается только один пробный запрос
+    assert breaker.allow_request()
+    assert breaker.state == 'half_open'
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.allow_request()
+
+
+def test_breaker_half_open_probe_failure_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_seconds=30)
+    for _ in range(5):
+        breaker.record_failure()
+    clock(30)
+    assert breaker.allow_request()
+
+    # Одна неудача пробного запроса снова размыкает цепь на полный срок
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.stats['opened'] == 2
+    clock(29)
+    assert not breaker.allow_request()
+    clock(1)
+    assert breaker.allow_request()
+
+
+def test_breaker_lost_probe_replaced(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock(30)
+    assert breaker.allow_request()
+    # Пробный запрос не завершился (например, отменен): через reset_seconds пропускается следующий
+    clock(29)
+    assert not breaker.allow_request()
+    clock(1)
+    assert breaker.allow_request()
+
+
+@pytest.mark.parametrize("attempt, expected", [(1, 0.2), (2, 0.4), (3, 0.8), (10, 5.0)])
+def test_backoff_delay_upper_bound(monkeypatch, attempt, expected):
+    monkeypatch.setattr(resilience, "MOEX_RETRY_BASE_DELAY", 0.2)
+    monkeypatch.setattr(resilience, "MOEX_RETRY_MAX_DELAY", 5.0)
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: high)
+    assert backoff_delay(attempt) == pytest.approx(expected)
+
+
+def test_backoff_delay_jitter_and_retry_after(monkeypatch):
+    monkeypatch.setattr(resilience, "MOEX_RETRY_BASE_DELAY", 0.2)
+    monkeypatch.setattr(resilience, "MOEX_RETRY_MAX_DELAY", 5.0)
+    delays = [backoff_delay(3) for _ in range(200)]
+    assert all(0 <= delay <= 0.8 for delay in delays)
+    # Retry-After - нижняя граница задержки
+    assert backoff_delay(1, retry_after=2.5) >= 2.5
+
+
+def test_token_bucket_penalize_halves_rate_to_floor():
+    bucket = TokenBucket(rate=10, capacity=10)
+    bucket.min_rate = 1.0
+    bucket.penalize()
+    assert bucket.rate == 5
+    assert bucket.get_stats()['tokens'] < 1
+    for _ in range(10):
+        bucket.penalize()
+    assert bucket.rate == 1.0
+    assert bucket.stats['throttled'] == 11
+
+
+def test_token_bucket_reward_restores_rate(monkeypatch):
+    monkeypatch.setattr("engine.rate_limit.MOEX_RATE_RECOVERY_REQUESTS", 4)
+    bucket = TokenBucket(rate=10, capacity=10)
+    bucket.min_rate = 2.0
+    for _ in range(5):
+        bucket.penalize()
+    assert bucket.rate == 2.0
+
+    # Аддитивное восстановление: (10 - 2) / 4 за успешный ответ
+    bucket.reward()
+    assert bucket.rate == pytest.approx(4.0)
+    for _ in range(10):
+        bucket.reward()
+    assert bucket.rate == 10
+
+
+async def test_client_retries_and_penalizes_on_429(fake_iss, fast_retries):
+    server = await fake_iss(error_rate=1.0, error_status=429)
+    limiter = TokenBucket(rate=1000, capacity=1000)
+
+    async with MoexClient(base_url=server.base_url, rate_limiter=limiter) as client:
+        with pytest.raises(MoexUnavailableError):
+            await client.get_stock_data("SBER", date(2024, 1, 1), date(2024, 1, 31))
+
+    assert server.request_count == resilience.MOEX_RETRY_ATTEMPTS
+    assert limiter.stats['throttled'] == resilience.MOEX_RETRY_ATTEMPTS
+    assert limiter.rate == 1000 / 2 ** resilience.MOEX_RETRY_ATTEMPTS
+    assert client.stats['retries'] == resilience.MOEX_RETRY_ATTEMPTS - 1
+
+
+async def test_client_breaker_stops_requests(fake_iss, fast_retries):
+    server = await fake_iss(error_rate=1.0, error_status=503)
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+
+    async with MoexClient(base_url=server.base_url, breaker=breaker) as client:
+        for _ in range(2):
+            with pytest.raises(MoexUnavailableError):
+                await client.get_stock_data("SBER", date(2024, 1, 1), date(2024, 1, 31))
+        requests = server.request_count
+
+        with pytest.raises(CircuitOpenError):
+            await client.get_stock_data("SBER", date(2024, 1, 1), date(2024, 1, 31))
+
+    assert breaker.state == 'open'
+    assert server.request_count == requests
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, app_module.API_REQUEST_TIMEOUT),
+    (5.0, 5.0),
+    (0.5, 0.5),
+    (app_module.API_MAX_REQUEST_TIMEOUT, app_module.API_MAX_REQUEST_TIMEOUT),
+])
+def test_request_timeout_accepted(header, expected):
+    assert app_module.request_timeout(header) == expected
+
+
+@pytest.mark.parametrize("header", [0.0, -1.0, app_module.API_MAX_REQUEST_TIMEOUT + 1, math.inf, math.nan])
+def test_request_timeout_rejected(header):
+    with pytest.raises(HTTPException) as error:
+        app_module.request_timeout(header)
+    assert error.value.status_code == 400
@@ -0,0 +1,77 @@
+"""
+Ежедневный прогон фонового прогрева против локальной заглушки ISS
+
+Тестам с базой данных нужен PostgreSQL из DATABASE_URL; если он недоступен, они пропускаются.
+"""
+
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import delete, select
+
+from database.database import AsyncSessionLocal
+from engine.data_service import DataService
+from engine.moex_client import MoexClient
+from engine.scheduler import EOD_JOB, PrefetchScheduler
+from models.candle import Candle, CandleInterval
+from models.prefetch_state import PrefetchState
+from models.stock_coverage import StockCoverage
+
+TICKER = "EODTEST"
+
+
+async def clear() -> None:
+    async with AsyncSessionLocal() as db:
+        for model in (Candle, StockCoverage):
+            await db.execute(delete(model).where(model.ticker == TICKER))
+        await db.execute(delete(PrefetchState).where(PrefetchState.job == EOD_JOB))
+        await db.commit()
+
+
+@pytest.fixture
+async def database(postgres):
+    await clear()
+    yield
+    await clear()
+
+
+@pytest.mark.parametrize("now, expected", [
+    # Прогон в 01:00 загружает закрытый накануне день
+    (datetime(2024, 3, 16, 1, 0), date(2024, 3, 15)),
+    (datetime(2024, 3, 16, 23, 0), date(2024, 3, 15)),
+    # До прогона последним обработанным считается позавчерашний день
+    (datetime(2024, 3, 16, 0, 30), date(2024, 3, 14)),
+])
+def test_eod_run_date(now, expected):
+    scheduler = PrefetchScheduler(DataService(AsyncSessionLocal, moex_client=MoexClient()), AsyncSessionLocal)
+    assert scheduler.eod_run_date(now) == expected
+
+
+async def test_run_eod_replaces_snapshot(database, fake_iss, today):
+    server = await fake_iss()
+    run_date = date(2024, 3, 15)
+
+    async with MoexClient(base_url=server.base_url) as client:
+        service = DataService(AsyncSessionLocal, moex_client=client)
+        # Обновление в торговые часы записывает снимок дня без покрытия
+        today(run_date)
+        await service.refresh(TICKER, run_date, run_date)
+        async with AsyncSessionLocal() as db:
+            await db.execute(Candle.__table__.update().where(Candle.ticker == TICKER).values(close=1.0))
+            await db.commit()
+
+        scheduler = PrefetchScheduler(service, AsyncSessionLocal, tickers=[TICKER], intervals=[CandleInterval.DAY_1])
+        scheduler.history_days = 30
+        today(run_date + timedelta(days=1))
+        await scheduler.run_eod(run_date)
+
+    async with AsyncSessionLocal() as db:
+        close = await db.scalar(select(Candle.close).where(Candle.ticker == TICKER, Candle.ts == datetime(2024, 3, 15)))
+        result = await db.execute(
+            select(StockCoverage.start_date, StockCoverage.end_date).where(StockCoverage.ticker == TICKER)
+        )
+        coverage = [tuple(row) for row in result]
+
+    assert close != 1.0
+    assert coverage == [(run_date - timedelta(days=30), run_date)]
+    assert scheduler.jobs[EOD_JOB]['errors'] == 0
@@ -0,0 +1,127 @@
+"""
+Справочник бумаг против локальной заглушки ISS: запоминание неизвестных тикеров,
+периоды вне дат торгов и отметка обновления справочника
+
+Нужен PostgreSQL из DATABASE_URL; если он недоступен, тесты пропускаются.
+Тестовые тикеры удаляются после каждого теста.
+"""
+
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import delete, update
+
+from database.database import AsyncSessionLocal
+from engine.data_service import DataService
+from engine.moex_client import MoexClient
+from engine.securities import SecuritiesDirectory
+from models.candle import Candle
+from models.securities_refresh import SecuritiesRefresh
+from models.security import Security
+from models.stock_coverage import StockCoverage
+
+UNKNOWN = "SDUNKNOWN"
+LISTED = "SDLISTED"
+BOARD = "SDBOARD"
+LISTED_FROM = date(2024, 3, 1)
+LISTED_TILL = date(2024, 6, 28)
+
+
+async def clear() -> None:
+    async with AsyncSessionLocal() as db:
+        for model in (Candle, StockCoverage, Security):
+            await db.execute(delete(model).where(model.ticker.in_([UNKNOWN, LISTED])))
+        await db.execute(delete(SecuritiesRefresh).where(SecuritiesRefresh.board == BOARD))
+        await db.commit()
+
+
+@pytest.fixture
+async def database(postgres):
+    await clear()
+    yield
+    await clear()
+
+
+@pytest.fixture
+async def server(fake_iss):
+    return await fake_iss(unknown_securities=[UNKNOWN], listings={LISTED: (LISTED_FROM, LISTED_TILL)})
+
+
+async def test_unknown_ticker_remembered(database, server):
+    async with MoexClient(base_url=server.base_url) as client:
+        directory = SecuritiesDirectory(client, AsyncSessionLocal, boards=[])
+        assert await directory.find_unknown([UNKNOWN, LISTED]) == [UNKNOWN]
+        assert server.request_count == 2
+        assert directory.stats['lookups'] == 2
+
+        # Повторный запрос отклоняется без обращения к ISS
+        assert await directory.find_unknown([UNKNOWN]) == [UNKNOWN]
+        assert await directory.find_unknown([LISTED]) == []
+        assert server.request_count == 2
+        assert directory.stats['negative_hits'] == 1
+        assert directory.stats['rejected'] == 2
+
+        # Другой процесс приложения берет проверку из таблицы securities
+        other = SecuritiesDirectory(client, AsyncSessionLocal, boards=[])
+        assert await other.find_unknown([UNKNOWN]) == [UNKNOWN]
+        assert server.request_count == 2
+        assert other.stats['lookups'] == 0
+
+        # Когда срок запоминания истек, тикер проверяется по ISS снова
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(Security).where(Security.ticker == UNKNOWN)
+                .values(checked_at=Security.checked_at - other.negative_ttl)
+            )
+            await db.commit()
+        third = SecuritiesDirectory(client, AsyncSessionLocal, boards=[])
+        assert await third.find_unknown([UNKNOWN]) == [UNKNOWN]
+        assert server.request_count == 3
+        assert third.stats['lookups'] == 1
+
+
+@pytest.mark.parametrize("start_date, end_date, expected", [
+    (date(2024, 1, 1), date(2024, 12, 31),
+     [(date(2024, 1, 1), date(2024, 2, 29)), (date(2024, 6, 29), date(2024, 12, 31))]),
+    (date(2024, 1, 1), date(2024, 1, 31), [(date(2024, 1, 1), date(2024, 1, 31))]),
+    (date(2024, 3, 1), date(2024, 6, 28), []),
+    (date(2024, 5, 1), date(2024, 7, 31), [(date(2024, 6, 29), date(2024, 7, 31))]),
+])
+async def test_unlisted_ranges(database, server, start_date, end_date, expected):
+    async with MoexClient(base_url=server.base_url) as client:
+        directory = SecuritiesDirectory(client, AsyncSessionLocal, boards=[])
+        # До проверки тикера даты торгов неизвестны
+        assert directory.unlisted_ranges(LISTED, start_date, end_date) == []
+        await directory.find_unknown([LISTED])
+        assert directory.unlisted_ranges(LISTED, start_date, end_date) == expected
+
+
+async def test_candles_requested_within_listing(database, server):
+    async with MoexClient(base_url=server.base_url) as client:
+        directory = SecuritiesDirectory(client, AsyncSessionLocal, boards=[])
+        await directory.find_unknown([LISTED])
+        service = DataService(AsyncSessionLocal, moex_client=client, securities=directory)
+        series = await service.get_stock_series([LISTED], date(2024, 1, 1), date(2024, 12, 31))
+
+        assert server.candle_requests == [(LISTED, LISTED_FROM, LISTED_TILL, 24)]
+        assert series[LISTED].dates()[0] == LISTED_FROM
+        assert series[LISTED].dates()[-1] <= LISTED_TILL
+
+        # Весь год покрыт: повторный запрос не обращается к ISS
+        server.candle_requests.clear()
+        fresh = DataService(AsyncSessionLocal, moex_client=client, securities=directory)
+        await fresh.get_stock_series([LISTED], date(2024, 1, 1), date(2024, 12, 31))
+        assert server.candle_requests == []
+
+
+async def test_refresh_state_per_board(database, server):
+    async with MoexClient(base_url=server.base_url) as client:
+        directory = SecuritiesDirectory(client, AsyncSessionLocal, boards=[BOARD])
+        assert await directory._refresh_due()
+
+        await directory._save_refresh_state({BOARD: 2})
+        assert not await directory._refresh_due()
+        assert directory.refreshed_at is not None
+
+        directory.refresh_interval = timedelta(0)
+        assert await directory._refresh_due()
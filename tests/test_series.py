@@ -0,0 +1,121 @@
+"""Ряд свечей: слияние с повторами времени, порядок, пустые ряды и границы периода"""
+
+from datetime import date, datetime
+
+import pytest
+
+from engine.series import CandleSeries
+
+
+def d(day: int) -> date:
+    return date(2024, 1, day)
+
+
+def closes(*pairs) -> CandleSeries:
+    return CandleSeries.from_closes((d(day), price) for day, price in pairs)
+
+
+def as_pairs(series: CandleSeries):
+    return [(day.day, price) for day, price in zip(series.dates(), series.close)]
+
+
+def test_from_rows_unsorted_with_duplicates():
+    series = closes((5, 5.0), (1, 1.0), (3, 3.0), (1, 10.0))
+    # Ряд упорядочен, при повторе времени остается последняя строка
+    assert as_pairs(series) == [(1, 10.0), (3, 3.0), (5, 5.0)]
+
+
+def test_from_rows_keeps_missing_values():
+    series = CandleSeries.from_rows([(datetime(2024, 1, 2), None, 2.0, 1.0, 1.5, None, None)])
+    assert list(series) == [(datetime(2024, 1, 2), None, 2.0, 1.0, 1.5, None, None)]
+
+
+def test_merge_overlapping_prefers_other():
+    left = closes((1, 1.0), (2, 2.0), (4, 4.0), (6, 6.0))
+    right = closes((2, 20.0), (3, 30.0), (6, 60.0), (7, 70.0))
+    assert as_pairs(left.merge(right)) == [(1, 1.0), (2, 20.0), (3, 30.0), (4, 4.0), (6, 60.0), (7, 70.0)]
+    assert as_pairs(right.merge(left)) == [(1, 1.0), (2, 2.0), (3, 30.0), (4, 4.0), (6, 6.0), (7, 70.0)]
+
+
+def test_merge_identical_timestamps():
+    left = closes((1, 1.0), (2, 2.0))
+    right = closes((1, 10.0), (2, 20.0))
+    assert as_pairs(left.merge(right)) == [(1, 10.0), (2, 20.0)]
+
+
+@pytest.mark.parametrize("left, right", [
+    # Ряды не пересекаются: склеиваются в порядке времени независимо от порядка аргументов
+    (closes((1, 1.0), (2, 2.0)), closes((5, 5.0), (6, 6.0))),
+    (closes((5, 5.0), (6, 6.0)), closes((1, 1.0), (2, 2.0))),
+])
+def test_merge_disjoint(left, right):
+    assert as_pairs(left.merge(right)) == [(1, 1.0), (2, 2.0), (5, 5.0), (6, 6.0)]
+
+
+def test_merge_interleaved_keeps_all_columns():
+    left = CandleSeries.from_rows([(datetime(2024, 1, 1), 1, 2, 0.5, 1.5, 100, 150.0)])
+    right = CandleSeries.from_rows([
+        (datetime(2023, 12, 31), 3, 4, 2.5, 3.5, 300, 1050.0),
+        (datetime(2024, 1, 2), 5, 6, 4.5, 5.5, 500, 2750.0),
+    ])
+    merged = left.merge(right)
+    assert [row[1:] for row in merged] == [
+        (3.0, 4.0, 2.5, 3.5, 300.0, 1050.0),
+        (1.0, 2.0, 0.5, 1.5, 100.0, 150.0),
+        (5.0, 6.0, 4.5, 5.5, 500.0, 2750.0),
+    ]
+
+
+def test_merge_with_empty():
+    series = closes((1, 1.0), (2, 2.0))
+    empty = CandleSeries()
+    assert series.merge(empty) is series
+    assert empty.merge(series) is series
+    assert len(empty.merge(CandleSeries())) == 0
+
+
+def test_concat_later_series_wins():
+    result = CandleSeries.concat([
+        closes((3, 3.0), (4, 4.0)),
+        CandleSeries(),
+        closes((1, 1.0), (4, 40.0)),
+        closes((4, 400.0), (2, 2.0)),
+    ])
+    assert as_pairs(result) == [(1, 1.0), (2, 2.0), (3, 3.0), (4, 400.0)]
+
+
+def test_concat_empty():
+    assert len(CandleSeries.concat([])) == 0
+    assert len(CandleSeries.concat([CandleSeries(), CandleSeries()])) == 0
+
+
+@pytest.mark.parametrize("start_date, end_date, expected", [
+    # Границы включительно
+    (d(2), d(4), [2, 3, 4]),
+    (d(1), d(5), [1, 2, 3, 4, 5]),
+    # Границы между свечами
+    (date(2023, 12, 1), d(1), [1]),
+    (d(5), d(31), [5]),
+    # Период без свечей
+    (d(10), d(20), []),
+    (date(2023, 12, 1), date(2023, 12, 31), []),
+])
+def test_slice_boundaries(start_date, end_date, expected):
+    series = closes((1, 1.0), (2, 2.0), (3, 3.0), (4, 4.0), (5, 5.0))
+    assert [day.day for day in series.slice(start_date, end_date).dates()] == expected
+
+
+def test_slice_intraday_includes_whole_end_day():
+    series = CandleSeries.from_rows([
+        (datetime(2024, 1, 1, 23, 50), None, None, None, 1.0, None, None),
+        (datetime(2024, 1, 2, 10, 0), None, None, None, 2.0, None, None),
+        (datetime(2024, 1, 2, 23, 59, 59), None, None, None, 3.0, None, None),
+        (datetime(2024, 1, 3, 0, 0), None, None, None, 4.0, None, None),
+    ])
+    assert list(series.slice(d(2), d(2)).close) == [2.0, 3.0]
+
+
+def test_slice_full_range_returns_same_series():
+    series = closes((1, 1.0), (2, 2.0))
+    assert series.slice(d(1), d(2)) is series
+    assert len(CandleSeries().slice(d(1), d(2))) == 0